@@ -9,13 +9,14 @@ import os
 from flask import Flask
 from flask_wtf import CSRFProtect
 from .extensions import db, migrate, login_manager
-from config import Config
+from config import get_config
 
-def create_app(config_class=Config):
+def create_app(config_class=None):
     """Create and configure the Flask application.
 
         Args:
-           config_class: Class to use for configuration (default: Config)
+           config_class: Class to use for configuration (default: the
+               profile named by $APP_CONFIG, see config.get_config)
 
         Returns:
            Flask: Configured Flask application instance
@@ -23,7 +24,7 @@ def create_app(config_class=Config):
     app = Flask(__name__, instance_relative_config=True)
 
     # Load configuration from config.py
-    app.config.from_object(config_class)
+    app.config.from_object(config_class or get_config())
 
     # Load configuration from instance/config.py if it exists
     # Use silent=True to not raise an error if the file doesn't exist
@@ -37,17 +38,19 @@ def create_app(config_class=Config):
 
     # Initialize Flask extensions
     db.init_app(app)
+    from . import engine, instrumentation
+
+    engine.init_app(app)
+    instrumentation.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf = CSRFProtect(app)
 
-    # Create database tables if they don't exist (since not using Migrate)
-    with app.app_context():
-        # Import models here to ensure they are known to SQLAlchemy
-        from . import models
-
-        db.create_all()
-        print(f"Database checked/created at {app.config['SQLALCHEMY_DATABASE_URI']}")
+    # The schema is created and upgraded by the migrations (`flask db upgrade`);
+    # importing the models here makes them known to SQLAlchemy and Alembic
+    from . import models
+    # Registers the full-text index DDL that db.create_all() runs in tests
+    from .data_handling import search
 
     # Register Blueprints
     from .main import bp as main_bp
@@ -62,4 +65,14 @@ def create_app(config_class=Config):
 
     app.register_blueprint(data_handling_bp, url_prefix="/data")
 
+    # Configure the emotion model; it is loaded lazily or warmed up in the background,
+    # and entries are analyzed by queue workers rather than on the request thread
+    from .data_handling import analysis, backfill, jobs, rollup
+
+    analysis.init_app(app)
+    jobs.init_app(app)
+    backfill.init_app(app)
+    search.init_app(app)
+    rollup.init_app(app)
+
     return app
@@ -57,8 +57,38 @@ def register():
     return render_template("auth/register.html", title="Register", form=form)
 
 
-@bp.route("/list_users", methods=["GET"])
+@bp.route("/users/search", methods=["GET"])
 @login_required
-def list_users():
-    users = User.query.all()
-    return jsonify([{"id": user.id, "username": user.username} for user in users])
+def search_users():
+    """
+    Page through users whose username starts with a prefix.
+
+    Query parameters:
+        q: Username prefix; empty matches everyone
+        limit: Page size (default 20, at most 50)
+        cursor: ``next_cursor`` of the previous page
+
+    Response format:
+        {
+            "users": [{"id": 2, "username": "alice"}],
+            "next_cursor": "alice"
+        }
+
+    The current user is left out. Responses carry an ETag so repeated
+    lookups are answered with 304 Not Modified.
+    """
+    users, next_cursor = User.search_by_prefix(
+        request.args.get("q", "").strip(),
+        after=request.args.get("cursor") or None,
+        limit=request.args.get("limit", type=int),
+        exclude_id=current_user.id,
+    )
+    response = jsonify(
+        {
+            "users": [{"id": user.id, "username": user.username} for user in users],
+            "next_cursor": next_cursor,
+        }
+    )
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
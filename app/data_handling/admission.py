@@ -0,0 +1,218 @@
+"""
+Admission control in front of the emotion model.
+
+Every forward pass runs torch's intra-op thread pool, so letting any number
+of forward passes at once oversubscribes the CPU and slows all of them
+down together. ``InferenceGate`` admits at most ``max_concurrent`` forward
+passes; up to ``max_waiting`` more wait their turn, and anything beyond that
+is turned away immediately with ``Overloaded``. The gate is held around each
+batch (see ``analysis.classify_batch``), so it does not limit how many
+callers the micro-batcher can coalesce.
+
+Routes check capacity before saving an entry. Depending on
+``ANALYSIS_OVERLOAD_POLICY`` an overloaded app either answers 503 with a
+Retry-After header, or saves the entry and leaves its analysis job pending
+for the workers to pick up later.
+"""
+
+import threading
+import time
+
+from flask import current_app, jsonify, render_template, request
+from sqlalchemy import func, select
+
+from app import db
+from app.models import AnalysisJob
+
+REJECT = "reject"
+DEFER = "defer"
+POLICIES = (REJECT, DEFER)
+
+
+class Overloaded(Exception):
+    """Raised when the model cannot take more work right now.
+
+    Attributes:
+        retry_after (int): Suggested seconds before retrying
+    """
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceGate:
+    """Bounded concurrency with a bounded wait queue.
+
+    Args:
+        max_concurrent (int): Callers allowed in the model at once
+        max_waiting (int): Callers allowed to wait for a slot
+        wait_timeout (float): Seconds a waiting caller waits before giving up
+        retry_after (int): Retry-After hint carried by ``Overloaded``
+    """
+
+    def __init__(self, max_concurrent=1, max_waiting=8, wait_timeout=30.0, retry_after=5):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_waiting = max(0, int(max_waiting))
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_waiting_seen = 0
+
+    @property
+    def saturated(self):
+        """True if a new caller would be rejected."""
+        return (
+            self.in_flight >= self.max_concurrent and self.waiting >= self.max_waiting
+        )
+
+    def acquire(self):
+        """Take a slot, waiting if the queue has room.
+
+        Raises:
+            Overloaded: If the wait queue is full or the wait timed out
+        """
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise Overloaded("Emotion model is at capacity", self.retry_after)
+                self.waiting += 1
+                self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+                deadline = time.monotonic() + self.wait_timeout
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(
+                                "Timed out waiting for the emotion model", self.retry_after
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+    def stats(self):
+        """Return queue depth and rejection counts as a JSON-serialisable dict."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting_seen": self.max_waiting_seen,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+def pending_jobs():
+    """Number of analysis jobs waiting for a worker."""
+    return db.session.scalar(
+        select(func.count(AnalysisJob.id)).where(
+            AnalysisJob.status == AnalysisJob.PENDING
+        )
+    )
+
+
+def check_capacity():
+    """Decide whether a new entry's analysis can be accepted.
+
+    Call before saving. Over capacity means the model gate is saturated (when
+    jobs run on the request thread) or more than ``ANALYSIS_QUEUE_MAX_PENDING``
+    jobs are already waiting.
+
+    Returns:
+        bool: True if analysis can run now; False if it should be deferred
+
+    Raises:
+        Overloaded: If over capacity and the policy is ``reject``
+    """
+    from . import analysis
+
+    config = current_app.config
+    retry_after = config.get("ANALYSIS_RETRY_AFTER", 5)
+    reason = None
+    gate = analysis.gate
+    if config.get("ANALYSIS_QUEUE_EAGER", False) and gate is not None and gate.saturated:
+        reason = "Emotion model is at capacity"
+    max_pending = config.get("ANALYSIS_QUEUE_MAX_PENDING", 0)
+    if reason is None and max_pending and pending_jobs() >= max_pending:
+        reason = "Too many entries are waiting for analysis"
+    if reason is None:
+        return True
+
+    stats = current_app.extensions.setdefault("admission", {"deferred": 0, "rejected": 0})
+    if config.get("ANALYSIS_OVERLOAD_POLICY", DEFER) == REJECT:
+        stats["rejected"] += 1
+        raise Overloaded(reason, retry_after)
+    stats["deferred"] += 1
+    return False
+
+
+def stats():
+    """Route-level admission counters plus the model gate's statistics."""
+    from . import analysis
+
+    data = dict(current_app.extensions.get("admission", {"deferred": 0, "rejected": 0}))
+    data["policy"] = current_app.config.get("ANALYSIS_OVERLOAD_POLICY", DEFER)
+    data["gate"] = analysis.gate.stats() if analysis.gate is not None else None
+    return data
+
+
+def handle_overloaded(error):
+    """Answer 503 with a Retry-After header."""
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    else:
+        response = current_app.make_response(
+            render_template(
+                "errrors/503.html", message=str(error), retry_after=error.retry_after
+            )
+        )
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def init_app(app):
+    """Register the 503 handler.
+
+    Defaults are the values in ``config.Config``. A config that leaves a
+    setting out, such as the tests' config, gets its off or neutral value.
+
+    Config:
+        ANALYSIS_OVERLOAD_POLICY: ``"reject"`` answers 503 when over capacity;
+            ``"defer"`` saves the entry and analyzes it later (default: defer)
+        ANALYSIS_QUEUE_MAX_PENDING: Pending jobs allowed before new entries
+            count as over capacity; 0 means unbounded (default: 500)
+        ANALYSIS_RETRY_AFTER: Retry-After seconds sent with 503s (default: 5)
+
+    See ``analysis.init_app`` for the model gate settings.
+    """
+    if app.config.get("ANALYSIS_OVERLOAD_POLICY", DEFER) not in POLICIES:
+        raise ValueError(
+            f"Unknown ANALYSIS_OVERLOAD_POLICY; expected one of {POLICIES}"
+        )
+    app.extensions["admission"] = {"deferred": 0, "rejected": 0}
+    app.register_error_handler(Overloaded, handle_overloaded)
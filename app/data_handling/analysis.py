@@ -0,0 +1,694 @@
+"""
+Emotion analysis provider.
+
+Loading the transformer pipeline pulls in torch and the model weights, which
+takes tens of seconds. Instead of building the pipeline at import time, this
+module exposes a lazily loaded classifier that can optionally be warmed up in
+a background thread when the application starts, so routes that never touch
+the model (login, home, mood timeline) are served immediately.
+
+All analysis goes through ``analyze``/``analyze_many``, which consult the
+result cache (see ``cache``), split long entries into overlapping windows
+(see ``chunking``) and optionally coalesce concurrent callers into
+micro-batches (see ``batching``). Each forward pass can further be split
+into buckets of similar token length so short entries are not padded to the
+length of the longest one in their batch. Cache misses pass through an
+``InferenceGate`` (see ``admission``) that bounds how many callers run the
+model at once.
+"""
+
+import csv
+import logging
+import threading
+import time
+
+import click
+from flask import current_app, has_app_context
+
+from . import admission, analyzers, backends, cache, chunking
+from .batching import BatchDispatcher, LengthBucketer
+from .sidecar import SidecarClient, SidecarUnavailable, inference_server_command
+
+MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+logger = logging.getLogger(__name__)
+
+
+class EmotionClassifier:
+    """Lazily constructed wrapper around the Hugging Face pipeline.
+
+    The instance is callable with the same arguments as the underlying
+    pipeline, and loads the model on first use if it has not been warmed up.
+
+    Attributes:
+        state (str): One of ``"cold"``, ``"loading"``, ``"ready"`` or ``"failed"``
+        load_seconds (float): Time spent loading the model, once loaded
+        error (str): Last load error message, if loading failed
+    """
+
+    COLD = "cold"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, model_name=MODEL_NAME, backend=backends.TORCH, model_path=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_path = model_path
+        self.state = self.COLD
+        self.load_seconds = None
+        self.error = None
+        self.sidecar = None
+        self.num_threads = None
+        self._pipeline = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+
+    def configure(self, model_name, backend=backends.TORCH, model_path=None):
+        """Change the model to load. Has no effect once the model is loaded."""
+        if backend not in backends.BACKENDS:
+            raise ValueError(
+                f"Unknown EMOTION_BACKEND {backend!r}; expected one of {backends.BACKENDS}"
+            )
+        with self._lock:
+            if self._pipeline is None:
+                self.model_name = model_name
+                self.backend = backend
+                self.model_path = model_path
+
+    def use_sidecar(self, client):
+        """Send classification requests to an inference sidecar instead of a
+        local model, or back to the local model if ``client`` is None."""
+        self.sidecar = client
+
+    @property
+    def is_ready(self):
+        return self.state == self.READY
+
+    def load(self):
+        """Build the pipeline if needed and return it.
+
+        Concurrent callers block on the same lock, so the model is only
+        loaded once per process.
+        """
+        if self._pipeline is not None:
+            return self._pipeline
+
+        with self._lock:
+            if self._pipeline is not None:
+                return self._pipeline
+
+            self.state = self.LOADING
+            started = time.perf_counter()
+            try:
+                if self.num_threads:
+                    backends.set_thread_budget(self.num_threads)
+                # Imports torch lazily, so importing the app never pays for it
+                self._pipeline = backends.load_pipeline(
+                    self.backend, self.model_name, self.model_path
+                )
+            except Exception as e:
+                self.state = self.FAILED
+                self.error = str(e)
+                logger.exception("Failed to load emotion model %s", self.model_name)
+                raise
+
+            self.load_seconds = time.perf_counter() - started
+            self.error = None
+            self.state = self.READY
+            logger.info(
+                "Loaded emotion model %s (%s) in %.1fs",
+                self.model_name,
+                self.backend,
+                self.load_seconds,
+            )
+            return self._pipeline
+
+    def warm_up(self):
+        """Start loading the model in a daemon thread and return immediately."""
+        if self._pipeline is not None or self._warmup_thread is not None:
+            return self._warmup_thread
+
+        def _run():
+            try:
+                self.load()
+            except Exception:
+                # Already logged in load(); the next call will retry.
+                pass
+
+        self._warmup_thread = threading.Thread(
+            target=_run, name="emotion-model-warmup", daemon=True
+        )
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+    def status(self):
+        """Return the readiness state as a JSON-serialisable dict."""
+        if self.sidecar is not None:
+            try:
+                remote = self.sidecar.status()
+            except SidecarUnavailable as e:
+                remote = {"state": "unavailable", "ready": False, "error": str(e)}
+            return {**remote, "sidecar": self.sidecar.socket_path}
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "state": self.state,
+            "ready": self.is_ready,
+            "load_seconds": (
+                round(self.load_seconds, 3) if self.load_seconds is not None else None
+            ),
+            "error": self.error,
+        }
+
+    @property
+    def tokenizer(self):
+        """The pipeline's tokenizer, loading the model if necessary.
+
+        With a sidecar only the (small) tokenizer is loaded locally.
+        """
+        if self.sidecar is None:
+            return self.load().tokenizer
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(
+                self.model_path or self.model_name
+            )
+        return self._tokenizer
+
+    def __call__(self, inputs, **kwargs):
+        if self.sidecar is not None:
+            # The sidecar applies its own batching and truncation
+            if isinstance(inputs, str):
+                return [self.sidecar.classify([inputs])[0]]
+            return self.sidecar.classify(inputs)
+        return self.load()(inputs, **kwargs)
+
+
+# Shared per-process classifier instance
+emotion_classifier = EmotionClassifier()
+
+# Micro-batching dispatcher, rebuilt by init_app; None when batching is off
+dispatcher = None
+
+# Length bucketing for forward passes, rebuilt by init_app; None when off
+bucketer = None
+
+# Admission control for model calls, rebuilt by init_app; None when off
+gate = None
+
+# Recorded on each analyzed entry, set up by init_app
+model_version = MODEL_NAME
+
+
+def current_model_version():
+    """Identifier of the primary analyzer, stored with every analysis result."""
+    return analyzer.version
+
+
+def _forward(texts):
+    return emotion_classifier(texts, batch_size=len(texts), truncation=True)
+
+
+def token_lengths(texts):
+    """Token count of each text as the model will see it (after truncation).
+
+    Falls back to word counts when the real tokenizer is not available.
+    """
+    if isinstance(emotion_classifier, EmotionClassifier):
+        encoded = emotion_classifier.tokenizer(
+            list(texts), truncation=True, add_special_tokens=True
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+    return [len(text.split()) + 2 for text in texts]
+
+
+def classify_batch(texts):
+    """Run batched forward passes over ``texts``.
+
+    With length bucketing enabled, texts are tokenized up front and run as
+    one forward pass per length bucket; otherwise as a single forward pass.
+    The admission gate is held for the whole batch, so it limits concurrent
+    forward passes rather than callers: with micro-batching, any number of
+    callers can share one admitted batch.
+
+    Returns:
+        list: One ``[{'label': ..., 'score': ...}, ...]`` list per text, in
+        input order
+
+    Raises:
+        admission.Overloaded: If the gate turns the batch away; with
+            micro-batching every caller in the batch gets it
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    if gate is None:
+        return _classify_batch(texts)
+    with gate:
+        return _classify_batch(texts)
+
+
+def _classify_batch(texts):
+    # A sidecar buckets on its own side of the socket
+    uses_sidecar = (
+        isinstance(emotion_classifier, EmotionClassifier)
+        and emotion_classifier.sidecar is not None
+    )
+    if bucketer is None or len(texts) == 1 or uses_sidecar:
+        return _forward(texts)
+    return bucketer.run(texts, token_lengths(texts), _forward)
+
+
+def _chunk_settings():
+    config = current_app.config if has_app_context() else {}
+    return (
+        config.get("ANALYSIS_CHUNK_MAX_TOKENS", chunking.DEFAULT_MAX_TOKENS),
+        config.get("ANALYSIS_CHUNK_STRIDE", chunking.DEFAULT_STRIDE),
+        config.get("ANALYSIS_CHUNK_AGGREGATE", "mean"),
+    )
+
+
+def _classify_long(texts, timeout=None):
+    """Classify texts of any length.
+
+    Texts longer than the model's window are split into overlapping windows;
+    the windows of every text go to the model together and their scores are
+    aggregated back into one list per text.
+    """
+    max_tokens, stride, method = _chunk_settings()
+    # The real tokenizer is only available from the real provider
+    tokenizer = (
+        emotion_classifier.tokenizer
+        if isinstance(emotion_classifier, EmotionClassifier)
+        else None
+    )
+    windows = [
+        chunking.split_windows(text, tokenizer, max_tokens=max_tokens, stride=stride)
+        for text in texts
+    ]
+    flat = [window_text for text_windows in windows for window_text, _ in text_windows]
+
+    if dispatcher is None:
+        flat_scores = classify_batch(flat)
+    else:
+        futures = dispatcher.submit_many(flat)
+        flat_scores = [future.result(timeout) for future in futures]
+
+    results = []
+    position = 0
+    for text_windows in windows:
+        window_scores = flat_scores[position:position + len(text_windows)]
+        position += len(text_windows)
+        results.append(
+            chunking.aggregate(
+                window_scores, [count for _, count in text_windows], method=method
+            )
+        )
+    return results
+
+
+class TransformerAnalyzer:
+    """The emotion model, behind chunking, batching and the admission gate."""
+
+    name = analyzers.TRANSFORMER
+
+    @property
+    def version(self):
+        return model_version
+
+    def classify(self, texts, timeout=None):
+        return _classify_long(texts, timeout)
+
+
+class SmallModelAnalyzer:
+    """A smaller local classifier, used as the first stage of a cascade.
+
+    The model must predict the same seven labels as the main model.
+    """
+
+    name = "small-model"
+
+    def __init__(self, model_name, backend=backends.TORCH, model_path=None):
+        self.classifier = EmotionClassifier(model_name, backend, model_path)
+
+    @property
+    def version(self):
+        return self.classifier.model_name
+
+    def classify(self, texts, timeout=None):
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.classifier(texts, batch_size=len(texts), truncation=True)
+
+
+transformer = TransformerAnalyzer()
+
+# Primary analyzer, degraded-mode fallback and the breaker choosing between
+# them; set up by init_app
+analyzer = transformer
+fallback = None
+breaker = None
+
+
+def _classify(texts, timeout=None):
+    """Score texts with the primary analyzer, or the fallback if the primary
+    is unavailable, failing, or too slow.
+
+    A full admission gate is not a failure of the model: ``Overloaded``
+    propagates so the caller can retry later, and the breaker is not told.
+
+    Returns:
+        tuple: ``(scores, analyzer_used)``
+    """
+    if fallback is None:
+        return analyzer.classify(texts, timeout), analyzer
+
+    loading = (
+        analyzer is transformer
+        and isinstance(emotion_classifier, EmotionClassifier)
+        and emotion_classifier.sidecar is None
+        and emotion_classifier.state == EmotionClassifier.LOADING
+    )
+    if loading or not breaker.allow():
+        breaker.note_fallback(len(texts))
+        return fallback.classify(texts), fallback
+
+    started = time.perf_counter()
+    try:
+        scores = analyzer.classify(texts, timeout)
+    except admission.Overloaded:
+        breaker.cancel()
+        raise
+    except Exception:
+        breaker.record(time.perf_counter() - started, ok=False)
+        breaker.note_fallback(len(texts))
+        logger.warning("Emotion analyzer failed, using %s fallback", fallback.name,
+                       exc_info=True)
+        return fallback.classify(texts), fallback
+    # Judge latency per text, so large backfill batches do not trip the breaker
+    breaker.record((time.perf_counter() - started) / len(texts))
+    return scores, analyzer
+
+
+def _uses_transformer(candidate):
+    """True if ``candidate`` is the transformer or a cascade ending in it."""
+    return candidate is transformer or (
+        isinstance(candidate, analyzers.CascadeAnalyzer) and candidate.second is transformer
+    )
+
+
+def _from_transformer(used, scores):
+    """True if ``scores``, returned by ``used``, were computed by the transformer."""
+    if used is transformer:
+        return True
+    return _uses_transformer(used) and analyzers.stage_of(scores) == transformer.name
+
+
+def analyze_many(texts, timeout=None):
+    """Analyze several texts, consulting the result cache first and
+    coalescing cache misses with concurrent callers if micro-batching is
+    enabled.
+
+    Returns:
+        list: One ``ScoredResult`` (a ``[[{...}, ...]]`` list that records the
+        analyzer that produced it) per text, in input order
+
+    Raises:
+        admission.Overloaded: If the model is at capacity, whether or not a
+            fallback is configured
+    """
+    texts = list(texts)
+    # The cache only holds results of the transformer, whether it is the
+    # primary analyzer or the last stage of a cascade
+    result_cache = (
+        cache.get_cache() if has_app_context() and _uses_transformer(analyzer) else None
+    )
+
+    scores = [None] * len(texts)
+    if result_cache is not None:
+        scores = [result_cache.get(text) for text in texts]
+    producers = [analyzer] * len(texts)
+    # A cascade reports cache hits as results of its transformer stage
+    hit_stage = None if analyzer is transformer else transformer.name
+    stages = [None if s is None else hit_stage for s in scores]
+
+    # Only send each distinct uncached text to the model once
+    pending = list(dict.fromkeys(t for t, s in zip(texts, scores) if s is None))
+    if pending:
+        pending_scores, used = _classify(pending, timeout)
+        computed = dict(zip(pending, pending_scores))
+        if result_cache is not None:
+            for text, text_scores in computed.items():
+                if _from_transformer(used, text_scores):
+                    result_cache.put(text, text_scores)
+        for i, (text, text_scores) in enumerate(zip(texts, scores)):
+            if text_scores is None:
+                scores[i] = computed[text]
+                producers[i] = used
+                stages[i] = analyzers.stage_of(computed[text])
+
+    results = []
+    for text_scores, producer, stage in zip(scores, producers, stages):
+        source = producer.name
+        if stage is not None:
+            # e.g. "cascade:lexicon" for a result accepted at the first stage
+            source = f"{source}:{stage}"
+        results.append(
+            analyzers.ScoredResult(list(text_scores), source, producer.version)
+        )
+    return results
+
+
+def provenance(result):
+    """Return ``(model_version, source)`` of a result from ``analyze_many``.
+
+    Plain lists (e.g. from tests) are attributed to the primary analyzer.
+    """
+    return (
+        getattr(result, "model_version", current_model_version()),
+        getattr(result, "source", analyzer.name),
+    )
+
+
+def analyze(text, timeout=None):
+    """Run emotion analysis on a single text.
+
+    Returns:
+        list: Result in the ``[[{'label': ..., 'score': ...}, ...]]`` shape
+        accepted by ``DiaryEntry.update_emotion_analysis``
+    """
+    return analyze_many([text], timeout=timeout)[0]
+
+
+def status():
+    """Combined readiness, batching and cache statistics for the status endpoint."""
+    data = emotion_classifier.status()
+    data["analyzer"] = analyzer.name
+    data["fallback"] = breaker.stats() if breaker is not None else None
+    data["cascade"] = (
+        analyzer.stats() if isinstance(analyzer, analyzers.CascadeAnalyzer) else None
+    )
+    data["batching"] = dispatcher.stats() if dispatcher is not None else None
+    data["bucketing"] = bucketer.stats() if bucketer is not None else None
+    result_cache = cache.get_cache() if has_app_context() else None
+    data["cache"] = result_cache.stats() if result_cache is not None else None
+    data["admission"] = (
+        admission.stats()
+        if has_app_context()
+        else (gate.stats() if gate is not None else None)
+    )
+    return data
+
+
+def _first_stage(name, available):
+    if name in available:
+        return available[name]
+    return SmallModelAnalyzer(name)
+
+
+def load_labeled_sample(path):
+    """Read ``label,text`` rows from a CSV file with a header line."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [row["text"] for row in rows], [row["label"] for row in rows]
+
+
+@click.command("cascade-report")
+@click.argument("sample", type=click.Path(exists=True, dir_okay=False))
+@click.option("--first-stage", default=analyzers.LEXICON, show_default=True,
+              help="'lexicon' or the id of a smaller model.")
+@click.option("--thresholds", default="0.4,0.5,0.6,0.7,0.8", show_default=True,
+              help="Comma-separated confidence thresholds to evaluate.")
+def cascade_report_command(sample, first_stage, thresholds):
+    """Report escalation rate and accuracy gap of the cascade on SAMPLE."""
+    texts, labels = load_labeled_sample(sample)
+    first = _first_stage(first_stage, {analyzers.LEXICON: analyzers.LexiconAnalyzer()})
+    report = analyzers.evaluate_cascade(
+        first, transformer, texts, labels,
+        [float(t) for t in thresholds.split(",") if t],
+    )
+    click.echo(
+        f"{report['samples']} samples: {report['first_stage']['name']} accuracy "
+        f"{report['first_stage']['accuracy']:.1%}, {report['second_stage']['name']} "
+        f"accuracy {report['second_stage']['accuracy']:.1%}"
+    )
+    click.echo(f"{'threshold':>10} {'escalated':>10} {'accuracy':>10} {'gap':>8}")
+    for row in report["thresholds"]:
+        click.echo(
+            f"{row['threshold']:>10.2f} {row['escalation_rate']:>10.1%} "
+            f"{row['accuracy']:>10.1%} {row['accuracy_gap']:>+8.1%}"
+        )
+
+
+def init_app(app):
+    """Configure the classifier from app config and optionally warm it up.
+
+    Defaults are the values in ``config.Config``. A config that leaves a
+    setting out, such as the tests' config, gets its off or neutral value.
+
+    Config:
+        EMOTION_MODEL_NAME: Model id or local path (default: MODEL_NAME)
+        EMOTION_BACKEND: ``torch``, ``torch-int8`` or ``onnx`` (default: torch)
+        EMOTION_MODEL_PATH: Local directory to load the model from; required
+            for the onnx backend (default: None)
+        EMOTION_MODEL_VERSION: Appended to the model identifier stored with
+            each result; change it when weights change under the same name
+        EMOTION_SIDECAR_SOCKET: Unix socket of a ``flask inference-server``
+            to use instead of loading the model in this process (default: None)
+        EMOTION_SIDECAR_TIMEOUT: Seconds to wait for the sidecar (default: 30)
+        EMOTION_MODEL_WARMUP: Load the model in a background thread at
+            startup instead of on the first analysis request (default: False)
+        ANALYSIS_BATCH_MAX_SIZE: Largest micro-batch; 1 disables batching
+            (default: 16)
+        ANALYSIS_BATCH_MAX_WAIT_MS: How long a request may wait for others
+            to join its batch (default: 10)
+        EMOTION_ANALYZER: ``"transformer"`` or ``"lexicon"`` (default: transformer)
+        EMOTION_FALLBACK: Score with the lexicon when the transformer is
+            loading, failing, at capacity or slow (default: True)
+        EMOTION_FALLBACK_LATENCY_MS: Per-text latency counted as slow
+            (default: 2000)
+        EMOTION_FALLBACK_TRIP_AFTER: Consecutive slow or failed calls that
+            open the circuit breaker (default: 3)
+        EMOTION_FALLBACK_RESET_SECONDS: How long the breaker stays open
+            before the transformer is tried again (default: 30)
+        EMOTION_CASCADE: Score with a cheap first stage and only escalate
+            uncertain texts to the transformer (default: False)
+        EMOTION_CASCADE_FIRST_STAGE: ``"lexicon"`` or the id of a smaller
+            model with the same labels (default: lexicon)
+        EMOTION_CASCADE_THRESHOLD: Top score the first stage must reach for
+            its result to be kept (default: 0.6)
+        ANALYSIS_MAX_CONCURRENT: Forward passes (batches) allowed to run at
+            once; 0 disables admission control (default: 2)
+        ANALYSIS_MAX_WAITING: Batches allowed to wait for a slot before
+            further ones are rejected (default: 8)
+        ANALYSIS_WAIT_TIMEOUT: Seconds a batch waits for a slot (default: 30)
+        ANALYSIS_TORCH_THREADS: Intra-op threads torch may use; None keeps
+            torch's default of one per core (default: None)
+        ANALYSIS_LENGTH_BUCKETING: Split each forward pass into buckets of
+            similar token length (default: True)
+        ANALYSIS_BUCKET_MAX_SIZE: Most texts per bucket (default: 16)
+        ANALYSIS_BUCKET_MAX_RATIO: Longest/shortest token length allowed
+            within a bucket (default: 1.5)
+
+        ANALYSIS_CHUNK_MAX_TOKENS: Tokens per window for long entries (default: 510)
+        ANALYSIS_CHUNK_STRIDE: Tokens shared by consecutive windows (default: 64)
+        ANALYSIS_CHUNK_AGGREGATE: ``"mean"`` (length-weighted) or ``"max"``
+            (default: "mean")
+
+    See ``cache.init_app`` for the result cache settings.
+    """
+    global analyzer, breaker, bucketer, dispatcher, fallback, gate, model_version
+
+    emotion_classifier.configure(
+        app.config.get("EMOTION_MODEL_NAME", MODEL_NAME),
+        backend=app.config.get("EMOTION_BACKEND", backends.TORCH),
+        model_path=app.config.get("EMOTION_MODEL_PATH"),
+    )
+    emotion_classifier.num_threads = app.config.get("ANALYSIS_TORCH_THREADS")
+
+    choice = app.config.get("EMOTION_ANALYZER", analyzers.TRANSFORMER)
+    available = {
+        analyzers.TRANSFORMER: transformer,
+        analyzers.LEXICON: analyzers.LexiconAnalyzer(),
+    }
+    if choice not in available:
+        raise ValueError(
+            f"Unknown EMOTION_ANALYZER {choice!r}; expected one of {tuple(available)}"
+        )
+    analyzer = available[choice]
+    if app.config.get("EMOTION_CASCADE", False) and analyzer is transformer:
+        analyzer = analyzers.CascadeAnalyzer(
+            _first_stage(app.config.get("EMOTION_CASCADE_FIRST_STAGE", analyzers.LEXICON),
+                         available),
+            transformer,
+            threshold=app.config.get("EMOTION_CASCADE_THRESHOLD", 0.6),
+        )
+    fallback = breaker = None
+    if app.config.get("EMOTION_FALLBACK", False) and analyzer.name != analyzers.LEXICON:
+        fallback = available[analyzers.LEXICON]
+        breaker = analyzers.CircuitBreaker(
+            latency_threshold=app.config.get("EMOTION_FALLBACK_LATENCY_MS", 2000) / 1000.0,
+            trip_after=app.config.get("EMOTION_FALLBACK_TRIP_AFTER", 3),
+            reset_after=app.config.get("EMOTION_FALLBACK_RESET_SECONDS", 30.0),
+        )
+
+    model_version = emotion_classifier.model_name
+    if app.config.get("EMOTION_MODEL_VERSION"):
+        model_version += "@" + app.config["EMOTION_MODEL_VERSION"]
+    if emotion_classifier.backend != backends.TORCH:
+        # Optimized backends give slightly different scores
+        model_version += "+" + emotion_classifier.backend
+        if (emotion_classifier.backend == backends.ONNX and emotion_classifier.model_path
+                and backends.onnx_file_name(emotion_classifier.model_path)
+                == backends.ONNX_QUANTIZED_FILE):
+            model_version += "-int8"
+    cache.init_app(app, model_version)
+    backends.model_cli.add_command(cascade_report_command)
+    app.cli.add_command(backends.model_cli)
+    app.cli.add_command(inference_server_command)
+
+    socket_path = app.config.get("EMOTION_SIDECAR_SOCKET")
+    if socket_path:
+        emotion_classifier.use_sidecar(
+            SidecarClient(
+                socket_path, timeout=app.config.get("EMOTION_SIDECAR_TIMEOUT", 30.0)
+            )
+        )
+    elif app.config.get("EMOTION_MODEL_WARMUP", False):
+        emotion_classifier.warm_up()
+
+    # Like the analyzer, these follow the configuration of the latest app
+    # rather than keeping the first one's limits
+    gate = None
+    max_concurrent = app.config.get("ANALYSIS_MAX_CONCURRENT", 0)
+    if max_concurrent:
+        gate = admission.InferenceGate(
+            max_concurrent=max_concurrent,
+            max_waiting=app.config.get("ANALYSIS_MAX_WAITING", 8),
+            wait_timeout=app.config.get("ANALYSIS_WAIT_TIMEOUT", 30.0),
+            retry_after=app.config.get("ANALYSIS_RETRY_AFTER", 5),
+        )
+    admission.init_app(app)
+
+    bucketer = None
+    if app.config.get("ANALYSIS_LENGTH_BUCKETING", False):
+        bucketer = LengthBucketer(
+            max_bucket_size=app.config.get("ANALYSIS_BUCKET_MAX_SIZE", 16),
+            max_length_ratio=app.config.get("ANALYSIS_BUCKET_MAX_RATIO", 1.5),
+        )
+
+    if dispatcher is not None:
+        dispatcher.close()
+    dispatcher = None
+    max_batch_size = app.config.get("ANALYSIS_BATCH_MAX_SIZE", 1)
+    if max_batch_size > 1:
+        # Look up classify_batch at call time so it can be patched in tests
+        dispatcher = BatchDispatcher(
+            lambda texts: classify_batch(texts),
+            max_batch_size=max_batch_size,
+            max_wait_ms=app.config.get("ANALYSIS_BATCH_MAX_WAIT_MS", 10),
+        )
@@ -0,0 +1,355 @@
+"""
+Pluggable emotion analyzers.
+
+Anything with a ``name``, a ``version`` and a ``classify(texts)`` method that
+returns one ``[{'label': ..., 'score': ...}, ...]`` list per text over the
+seven ``LABELS`` can score diary entries. The transformer implementation
+lives in ``analysis``; this module provides a cheap keyword scorer used as a
+degraded mode, the circuit breaker that decides when to fall back to it, and
+a two-stage cascade that only sends uncertain texts to the transformer.
+"""
+
+import re
+import threading
+import time
+from typing import Protocol
+
+import numpy as np
+
+LABELS = ("anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise")
+
+TRANSFORMER = "transformer"
+LEXICON = "lexicon"
+
+
+class Analyzer(Protocol):
+    """Interface shared by every emotion analyzer."""
+
+    name: str
+
+    @property
+    def version(self) -> str:
+        """Identifier stored with results, so they can be re-scored later."""
+
+    def classify(self, texts, timeout=None) -> list:
+        """Return one score list over ``LABELS`` per text, in input order."""
+
+
+class ScoredResult(list):
+    """A ``[[{...}, ...]]`` analysis result that remembers its producer.
+
+    Behaves exactly like the plain nested list the rest of the code expects.
+
+    Attributes:
+        source (str): Name of the analyzer, e.g. ``"transformer"``
+        model_version (str): Version of the analyzer
+    """
+
+    def __init__(self, scores, source, model_version):
+        super().__init__([scores])
+        self.source = source
+        self.model_version = model_version
+
+
+# Small hand-written lexicon; words are matched after lower-casing and
+# stripping a few common suffixes
+_LEXICON = {
+    "anger": """angry anger annoyed annoying furious mad rage hate hated irritated
+        frustrated frustrating outraged resent livid yelled shouting pissed""",
+    "disgust": """disgust disgusted disgusting gross nasty revolting sick awful
+        horrible vile repulsive yuck ew""",
+    "fear": """afraid scared fear fearful nervous anxious anxiety worried worry
+        terrified panic panicked dread frightened stress stressed uneasy""",
+    "joy": """happy happiness joy joyful glad great good love loved lovely
+        wonderful amazing excited fun enjoy enjoyed awesome grateful proud
+        delighted smile smiled laugh laughed fantastic best relaxed""",
+    "sadness": """sad sadness unhappy cry cried crying tears lonely alone miss
+        missed depressed down upset hurt heartbroken disappointed tired lost
+        gloomy miserable grief""",
+    "surprise": """surprise surprised surprising shocked shock unexpected
+        unexpectedly sudden suddenly wow astonished amazed unbelievable""",
+}
+_WORD_RE = re.compile(r"[a-z']+")
+_SUFFIXES = ("ing", "ed", "ly", "s")
+_NEGATIONS = frozenset({"not", "no", "never", "don't", "didn't", "isn't", "wasn't", "can't"})
+
+
+class LexiconAnalyzer:
+    """Keyword scorer producing the same seven labels as the transformer.
+
+    Each text is tokenized once with a compiled regex; a negated hit ("not
+    happy") counts towards neutral, or sadness for negated joy. Counts plus
+    smoothing and a neutral prior are normalized into scores, so the top
+    score grows with the evidence found. Orders of magnitude cheaper than
+    the model, and much cruder.
+
+    A batch is scored with NumPy: only its distinct words are looked up,
+    and the per-label counts of every text are accumulated in one pass over
+    the batch's tokens.
+
+    Args:
+        neutral_prior (float): Extra pseudo-count for neutral, so texts with
+            no keywords come out (weakly) neutral
+        smoothing (float): Pseudo-count added to every label
+    """
+
+    name = LEXICON
+    version = "lexicon-v1"
+
+    # Token codes besides label indices
+    _MISS = -1
+    _NEGATION = -2
+
+    def __init__(self, neutral_prior=0.5, smoothing=0.25):
+        self.neutral_prior = neutral_prior
+        self.smoothing = smoothing
+        self._words = {
+            word: label for label, words in _LEXICON.items() for word in words.split()
+        }
+        # Label index of each label once negated
+        self._negated = np.array(
+            [LABELS.index("sadness" if label == "joy" else "neutral") for label in LABELS],
+            dtype=np.intp,
+        )
+
+    def _label(self, word):
+        if word in self._words:
+            return self._words[word]
+        for suffix in _SUFFIXES:
+            if word.endswith(suffix) and word[: -len(suffix)] in self._words:
+                return self._words[word[: -len(suffix)]]
+        return None
+
+    def _code(self, word):
+        if word in _NEGATIONS:
+            return self._NEGATION
+        label = self._label(word)
+        return self._MISS if label is None else LABELS.index(label)
+
+    def score(self, text):
+        """Score one text; returns the label scores sorted descending."""
+        return self.classify([text])[0]
+
+    def score_matrix(self, texts):
+        """Scores of ``texts`` as a ``(len(texts), len(LABELS))`` array."""
+        tokens = [_WORD_RE.findall(text.lower()) for text in texts]
+        counts = np.zeros((len(tokens), len(LABELS)))
+        lengths = np.fromiter(map(len, tokens), dtype=np.intp, count=len(tokens))
+        if lengths.sum():
+            words, inverse = np.unique(
+                np.array([word for words in tokens for word in words]), return_inverse=True
+            )
+            codes = np.array([self._code(word) for word in words], dtype=np.intp)[inverse]
+            rows = np.repeat(np.arange(len(tokens)), lengths)
+            # A hit is negated if the token before it, in the same text, is a negation
+            negated = np.zeros(len(codes), dtype=bool)
+            negated[1:] = (codes[:-1] == self._NEGATION) & (rows[1:] == rows[:-1])
+            hits = codes >= 0
+            labels = np.where(negated[hits], self._negated[codes[hits]], codes[hits])
+            np.add.at(counts, (rows[hits], labels), 1)
+        counts += self.smoothing
+        counts[:, LABELS.index("neutral")] += self.neutral_prior
+        return counts / counts.sum(axis=1, keepdims=True)
+
+    def classify(self, texts, timeout=None):
+        matrix = self.score_matrix(list(texts))
+        # Stable, so ties keep LABELS order
+        order = np.argsort(-matrix, axis=1, kind="stable")
+        return [
+            [{"label": LABELS[i], "score": float(row[i])} for i in ranks]
+            for row, ranks in zip(matrix, order)
+        ]
+
+
+class CircuitBreaker:
+    """Trip to a fallback after repeated slow or failed calls.
+
+    Closed: calls go to the primary analyzer. After ``trip_after`` consecutive
+    calls slower than ``latency_threshold`` seconds (or failing), the breaker
+    opens and callers use the fallback for ``reset_after`` seconds. Then one
+    trial call is let through (half-open); it closes the breaker if it is
+    fast, or re-opens it otherwise.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, latency_threshold=2.0, trip_after=3, reset_after=30.0):
+        self.latency_threshold = latency_threshold
+        self.trip_after = max(1, int(trip_after))
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self.trips = 0
+        self.fallback_calls = 0
+
+    def allow(self):
+        """Return True if the primary analyzer should be tried."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.reset_after
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def note_fallback(self, count=1):
+        """Count texts that were scored by the fallback."""
+        with self._lock:
+            self.fallback_calls += count
+
+    def cancel(self):
+        """Report that a call ``allow`` let through never reached the analyzer.
+
+        A half-open breaker goes back to open, so the next caller makes the
+        trial instead.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record(self, seconds, ok=True):
+        """Report the outcome of a call that ``allow`` let through."""
+        with self._lock:
+            if ok and seconds <= self.latency_threshold:
+                self._consecutive = 0
+                self.state = self.CLOSED
+                return
+            self._consecutive += 1
+            if self.state == self.HALF_OPEN or self._consecutive >= self.trip_after:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "latency_threshold_ms": self.latency_threshold * 1000.0,
+            "trips": self.trips,
+            "fallback_calls": self.fallback_calls,
+        }
+
+
+class _Staged(list):
+    """Score list tagged with the cascade stage that produced it."""
+
+    def __init__(self, scores, stage):
+        super().__init__(scores)
+        self.stage = stage
+
+
+def stage_of(scores):
+    """Cascade stage that produced ``scores``, or None outside a cascade."""
+    return getattr(scores, "stage", None)
+
+
+class CascadeAnalyzer:
+    """Run a cheap analyzer first and escalate only uncertain texts.
+
+    Texts whose top score from ``first`` is at least ``threshold`` keep that
+    result; the rest are sent to ``second`` in one call. Each returned score
+    list is tagged with the stage that produced it (see ``stage_of``).
+
+    Args:
+        first: Cheap analyzer, e.g. ``LexiconAnalyzer``
+        second: Accurate analyzer, e.g. the transformer
+        threshold (float): Minimum top score accepted from ``first``
+    """
+
+    name = "cascade"
+
+    def __init__(self, first, second, threshold=0.6):
+        self.first = first
+        self.second = second
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.escalated = 0
+
+    @property
+    def version(self):
+        return f"cascade({self.first.version}>{self.second.version}@{self.threshold:g})"
+
+    def classify(self, texts, timeout=None):
+        texts = list(texts)
+        results = [_Staged(scores, self.first.name) for scores in self.first.classify(texts)]
+        uncertain = [
+            i for i, scores in enumerate(results)
+            if not scores or max(item["score"] for item in scores) < self.threshold
+        ]
+        if uncertain:
+            escalated = self.second.classify([texts[i] for i in uncertain], timeout)
+            for i, scores in zip(uncertain, escalated):
+                results[i] = _Staged(scores, self.second.name)
+        with self._lock:
+            self.texts += len(texts)
+            self.escalated += len(uncertain)
+        return results
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "first_stage": self.first.name,
+            "texts": self.texts,
+            "escalated": self.escalated,
+            "escalation_rate": (
+                round(self.escalated / self.texts, 4) if self.texts else None
+            ),
+        }
+
+
+def _top_label(scores):
+    return max(scores, key=lambda item: item["score"])["label"] if scores else None
+
+
+def evaluate_cascade(first, second, texts, labels, thresholds):
+    """Escalation rate and accuracy of a cascade on a labeled sample.
+
+    Both stages score every text once; each threshold is then simulated from
+    those scores.
+
+    Returns:
+        dict: Accuracy of each stage alone, and per threshold the escalation
+        rate, cascade accuracy and its gap to the second stage alone
+    """
+    first_scores = first.classify(texts)
+    second_scores = second.classify(texts)
+
+    def accuracy(predictions):
+        hits = sum(p == label for p, label in zip(predictions, labels))
+        return round(hits / len(labels), 4) if labels else None
+
+    first_labels = [_top_label(s) for s in first_scores]
+    second_labels = [_top_label(s) for s in second_scores]
+    full_accuracy = accuracy(second_labels)
+    report = {
+        "samples": len(texts),
+        "first_stage": {"name": first.name, "accuracy": accuracy(first_labels)},
+        "second_stage": {"name": second.name, "accuracy": full_accuracy},
+        "thresholds": [],
+    }
+    for threshold in thresholds:
+        escalate = [
+            not s or max(item["score"] for item in s) < threshold for s in first_scores
+        ]
+        predictions = [
+            second_label if up else first_label
+            for up, first_label, second_label in zip(escalate, first_labels, second_labels)
+        ]
+        cascade_accuracy = accuracy(predictions)
+        report["thresholds"].append({
+            "threshold": threshold,
+            "escalation_rate": round(sum(escalate) / len(texts), 4) if texts else None,
+            "accuracy": cascade_accuracy,
+            "accuracy_gap": (
+                round(full_accuracy - cascade_accuracy, 4) if texts else None
+            ),
+        })
+    return report
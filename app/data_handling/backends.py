@@ -0,0 +1,227 @@
+"""
+Inference backends for the emotion model.
+
+``EMOTION_BACKEND`` selects how the model is executed:
+
+* ``torch``: eager PyTorch fp32 through ``transformers.pipeline`` (default)
+* ``torch-int8``: the same model with its Linear layers dynamically
+  quantized to int8, which is smaller and faster on CPU-only hosts
+* ``onnx``: an ONNX export run by ONNX Runtime through ``optimum``; create
+  it with ``flask emotion-model export``
+
+Every backend returns a text-classification pipeline, so the output format
+is identical. ``flask emotion-model parity`` compares a backend against the
+fp32 reference on sample texts.
+"""
+
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+TORCH = "torch"
+TORCH_INT8 = "torch-int8"
+ONNX = "onnx"
+BACKENDS = (TORCH, TORCH_INT8, ONNX)
+
+# Files written by export_onnx; the quantized one is served when present
+ONNX_FILE = "model.onnx"
+ONNX_QUANTIZED_SUFFIX = "quantized"
+ONNX_QUANTIZED_FILE = f"model_{ONNX_QUANTIZED_SUFFIX}.onnx"
+
+# Used by the parity check when no sample file is given
+SAMPLE_TEXTS = [
+    "Today was wonderful, I finally got the job offer I was hoping for!",
+    "I can't stop crying since we said goodbye at the airport.",
+    "Someone keyed my car in the parking lot and I am furious.",
+    "I heard footsteps downstairs at 3am and couldn't move.",
+    "The leftovers in the fridge had gone green and smelled awful.",
+    "I went to the shops, bought bread and came home.",
+    "They threw me a surprise party and I had no idea!",
+    "Work was fine. Meetings in the morning, emails in the afternoon.",
+    "I'm worried about the exam results coming out next week.",
+    "My best friend moved away and the house feels empty.",
+]
+
+
+def set_thread_budget(num_threads):
+    """Cap the threads torch uses for one forward pass.
+
+    With several callers admitted to the model at once, the per-call budget
+    times ``ANALYSIS_MAX_CONCURRENT`` should not exceed the available cores.
+    """
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def load_pipeline(backend=TORCH, model_name=None, model_path=None):
+    """Build a text-classification pipeline for the given backend.
+
+    Args:
+        backend (str): One of ``BACKENDS``
+        model_name (str): Hugging Face model id, used when no local path is set
+        model_path (str): Local directory with the model (required for onnx).
+            An onnx export made with ``--quantize`` is loaded from its
+            quantized file.
+
+    Returns:
+        A ``transformers`` pipeline returning all label scores
+    """
+    from transformers import pipeline
+
+    source = model_path or model_name
+
+    if backend == TORCH:
+        return pipeline("text-classification", model=source, top_k=None)
+
+    if backend == TORCH_INT8:
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        model = AutoModelForSequenceClassification.from_pretrained(source)
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        tokenizer = AutoTokenizer.from_pretrained(source)
+        return pipeline(
+            "text-classification", model=model, tokenizer=tokenizer, top_k=None
+        )
+
+    if backend == ONNX:
+        if not model_path:
+            raise RuntimeError(
+                "The onnx backend needs EMOTION_MODEL_PATH pointing at an export "
+                "created with 'flask emotion-model export'."
+            )
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError as e:
+            raise RuntimeError(
+                "The onnx backend requires 'optimum[onnxruntime]' to be installed."
+            ) from e
+        from transformers import AutoTokenizer
+
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_path, file_name=onnx_file_name(model_path)
+        )
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        return pipeline(
+            "text-classification", model=model, tokenizer=tokenizer, top_k=None
+        )
+
+    raise ValueError(f"Unknown EMOTION_BACKEND {backend!r}; expected one of {BACKENDS}")
+
+
+def onnx_file_name(model_path):
+    """The ONNX file to serve from an export directory: quantized if there is one."""
+    if os.path.exists(os.path.join(model_path, ONNX_QUANTIZED_FILE)):
+        return ONNX_QUANTIZED_FILE
+    return ONNX_FILE
+
+
+def export_onnx(model_name, output_dir, quantize=False):
+    """Export ``model_name`` to ONNX in ``output_dir``, optionally int8-quantized.
+
+    The quantized model is written next to the fp32 one as
+    ``ONNX_QUANTIZED_FILE``, and ``load_pipeline`` serves it from then on.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+    if quantize:
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        quantizer = ORTQuantizer.from_pretrained(output_dir)
+        quantizer.quantize(
+            save_dir=output_dir,
+            file_suffix=ONNX_QUANTIZED_SUFFIX,
+            quantization_config=AutoQuantizationConfig.avx2(
+                is_static=False, per_channel=False
+            ),
+        )
+
+
+def compare(reference, candidate, texts):
+    """Run both pipelines over ``texts`` and measure how far apart they are.
+
+    Returns:
+        dict: Maximum and mean absolute score deviation, the fraction of texts
+        whose top label agrees, and texts/second for each pipeline
+    """
+    def run(pipe):
+        started = time.perf_counter()
+        results = pipe(list(texts), batch_size=len(texts), truncation=True)
+        return results, time.perf_counter() - started
+
+    ref_results, ref_seconds = run(reference)
+    cand_results, cand_seconds = run(candidate)
+
+    deviations = []
+    agreements = 0
+    for ref_scores, cand_scores in zip(ref_results, cand_results):
+        ref_map = {item["label"]: item["score"] for item in ref_scores}
+        cand_map = {item["label"]: item["score"] for item in cand_scores}
+        deviations.extend(abs(ref_map[label] - cand_map.get(label, 0.0)) for label in ref_map)
+        if max(ref_map, key=ref_map.get) == max(cand_map, key=cand_map.get):
+            agreements += 1
+
+    return {
+        "texts": len(texts),
+        "max_score_deviation": max(deviations),
+        "mean_score_deviation": sum(deviations) / len(deviations),
+        "label_agreement": agreements / len(texts),
+        "reference_texts_per_second": len(texts) / ref_seconds,
+        "candidate_texts_per_second": len(texts) / cand_seconds,
+    }
+
+
+model_cli = AppGroup("emotion-model", help="Export and validate emotion model backends.")
+
+
+@model_cli.command("export")
+@click.argument("output_dir")
+@click.option("--quantize", is_flag=True, help="Also apply int8 dynamic quantization.")
+def export_command(output_dir, quantize):
+    """Export the configured model to ONNX in OUTPUT_DIR."""
+    model_name = current_app.config.get("EMOTION_MODEL_NAME")
+    export_onnx(model_name, output_dir, quantize=quantize)
+    click.echo(f"Exported {model_name} to {output_dir}/{onnx_file_name(output_dir)}.")
+    click.echo(f"Set EMOTION_BACKEND=onnx and EMOTION_MODEL_PATH={output_dir} to use it.")
+
+
+@model_cli.command("parity")
+@click.option("--backend", type=click.Choice(BACKENDS), default=None,
+              help="Backend to check (default: EMOTION_BACKEND).")
+@click.option("--samples", type=click.File("r"), default=None,
+              help="File with one sample text per line.")
+@click.option("--min-agreement", default=0.95, show_default=True,
+              help="Fail if top-label agreement is below this fraction.")
+def parity_command(backend, samples, min_agreement):
+    """Compare a backend's scores with the fp32 torch model."""
+    config = current_app.config
+    backend = backend or config.get("EMOTION_BACKEND", TORCH)
+    model_name = config.get("EMOTION_MODEL_NAME")
+    texts = [line.strip() for line in samples if line.strip()] if samples else SAMPLE_TEXTS
+
+    reference = load_pipeline(TORCH, model_name)
+    candidate = load_pipeline(backend, model_name, config.get("EMOTION_MODEL_PATH"))
+    report = compare(reference, candidate, texts)
+
+    click.echo(f"Backend {backend} vs torch fp32 on {report['texts']} texts:")
+    click.echo(f"  max score deviation:  {report['max_score_deviation']:.4f}")
+    click.echo(f"  mean score deviation: {report['mean_score_deviation']:.4f}")
+    click.echo(f"  label agreement:      {report['label_agreement']:.1%}")
+    click.echo(
+        f"  throughput:           {report['candidate_texts_per_second']:.1f} texts/s "
+        f"(fp32: {report['reference_texts_per_second']:.1f} texts/s)"
+    )
+    if report["label_agreement"] < min_agreement:
+        raise SystemExit(1)
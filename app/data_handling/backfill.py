@@ -0,0 +1,195 @@
+"""
+Bulk re-analysis of existing diary entries.
+
+``flask reanalyze`` walks ``diary_entries`` in primary key order, analyzes
+entries in batches and writes the results with bulk UPDATEs, committing one
+chunk at a time. After each chunk the highest processed id is stored in a
+``BackfillCheckpoint`` row in the same transaction, so a killed run resumes
+from the last committed chunk.
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import or_, select, update
+
+from app import db
+from app.models import BackfillCheckpoint, DiaryEntry, User
+from . import analysis, analyzers, paragraphs, rollup
+
+
+def build_filters(unanalyzed=False, stale=False, owner=None, since=None, until=None,
+                  fallback_scored=False):
+    """Translate command options into SQL criteria on ``DiaryEntry``."""
+    criteria = []
+    if unanalyzed:
+        criteria.append(DiaryEntry.analyzed.is_(False))
+    if fallback_scored:
+        criteria.append(DiaryEntry.analysis_source == analyzers.LEXICON)
+    if stale:
+        criteria.append(
+            or_(
+                DiaryEntry.analysis_model_version.is_(None),
+                DiaryEntry.analysis_model_version != analysis.current_model_version(),
+            )
+        )
+    if owner is not None:
+        criteria.append(DiaryEntry.owner_id == owner)
+    if since is not None:
+        criteria.append(DiaryEntry.created_at >= since)
+    if until is not None:
+        # Inclusive of the whole ``until`` day
+        criteria.append(DiaryEntry.created_at < until + timedelta(days=1))
+    return criteria
+
+
+def iter_chunks(criteria, after_id=0, chunk_size=64):
+    """Yield ``[(id, content), ...]`` chunks of matching entries by ascending id.
+
+    Each chunk is a separate keyset query rather than one long cursor, so
+    the caller can commit between chunks without invalidating the stream,
+    and at most one chunk is held in memory. Only the id and content columns
+    are loaded.
+    """
+    last_id = after_id
+    while True:
+        rows = db.session.execute(
+            select(DiaryEntry.id, DiaryEntry.content)
+            .where(DiaryEntry.id > last_id, *criteria)
+            .order_by(DiaryEntry.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def reanalyze(criteria, chunk_size=64, checkpoint_name=None, resume=True,
+              progress=None):
+    """Re-run analysis on every entry matching ``criteria``.
+
+    Args:
+        criteria: SQL criteria from ``build_filters``
+        chunk_size (int): Entries analyzed and committed together
+        checkpoint_name (str): Name of the checkpoint row; None disables
+            checkpointing
+        resume (bool): Continue after the checkpoint's last id if one exists
+        progress: Optional callable receiving ``(processed, last_id)`` after
+            each chunk
+
+    Returns:
+        int: Number of entries re-analyzed in this run
+    """
+    checkpoint = None
+    after_id = 0
+    if checkpoint_name:
+        checkpoint = db.session.get(BackfillCheckpoint, checkpoint_name)
+        if checkpoint is None or not resume:
+            if checkpoint is None:
+                checkpoint = BackfillCheckpoint(name=checkpoint_name)
+                db.session.add(checkpoint)
+            checkpoint.last_id = 0
+            checkpoint.processed = 0
+            db.session.commit()
+        after_id = checkpoint.last_id
+
+    incremental = current_app.config.get("ANALYSIS_INCREMENTAL", False)
+    processed = 0
+    for rows in iter_chunks(criteria, after_id=after_id, chunk_size=chunk_size):
+        if incremental:
+            analyzed = paragraphs.analyze_entries([(row.id, row.content) for row in rows])
+            results = [result for result, _ in analyzed]
+            paragraphs.store_paragraphs(
+                [row.id for row in rows],
+                [p for _, paragraph_rows in analyzed for p in paragraph_rows],
+            )
+        else:
+            results = analysis.analyze_many([row.content for row in rows])
+        # A bulk UPDATE bypasses the session hooks that maintain the rollup
+        with rollup.tracking([row.id for row in rows]):
+            db.session.execute(
+                update(DiaryEntry),
+                [
+                    {
+                        "id": row.id,
+                        **DiaryEntry.emotion_fields(result, *analysis.provenance(result)),
+                    }
+                    for row, result in zip(rows, results)
+                ],
+            )
+        processed += len(rows)
+        if checkpoint is not None:
+            checkpoint.last_id = rows[-1].id
+            checkpoint.processed += len(rows)
+        db.session.commit()
+        if progress is not None:
+            progress(processed, rows[-1].id)
+
+    if checkpoint is not None:
+        # Finished; the next run starts from the beginning
+        db.session.delete(checkpoint)
+        db.session.commit()
+    return processed
+
+
+def _parse_date(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise click.BadParameter("expected YYYY-MM-DD")
+
+
+@click.command("reanalyze")
+@click.option("--unanalyzed", is_flag=True, help="Only entries not yet analyzed.")
+@click.option("--stale", is_flag=True,
+              help="Only entries analyzed by a different model version.")
+@click.option("--fallback-scored", is_flag=True,
+              help="Only entries scored by a fallback analyzer.")
+@click.option("--owner", help="Only entries owned by this username.")
+@click.option("--since", callback=_parse_date, help="Created on or after YYYY-MM-DD.")
+@click.option("--until", callback=_parse_date, help="Created on or before YYYY-MM-DD.")
+@click.option("--batch-size", default=None, type=int,
+              help="Entries per batch and transaction (default: ANALYSIS_BACKFILL_BATCH_SIZE).")
+@click.option("--checkpoint", "checkpoint_name", default="reanalyze", show_default=True,
+              help="Checkpoint name; use different names for concurrent runs.")
+@click.option("--restart", is_flag=True, help="Ignore an existing checkpoint.")
+def reanalyze_command(unanalyzed, stale, fallback_scored, owner, since, until,
+                      batch_size, checkpoint_name, restart):
+    """Re-run emotion analysis over existing diary entries."""
+    owner_id = None
+    if owner is not None:
+        owner_id = db.session.scalar(select(User.id).filter_by(username=owner))
+        if owner_id is None:
+            raise click.BadParameter(f"User '{owner}' not found.", param_hint="--owner")
+
+    criteria = build_filters(unanalyzed, stale, owner_id, since, until, fallback_scored)
+    batch_size = batch_size or current_app.config.get("ANALYSIS_BACKFILL_BATCH_SIZE", 64)
+
+    checkpoint = db.session.get(BackfillCheckpoint, checkpoint_name)
+    if checkpoint is not None and not restart:
+        click.echo(
+            f"Resuming after entry {checkpoint.last_id} "
+            f"({checkpoint.processed} already processed)."
+        )
+
+    total = reanalyze(
+        criteria,
+        chunk_size=batch_size,
+        checkpoint_name=checkpoint_name,
+        resume=not restart,
+        progress=lambda n, last_id: click.echo(f"  {n} entries done (last id {last_id})"),
+    )
+    click.echo(f"Re-analyzed {total} entries with {analysis.current_model_version()}.")
+
+
+def init_app(app):
+    """Register the backfill command.
+
+    Config:
+        ANALYSIS_BACKFILL_BATCH_SIZE: Default ``--batch-size`` (default: 64)
+    """
+    app.cli.add_command(reanalyze_command)
@@ -0,0 +1,235 @@
+"""
+Dynamic micro-batching in front of the emotion pipeline.
+
+Callers submit single texts and get a Future back. A dispatcher thread
+collects submissions until either ``max_batch_size`` texts are waiting or
+``max_wait_ms`` has passed since the first one arrived, then runs a single
+batched forward pass and resolves every caller's Future with its own result.
+
+``LengthBucketer`` splits a batch into groups of similar token length, since
+every sequence in a forward pass is padded to the longest one.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Queued by close(); the dispatcher thread exits when it reaches it
+_STOP = object()
+
+
+class BatchDispatcher:
+    """Coalesce concurrent classification requests into batches.
+
+    Args:
+        classify: Callable taking a list of texts and returning one result
+            per text, in order
+        max_batch_size (int): Upper bound on texts per forward pass
+        max_wait_ms (float): How long to hold the first text of a batch while
+            waiting for more to arrive
+    """
+
+    def __init__(self, classify, max_batch_size=16, max_wait_ms=10):
+        self.classify = classify
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._batch_sizes = Counter()
+
+    def submit(self, text):
+        """Queue a text for classification and return a Future for its result.
+
+        After ``close()`` the text is classified on the calling thread.
+        """
+        future = Future()
+        with self._lock:
+            if not self._closed:
+                self._ensure_started()
+                self._queue.put((text, future))
+                return future
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(self.classify([text])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit_many(self, texts):
+        """Queue several texts at once; returns Futures in the same order."""
+        return [self.submit(text) for text in texts]
+
+    def close(self):
+        """Stop the dispatcher thread once the texts already queued are done."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(_STOP)
+
+    def _ensure_started(self):
+        # Called with self._lock held
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="emotion-batch-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    def _collect(self):
+        """Block for the first item, then gather more until full or timed out.
+
+        Returns:
+            tuple: ``(batch, stopping)``; ``stopping`` once ``close()``'s
+            marker has been reached
+        """
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            # Drop callers that gave up before we got to them
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        self._batch_sizes[len(batch)] += 1
+        try:
+            results = self.classify([text for text, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"Classifier returned {len(results)} results for {len(batch)} texts"
+                )
+        except Exception as e:
+            logger.exception("Batched emotion analysis failed")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        """Return achieved batch sizes as a JSON-serialisable dict."""
+        batches = sum(self._batch_sizes.values())
+        items = sum(size * count for size, count in self._batch_sizes.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": round(items / batches, 2) if batches else None,
+            "batch_size_histogram": {
+                str(size): count for size, count in sorted(self._batch_sizes.items())
+            },
+            "queued": self._queue.qsize(),
+        }
+
+
+class LengthBucketer:
+    """Group texts of similar token length so each padded batch wastes less.
+
+    A batch is padded to its longest sequence, so one long entry among short
+    ones multiplies the work for the whole batch. Texts are sorted by length
+    and cut into buckets of at most ``max_bucket_size`` whose longest member
+    is at most ``max_length_ratio`` times the shortest; each bucket is run as
+    its own batch and results are returned in the original order.
+
+    Args:
+        max_bucket_size (int): Upper bound on texts per padded batch
+        max_length_ratio (float): Longest/shortest length allowed in a bucket
+        min_length_gap (int): Length differences below this never split a bucket
+    """
+
+    def __init__(self, max_bucket_size=16, max_length_ratio=1.5, min_length_gap=8):
+        self.max_bucket_size = max(1, int(max_bucket_size))
+        self.max_length_ratio = max_length_ratio
+        self.min_length_gap = min_length_gap
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.batches = 0
+        self.tokens = 0
+        self.padded_before = 0
+        self.padded_after = 0
+
+    def buckets(self, lengths):
+        """Return lists of indices into ``lengths``, shortest texts first."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        buckets = []
+        current = []
+        for i in order:
+            if current:
+                shortest = lengths[current[0]]
+                too_long = (
+                    lengths[i] > shortest * self.max_length_ratio
+                    and lengths[i] - shortest >= self.min_length_gap
+                )
+                if too_long or len(current) == self.max_bucket_size:
+                    buckets.append(current)
+                    current = []
+            current.append(i)
+        if current:
+            buckets.append(current)
+        return buckets
+
+    def run(self, texts, lengths, classify):
+        """Classify ``texts`` bucket by bucket and restore the input order."""
+        buckets = self.buckets(lengths)
+        results = [None] * len(texts)
+        for bucket in buckets:
+            bucket_results = classify([texts[i] for i in bucket])
+            for i, result in zip(bucket, bucket_results):
+                results[i] = result
+        self._record(lengths, buckets)
+        return results
+
+    def _record(self, lengths, buckets):
+        if not lengths:
+            return
+        total = sum(lengths)
+        before = len(lengths) * max(lengths)
+        after = sum(len(b) * max(lengths[i] for i in b) for b in buckets)
+        with self._lock:
+            self.calls += 1
+            self.batches += len(buckets)
+            self.tokens += total
+            self.padded_before += before
+            self.padded_after += after
+
+    def stats(self):
+        """Fraction of padded token slots that are padding, before and after."""
+        def ratio(padded):
+            return round((padded - self.tokens) / padded, 4) if padded else None
+
+        return {
+            "calls": self.calls,
+            "batches": self.batches,
+            "tokens": self.tokens,
+            "padding_ratio_before": ratio(self.padded_before),
+            "padding_ratio_after": ratio(self.padded_after),
+        }
@@ -0,0 +1,239 @@
+"""
+Content-hash keyed cache of emotion analysis results.
+
+Re-saving unchanged content (title-only edits, reverts, duplicated
+templates) should not cost another forward pass. Results are keyed by a hash
+of the normalized text plus model name and version, and looked up in two
+tiers: an in-memory LRU per app, then the ``emotion_result_cache`` table.
+Writes go through the caller's session, so they are committed together with
+the analysis result they belong to.
+"""
+
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select, update
+
+from app import db
+from app.models import EmotionCacheEntry
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def normalize_content(text):
+    """Canonical form used for hashing: NFC, trimmed, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text, model_name, model_version=""):
+    digest = hashlib.sha256()
+    digest.update(f"{model_name}\0{model_version}\0".encode("utf-8"))
+    digest.update(normalize_content(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmotionResultCache:
+    """Two-tier (memory LRU, then SQL table) cache of score lists.
+
+    Args:
+        model_name (str): Included in every key
+        model_version (str): Included in every key; bump it to invalidate
+        max_memory_entries (int): Size of the in-memory LRU tier
+        persistent (bool): Whether to use the SQL tier
+    """
+
+    def __init__(self, model_name, model_version="", max_memory_entries=10000,
+                 persistent=True):
+        self.model_name = model_name
+        self.model_version = model_version
+        self.max_memory_entries = max_memory_entries
+        self.persistent = persistent
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def key_for(self, text):
+        return cache_key(text, self.model_name, self.model_version)
+
+    def _remember(self, key, scores):
+        with self._lock:
+            self._memory[key] = scores
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, text):
+        """Return cached scores for ``text``, or None on a miss."""
+        key = self.key_for(text)
+        with self._lock:
+            scores = self._memory.get(key)
+            if scores is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return scores
+
+        if self.persistent:
+            scores = db.session.scalar(
+                select(EmotionCacheEntry.scores).where(EmotionCacheEntry.key == key)
+            )
+            if scores is not None:
+                db.session.execute(
+                    update(EmotionCacheEntry)
+                    .where(EmotionCacheEntry.key == key)
+                    .values(last_used_at=_utcnow())
+                )
+                self._remember(key, scores)
+                self.db_hits += 1
+                return scores
+
+        self.misses += 1
+        return None
+
+    def put(self, text, scores):
+        """Store ``scores`` for ``text`` in both tiers."""
+        key = self.key_for(text)
+        self._remember(key, scores)
+        if not self.persistent:
+            return
+        values = {
+            "key": key,
+            "model_name": self.model_name,
+            "scores": scores,
+            "created_at": _utcnow(),
+            "last_used_at": _utcnow(),
+        }
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            # Another worker may have cached the same text concurrently
+            db.session.execute(
+                insert(EmotionCacheEntry).values(**values).on_conflict_do_nothing()
+            )
+        else:
+            db.session.merge(EmotionCacheEntry(**values))
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        hits = self.memory_hits + self.db_hits
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+        }
+
+
+def prune(max_rows=None, max_age_days=None):
+    """Evict persistent entries by age and then by count (least recently used).
+
+    Returns:
+        int: Number of rows deleted
+    """
+    deleted = 0
+    if max_age_days is not None:
+        cutoff = _utcnow() - timedelta(days=max_age_days)
+        deleted += db.session.execute(
+            delete(EmotionCacheEntry).where(EmotionCacheEntry.last_used_at < cutoff)
+        ).rowcount
+
+    if max_rows is not None:
+        threshold = db.session.scalar(
+            select(EmotionCacheEntry.last_used_at)
+            .order_by(EmotionCacheEntry.last_used_at.desc())
+            .offset(max_rows)
+            .limit(1)
+        )
+        if threshold is not None:
+            deleted += db.session.execute(
+                delete(EmotionCacheEntry).where(
+                    EmotionCacheEntry.last_used_at <= threshold
+                )
+            ).rowcount
+
+    db.session.commit()
+    return deleted
+
+
+def get_cache():
+    """Return the current app's cache, or None if caching is disabled."""
+    return current_app.extensions.get("emotion_cache")
+
+
+cache_cli = AppGroup("emotion-cache", help="Manage the emotion result cache.")
+
+
+@cache_cli.command("prune")
+@click.option("--max-rows", type=int, default=None,
+              help="Keep at most this many entries (default: EMOTION_CACHE_MAX_ROWS).")
+@click.option("--max-age-days", type=int, default=None,
+              help="Drop entries unused for this long (default: EMOTION_CACHE_MAX_AGE_DAYS).")
+def prune_command(max_rows, max_age_days):
+    """Evict old and least recently used cache entries."""
+    if max_rows is None:
+        max_rows = current_app.config.get("EMOTION_CACHE_MAX_ROWS")
+    if max_age_days is None:
+        max_age_days = current_app.config.get("EMOTION_CACHE_MAX_AGE_DAYS")
+    click.echo(f"Deleted {prune(max_rows, max_age_days)} cache entries.")
+
+
+@cache_cli.command("stats")
+def stats_command():
+    """Show the number of persistent cache entries per model."""
+    rows = db.session.execute(
+        select(EmotionCacheEntry.model_name, func.count()).group_by(
+            EmotionCacheEntry.model_name
+        )
+    ).all()
+    if not rows:
+        click.echo("Cache is empty.")
+    for model_name, count in rows:
+        click.echo(f"{model_name}: {count}")
+
+
+@cache_cli.command("clear")
+def clear_command():
+    """Delete every persistent cache entry."""
+    deleted = db.session.execute(delete(EmotionCacheEntry)).rowcount
+    db.session.commit()
+    click.echo(f"Deleted {deleted} cache entries.")
+
+
+def init_app(app, model_version):
+    """Create the app's cache and register its CLI commands.
+
+    Args:
+        model_version (str): Identifier of the model and backend, part of every key
+
+    Config:
+        EMOTION_CACHE_ENABLED: Consult the cache before the model (default: True)
+        EMOTION_CACHE_PERSISTENT: Use the SQL tier (default: True)
+        EMOTION_CACHE_MEMORY_ENTRIES: In-memory LRU size (default: 10000)
+        EMOTION_CACHE_MAX_ROWS / EMOTION_CACHE_MAX_AGE_DAYS: Defaults for
+            ``flask emotion-cache prune``
+    """
+    app.cli.add_command(cache_cli)
+    if not app.config.get("EMOTION_CACHE_ENABLED", True):
+        return
+    app.extensions["emotion_cache"] = EmotionResultCache(
+        model_version,
+        max_memory_entries=app.config.get("EMOTION_CACHE_MEMORY_ENTRIES", 10000),
+        persistent=app.config.get("EMOTION_CACHE_PERSISTENT", True),
+    )
@@ -0,0 +1,88 @@
+"""
+Sliding-window analysis of long diary entries.
+
+The emotion model only sees 512 tokens, while diary content is unbounded.
+Long texts are split into overlapping token-bounded windows, all windows
+are classified together in one batch, and the per-window scores are
+combined back into a single ``[{'label': ..., 'score': ...}, ...]`` list.
+"""
+
+import re
+
+# 512 positions minus the <s> and </s> special tokens
+DEFAULT_MAX_TOKENS = 510
+DEFAULT_STRIDE = 64
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def token_spans(text, tokenizer=None):
+    """Return ``(start, end)`` character offsets of each token in ``text``.
+
+    Uses the model's (fast) tokenizer when given, otherwise approximates
+    tokens with whitespace-separated words.
+    """
+    if tokenizer is not None:
+        encoding = tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True
+        )
+        return [tuple(span) for span in encoding["offset_mapping"]]
+    return [match.span() for match in _WORD_RE.finditer(text)]
+
+
+def split_windows(text, tokenizer=None, max_tokens=DEFAULT_MAX_TOKENS,
+                  stride=DEFAULT_STRIDE):
+    """Split ``text`` into overlapping windows of at most ``max_tokens``.
+
+    Consecutive windows share ``stride`` tokens so that sentences on a
+    boundary are seen whole at least once.
+
+    Returns:
+        list: ``(window_text, token_count)`` tuples; a single window holding
+        the original text if it already fits
+    """
+    spans = token_spans(text, tokenizer)
+    if len(spans) <= max_tokens:
+        return [(text, len(spans))]
+
+    step = max(1, max_tokens - max(0, stride))
+    windows = []
+    start = 0
+    while True:
+        end = min(start + max_tokens, len(spans))
+        window_text = text[spans[start][0]:spans[end - 1][1]]
+        windows.append((window_text, end - start))
+        if end == len(spans):
+            break
+        start += step
+    return windows
+
+
+def aggregate(window_scores, weights, method="mean"):
+    """Combine per-window score lists into one distribution.
+
+    Args:
+        window_scores: One ``[{'label': ..., 'score': ...}, ...]`` list per window
+        weights: Token count of each window
+        method (str): ``"mean"`` for a length-weighted mean, or ``"max"`` for
+            the per-label maximum renormalized to sum to one
+
+    Returns:
+        list: Scores sorted from most to least likely, like the pipeline output
+    """
+    if len(window_scores) == 1:
+        return window_scores[0]
+
+    totals = {}
+    if method == "max":
+        for scores in window_scores:
+            for item in scores:
+                totals[item["label"]] = max(totals.get(item["label"], 0.0), item["score"])
+    else:
+        for scores, weight in zip(window_scores, weights):
+            for item in scores:
+                totals[item["label"]] = totals.get(item["label"], 0.0) + item["score"] * weight
+
+    norm = sum(totals.values()) or 1.0
+    combined = [{"label": label, "score": total / norm} for label, total in totals.items()]
+    return sorted(combined, key=lambda item: item["score"], reverse=True)
@@ -0,0 +1,374 @@
+"""
+Database-backed queue for emotion analysis.
+
+Saving a diary entry only records an ``AnalysisJob`` row; the model is run
+later by a pool of worker threads in the web process, or by a separate
+``flask analysis-worker`` process. Workers claim up to
+``ANALYSIS_BATCH_MAX_SIZE`` jobs at a time and score their entries together.
+With ``ANALYSIS_QUEUE_EAGER`` set, jobs are run on the request thread right
+after commit instead (useful for tests).
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+from app.models import AnalysisJob, DiaryEntry
+from . import admission, analysis, paragraphs
+
+logger = logging.getLogger(__name__)
+
+_start_lock = threading.Lock()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue_analysis(diary_entry):
+    """Mark the entry as not analyzed and queue a job for it.
+
+    An already pending job for the same entry is reused, since the worker
+    always reads the latest content. The caller is responsible for committing.
+
+    Returns:
+        AnalysisJob: The pending job for this entry
+    """
+    diary_entry.analyzed = False
+    job = None
+    if diary_entry.id is not None:
+        job = diary_entry.analysis_jobs.filter_by(status=AnalysisJob.PENDING).first()
+    if job is None:
+        job = AnalysisJob(diary=diary_entry, status=AnalysisJob.PENDING)
+        db.session.add(job)
+    return job
+
+
+def dispatch(job):
+    """Hand a committed job to whoever processes jobs in this app.
+
+    In eager mode the job is run immediately; otherwise the in-process
+    worker pool (if any) is woken up. An eager job that finds the model at
+    capacity stays pending for a worker or ``flask analysis-worker``.
+    """
+    if current_app.config.get("ANALYSIS_QUEUE_EAGER", False):
+        if claim_job(job.id):
+            try:
+                run_job(db.session.get(AnalysisJob, job.id))
+            except admission.Overloaded:
+                logger.info("Model at capacity, deferring analysis job %s", job.id)
+        return
+
+    pool = current_app.extensions.get("analysis_workers")
+    if pool is not None:
+        pool.notify()
+
+
+def claim_job(job_id):
+    """Atomically move a pending job to running.
+
+    Returns:
+        bool: True if this caller won the job
+    """
+    result = db.session.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job_id, AnalysisJob.status == AnalysisJob.PENDING)
+        .values(
+            status=AnalysisJob.RUNNING,
+            started_at=_utcnow(),
+            attempts=AnalysisJob.attempts + 1,
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def claim_jobs(limit=1):
+    """Claim up to ``limit`` of the oldest pending jobs.
+
+    Returns:
+        list: The claimed jobs, oldest first; empty if the queue is empty
+    """
+    claimed = []
+    while len(claimed) < limit:
+        job_ids = db.session.scalars(
+            db.select(AnalysisJob.id)
+            .where(AnalysisJob.status == AnalysisJob.PENDING)
+            .order_by(AnalysisJob.id)
+            .limit(limit - len(claimed))
+        ).all()
+        if not job_ids:
+            break
+        # Jobs another worker took first are skipped; the next pass looks
+        # further down the queue
+        claimed.extend(job_id for job_id in job_ids if claim_job(job_id))
+    return [db.session.get(AnalysisJob, job_id) for job_id in claimed]
+
+
+def claim_next_job():
+    """Claim the oldest pending job, or return None if the queue is empty."""
+    jobs = claim_jobs(1)
+    return jobs[0] if jobs else None
+
+
+def _release(jobs):
+    """Put claimed jobs back in the queue without using up an attempt."""
+    db.session.rollback()
+    for job in jobs:
+        job.status = AnalysisJob.PENDING
+        job.attempts -= 1
+    db.session.commit()
+
+
+def _finish(jobs):
+    for job in jobs:
+        job.status = AnalysisJob.DONE
+        job.error = None
+        job.finished_at = _utcnow()
+    db.session.commit()
+
+
+def run_jobs(jobs):
+    """Analyze the diary entries of several claimed jobs in one model call
+    and record the outcomes.
+
+    If the batch fails, its jobs are retried one at a time, so that one bad
+    entry does not use up the attempts of the others. Failed jobs are
+    returned to the queue until ``ANALYSIS_MAX_ATTEMPTS`` is reached.
+
+    Returns:
+        int: Number of entries analyzed
+
+    Raises:
+        admission.Overloaded: If the model is at capacity; the jobs not yet
+            finished are put back in the queue without using up an attempt
+    """
+    entries = {
+        entry.id: entry
+        for entry in DiaryEntry.query.filter(
+            DiaryEntry.id.in_([job.diary_id for job in jobs])
+        )
+    }
+    # Entries deleted while queued need no analysis
+    _finish([job for job in jobs if job.diary_id not in entries])
+    jobs = [job for job in jobs if job.diary_id in entries]
+    if not jobs:
+        return 0
+
+    contents = [entries[job.diary_id].content for job in jobs]
+    incremental = current_app.config.get("ANALYSIS_INCREMENTAL", False)
+    try:
+        if incremental:
+            analyzed = paragraphs.analyze_entries(
+                [(job.diary_id, content) for job, content in zip(jobs, contents)]
+            )
+        else:
+            analyzed = [(result, None) for result in analysis.analyze_many(contents)]
+    except admission.Overloaded:
+        _release(jobs)
+        raise
+    except Exception as e:
+        db.session.rollback()
+        if len(jobs) > 1:
+            logger.warning("Analysis batch of %d jobs failed, retrying one by one",
+                           len(jobs), exc_info=True)
+            done = 0
+            for i, job in enumerate(jobs):
+                try:
+                    done += run_jobs([job])
+                except admission.Overloaded:
+                    _release(jobs[i + 1:])
+                    raise
+            return done
+        job = jobs[0]
+        max_attempts = current_app.config.get("ANALYSIS_MAX_ATTEMPTS", 3)
+        job.status = (
+            AnalysisJob.FAILED if job.attempts >= max_attempts else AnalysisJob.PENDING
+        )
+        job.error = str(e)
+        db.session.commit()
+        logger.exception("Analysis job %s failed", job.id)
+        return 0
+
+    # Reload the entries to see edits made while the model was running
+    DiaryEntry.query.filter(DiaryEntry.id.in_(list(entries))).populate_existing().all()
+    stored_ids, rows = [], []
+    for job, content, (result, paragraph_rows) in zip(jobs, contents, analyzed):
+        entry = entries[job.diary_id]
+        if entry.content != content:
+            # Edited meanwhile; a newer job will cover it
+            continue
+        entry.update_emotion_analysis(result, *analysis.provenance(result))
+        if incremental:
+            stored_ids.append(entry.id)
+            rows.extend(paragraph_rows)
+    if stored_ids:
+        paragraphs.store_paragraphs(stored_ids, rows)
+    _finish(jobs)
+    return len(jobs)
+
+
+def run_job(job):
+    """Analyze the job's diary entry and record the outcome, as ``run_jobs``.
+
+    Returns:
+        bool: True if the entry was analyzed
+
+    Raises:
+        admission.Overloaded: If the model is at capacity; the job is put
+            back in the queue without using up an attempt
+    """
+    return run_jobs([job]) == 1
+
+
+def process_pending(limit=None):
+    """Run pending jobs on the calling thread until the queue is empty or
+    the model is at capacity.
+
+    Up to ``ANALYSIS_BATCH_MAX_SIZE`` jobs are claimed at a time and their
+    entries scored in one ``analyze_many`` call, so a single worker still
+    fills the model's batches.
+
+    Returns:
+        int: Number of jobs processed
+    """
+    batch_size = max(1, current_app.config.get("ANALYSIS_BATCH_MAX_SIZE", 1))
+    processed = 0
+    while limit is None or processed < limit:
+        jobs = claim_jobs(batch_size if limit is None else min(batch_size, limit - processed))
+        if not jobs:
+            break
+        try:
+            run_jobs(jobs)
+        except admission.Overloaded:
+            # Back off; the jobs are pending again and will be retried
+            break
+        processed += len(jobs)
+    return processed
+
+
+def requeue_stale_jobs(timeout_seconds):
+    """Return jobs stuck in running (e.g. after a crash) to the queue."""
+    cutoff = _utcnow() - timedelta(seconds=timeout_seconds)
+    result = db.session.execute(
+        update(AnalysisJob)
+        .where(
+            AnalysisJob.status == AnalysisJob.RUNNING,
+            AnalysisJob.started_at < cutoff,
+        )
+        .values(status=AnalysisJob.PENDING)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class AnalysisWorkerPool:
+    """Daemon threads that drain the analysis queue inside the web process.
+
+    Workers sleep for ``poll_interval`` seconds when the queue is empty, or
+    until ``notify()`` is called after a new job is committed.
+    """
+
+    def __init__(self, app, size=1, poll_interval=2.0):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(
+                target=self._run, name=f"analysis-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    processed = process_pending()
+            except Exception:
+                logger.exception("Analysis worker crashed, restarting loop")
+                processed = 0
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+@click.command("analysis-worker")
+@click.option("--once", is_flag=True, help="Drain the queue once and exit.")
+@click.option("--poll-interval", default=2.0, show_default=True)
+def analysis_worker_command(once, poll_interval):
+    """Run emotion analysis jobs in a standalone process."""
+    requeue_stale_jobs(current_app.config.get("ANALYSIS_JOB_TIMEOUT", 600))
+    if once:
+        click.echo(f"Processed {process_pending()} job(s).")
+        return
+
+    click.echo("Waiting for analysis jobs (Ctrl+C to stop)...")
+    stop = threading.Event()
+    while not stop.is_set():
+        if not process_pending():
+            stop.wait(poll_interval)
+
+
+def start_workers(app):
+    """Start the app's in-process worker pool, once.
+
+    Called before the first request rather than from ``init_app``, so that
+    ``flask`` commands, which create the app too, never take jobs from the
+    queue.
+    """
+    with _start_lock:
+        if "analysis_workers" in app.extensions:
+            return app.extensions["analysis_workers"]
+        with app.app_context():
+            requeue_stale_jobs(app.config.get("ANALYSIS_JOB_TIMEOUT", 600))
+        pool = AnalysisWorkerPool(
+            app,
+            size=app.config["ANALYSIS_WORKERS"],
+            poll_interval=app.config.get("ANALYSIS_POLL_INTERVAL", 2.0),
+        )
+        pool.start()
+        app.extensions["analysis_workers"] = pool
+        return pool
+
+
+def init_app(app):
+    """Register the worker command and, if configured, in-process workers.
+
+    Defaults are the values in ``config.Config``. A config that leaves a
+    setting out, such as the tests' config, gets its off or neutral value.
+
+    Config:
+        ANALYSIS_QUEUE_EAGER: Run jobs on the request thread (default: False)
+        ANALYSIS_WORKERS: Number of in-process worker threads, started with
+            the first request; 0 leaves the queue to ``flask analysis-worker``
+            (default: 0)
+        ANALYSIS_POLL_INTERVAL: Seconds between idle queue polls (default: 2.0)
+        ANALYSIS_MAX_ATTEMPTS: Attempts before a job is marked failed (default: 3)
+        ANALYSIS_BATCH_MAX_SIZE: Jobs a worker claims and scores together
+            (default: 16)
+        ANALYSIS_JOB_TIMEOUT: Seconds before a running job is considered
+            abandoned and re-queued (default: 600)
+        ANALYSIS_INCREMENTAL: Analyze paragraph by paragraph, reusing stored
+            scores of unchanged paragraphs (default: True)
+    """
+    app.cli.add_command(analysis_worker_command)
+
+    if app.config.get("ANALYSIS_WORKERS", 0) and not app.config.get("ANALYSIS_QUEUE_EAGER", False):
+
+        @app.before_request
+        def _start_workers():
+            if "analysis_workers" not in app.extensions:
+                start_workers(app)
@@ -0,0 +1,235 @@
+"""
+Daily mood rollup behind the mood charts.
+
+``daily_mood_rollup`` holds, per user, local (Australia/Perth) day and
+dominant emotion, the number of entries and the sum of their scores. The
+chart endpoints read only this table, so their cost depends on the day range
+rather than on how many entries a user has written.
+
+The table is maintained in the same transaction as the entries themselves:
+
+* ORM changes are picked up by session hooks: before a flush, the stored
+  values of every entry about to be updated or deleted are subtracted;
+  after it, the values of new and updated entries are read back and added.
+* Bulk UPDATEs that bypass the ORM (the backfill) wrap themselves in
+  ``tracking(ids)``, which does the same around the statement.
+
+``flask mood-rollup rebuild`` recomputes the table from the entries if it
+ever drifts.
+"""
+
+from contextlib import contextmanager
+from datetime import timedelta, timezone
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import DailyMoodRollup, DiaryEntry, User
+
+LOCAL_TZ = timezone(timedelta(hours=8))  # Australia/Perth (UTC+08:00)
+
+# Entry attributes that decide which rollup row an entry counts towards
+_TRACKED = ("owner_id", "created_at", "dominant_emotion_label", "dominant_emotion_score")
+_PENDING_KEY = "mood_rollup_pending"
+
+_table = DailyMoodRollup.__table__
+
+
+def local_date(created_at):
+    """Local calendar day of a timestamp stored as naive UTC."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(LOCAL_TZ).date()
+
+
+def _snapshot(connection, entry_ids):
+    """Stored ``(owner_id, created_at, label, score)`` of entries that count."""
+    if not entry_ids:
+        return []
+    return connection.execute(
+        select(*(getattr(DiaryEntry, name) for name in _TRACKED)).where(
+            DiaryEntry.id.in_(list(entry_ids)),
+            DiaryEntry.dominant_emotion_label.isnot(None),
+        )
+    ).all()
+
+
+def _accumulate(deltas, rows, sign):
+    for owner_id, created_at, label, score in rows:
+        if created_at is None:
+            continue
+        key = (owner_id, local_date(created_at), label)
+        count, total = deltas.get(key, (0, 0.0))
+        deltas[key] = (count + sign, total + sign * (score or 0.0))
+    return deltas
+
+
+def _upsert(connection):
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(_table)
+    if dialect == "postgresql":
+        return postgresql.insert(_table)
+    return None
+
+
+def apply_deltas(connection, deltas):
+    """Add ``{(user_id, day, emotion): (count, score_sum)}`` to the rollup.
+
+    Rows whose count drops to zero are removed.
+    """
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    rows = [
+        {"user_id": user_id, "day": day, "emotion": emotion,
+         "entry_count": count, "score_sum": total}
+        for (user_id, day, emotion), (count, total) in deltas.items()
+    ]
+    stmt = _upsert(connection)
+    if stmt is not None:
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "day", "emotion"],
+                set_={
+                    "entry_count": _table.c.entry_count + stmt.excluded.entry_count,
+                    "score_sum": _table.c.score_sum + stmt.excluded.score_sum,
+                },
+            ),
+            rows,
+        )
+    else:
+        for row in rows:
+            key = (_table.c.user_id == row["user_id"]) & (_table.c.day == row["day"]) & (
+                _table.c.emotion == row["emotion"]
+            )
+            updated = connection.execute(
+                update(_table).where(key).values(
+                    entry_count=_table.c.entry_count + row["entry_count"],
+                    score_sum=_table.c.score_sum + row["score_sum"],
+                )
+            )
+            if not updated.rowcount:
+                connection.execute(insert(_table), row)
+    connection.execute(
+        delete(_table).where(
+            _table.c.user_id.in_({row["user_id"] for row in rows}),
+            _table.c.entry_count <= 0,
+        )
+    )
+
+
+@contextmanager
+def tracking(entry_ids, connection=None):
+    """Keep the rollup in step with statements that bypass the ORM.
+
+    Usage::
+
+        with rollup.tracking(ids):
+            db.session.execute(update(DiaryEntry), rows)
+    """
+    connection = connection or db.session.connection()
+    before = _snapshot(connection, entry_ids)
+    yield
+    after = _snapshot(connection, entry_ids)
+    apply_deltas(connection, _accumulate(_accumulate({}, before, -1), after, 1))
+
+
+def _changed(entry):
+    state = inspect(entry)
+    return any(state.attrs[name].history.has_changes() for name in _TRACKED)
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    """Take the stored values of entries this flush changes out of the rollup.
+
+    This happens before the flush so that deleted entries are subtracted
+    while their rows, and their owners, still exist.
+    """
+    entries = [obj for obj in session.new if isinstance(obj, DiaryEntry)] + [
+        obj for obj in session.dirty if isinstance(obj, DiaryEntry) and _changed(obj)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, DiaryEntry)]
+    if not entries and not deleted:
+        return
+    connection = session.connection()
+    persistent_ids = [obj.id for obj in entries + deleted if obj.id is not None]
+    apply_deltas(connection, _accumulate({}, _snapshot(connection, persistent_ids), -1))
+    session.info.setdefault(_PENDING_KEY, []).extend(entries)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _after_flush(session, flush_context):
+    """Add the flushed values of the changed entries back in."""
+    entries = session.info.pop(_PENDING_KEY, [])
+    if not entries:
+        return
+    connection = session.connection()
+    ids = [obj.id for obj in entries if obj.id is not None]
+    apply_deltas(connection, _accumulate({}, _snapshot(connection, ids), 1))
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def rebuild(user_id=None, chunk_size=1000):
+    """Recompute the rollup from the entries, for one user or everyone.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    criteria = [DiaryEntry.dominant_emotion_label.isnot(None)]
+    if user_id is not None:
+        criteria.append(DiaryEntry.owner_id == user_id)
+    totals = {}
+    rows = db.session.execute(
+        select(*(getattr(DiaryEntry, name) for name in _TRACKED))
+        .where(*criteria)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in rows.partitions():
+        _accumulate(totals, chunk, 1)
+
+    reset = delete(DailyMoodRollup)
+    if user_id is not None:
+        reset = reset.where(DailyMoodRollup.user_id == user_id)
+    db.session.execute(reset)
+    if totals:
+        db.session.execute(
+            insert(DailyMoodRollup),
+            [
+                {"user_id": owner_id, "day": day, "emotion": emotion,
+                 "entry_count": count, "score_sum": total}
+                for (owner_id, day, emotion), (count, total) in totals.items()
+            ],
+        )
+    db.session.commit()
+    return len(totals)
+
+
+rollup_cli = AppGroup("mood-rollup", help="Manage the daily mood rollup.")
+
+
+@rollup_cli.command("rebuild")
+@click.option("--owner", help="Only rebuild this username's rows.")
+def rebuild_command(owner):
+    """Recompute the daily mood rollup from the diary entries."""
+    user_id = None
+    if owner is not None:
+        user_id = db.session.scalar(select(User.id).filter_by(username=owner))
+        if user_id is None:
+            raise click.BadParameter(f"User '{owner}' not found.", param_hint="--owner")
+    written = rebuild(user_id)
+    click.echo(f"Rebuilt the daily mood rollup ({written} rows).")
+
+
+def init_app(app):
+    """Register the rollup commands; the session hooks are registered on import."""
+    app.cli.add_command(rollup_cli)
@@ -6,23 +6,16 @@ implements emotion analysis using transformer models.
 """
 
 # routes.py
-from flask import request, render_template, flash, url_for, jsonify
+from flask import abort, request, render_template, flash, url_for, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import redirect
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from sqlalchemy import func, case
 from app import db
-from app.models import User, DiaryEntry
+from app.models import User, DiaryEntry, AnalysisJob, DailyMoodRollup
 from . import bp
 from .forms import DiaryForm
-
-from transformers import pipeline
-
-emotion_classifier = pipeline(
-    "text-classification",
-    model="j-hartmann/emotion-english-distilroberta-base",
-    top_k=None,
-)
+from . import admission, analysis, jobs, rollup, search
 
 POSITIVE_EMOTIONS = {
     "joy",
@@ -51,19 +44,23 @@ def create_diary():
     """
     form = DiaryForm()
     if form.validate_on_submit():  # Handles POST and validation
+        # Answers 503 if the model is overloaded and the policy is "reject"
+        analyze_now = admission.check_capacity()
         new_diary = DiaryEntry(
             title=form.title.data,
             content=form.content.data,
             owner_id=current_user.id,
         )
-        result = emotion_classifier(new_diary.content)
-
-        new_diary.update_emotion_analysis(result)
-
         db.session.add(new_diary)
+        job = jobs.enqueue_analysis(new_diary)
         db.session.commit()
+        if analyze_now:
+            jobs.dispatch(job)
 
-        flash("Diary created and analyzed successfully!", "success")
+        if new_diary.analyzed:
+            flash("Diary created and analyzed successfully!", "success")
+        else:
+            flash("Diary created! Emotion analysis is running in the background.", "success")
         return redirect(url_for("main.home"))  # Or your main diary list page
 
     # For GET request, or if form validation fails on POST
@@ -75,10 +72,11 @@ def create_diary():
 @bp.route("/view_diary/<diary_id>")
 @login_required
 def view_diary(diary_id):
-    diary_entry = DiaryEntry.query.get_or_404(diary_id)
-    if diary_entry.owner_id != current_user.id and not diary_entry.is_shared_with_user(
-        current_user
-    ):
+    # Entry, owner and access level in one query
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
+    if diary_entry is None:
+        abort(404)
+    if access is None:
         flash("You do not have permission to view this diary entry.", "danger")
         return redirect(url_for("main.home"))
 
@@ -94,12 +92,12 @@ def view_diary(diary_id):
 @bp.route("/edit_diary/<int:diary_id>", methods=["GET", "POST"])
 @login_required
 def edit_diary(diary_id):
-    diary_entry = db.session.get(DiaryEntry, diary_id)
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
     if not diary_entry:
         flash("Diary entry not found.", "warning")
         return redirect(url_for("main.home"))  # Or your main diary list page
 
-    if diary_entry.owner_id != current_user.id:
+    if access != DiaryEntry.OWNER:
         flash("You do not have permission to edit this diary entry.", "danger")
         return redirect(url_for("main.home"))
 
@@ -111,14 +109,18 @@ def edit_diary(diary_id):
         # Update the diary_entry object with form data
         diary_entry.title = form.title.data
 
-        # Perform emotion analysis on the updated content
+        # Queue emotion analysis of the updated content
+        job = None
+        analyze_now = True
         if form.content.data != diary_entry.content:
+            analyze_now = admission.check_capacity()
             diary_entry.content = form.content.data
-            result = emotion_classifier(diary_entry.content)
-            diary_entry.update_emotion_analysis(result)
+            job = jobs.enqueue_analysis(diary_entry)
 
         try:
             db.session.commit()
+            if job is not None and analyze_now:
+                jobs.dispatch(job)
             flash("Diary entry updated successfully!", "success")
             # Redirect to the view page of the edited diary
             return redirect(
@@ -143,12 +145,12 @@ def edit_diary(diary_id):
 @bp.route("/delete_diary/<int:diary_id>", methods=["POST"])
 @login_required
 def delete_diary(diary_id):
-    diary_entry = db.session.get(DiaryEntry, diary_id)
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
     if not diary_entry:
         flash("Diary entry not found.", "warning")
         return redirect(url_for("main.home"))
 
-    if diary_entry.owner_id != current_user.id:
+    if access != DiaryEntry.OWNER:
         flash("You do not have permission to delete this diary entry.", "danger")
         return redirect(url_for("data_handling.view_diary", diary_id=diary_id))
 
@@ -166,34 +168,23 @@ def delete_diary(diary_id):
 @bp.route("/share_diary/<int:diary_id>", methods=["POST"])
 @login_required
 def share_diary(diary_id):
-    diary_entry = DiaryEntry.query.get_or_404(diary_id)
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
+    if diary_entry is None:
+        abort(404)
 
-    if diary_entry.owner_id != current_user.id:
+    if access != DiaryEntry.OWNER:
         flash("You can only share diaries you own.", "danger")
         return redirect(url_for("main.home"))
 
     shared_usernames = request.form.getlist("shared_users")
-    current_shared_users = {user.username for user in diary_entry.get_shared_users()}
 
     try:
-        success_count = 0
-        # Share with newly selected users
-        for username in shared_usernames:
-            if username not in current_shared_users:
-                shared_user = User.query.filter_by(username=username).first()
-                if not shared_user:
-                    flash(f"User '{username}' not found.", "warning")
-                    continue
-                if diary_entry.share_with_user(shared_user):
-                    success_count += 1
-
-        # Unshare from users who were deselected
-        for username in current_shared_users:
-            if username not in shared_usernames:
-                shared_user = User.query.filter_by(username=username).first()
-                if shared_user and diary_entry.unshare_from_user(shared_user):
-                    success_count += 1
+        # One diff against the current shares instead of a query per username
+        changes = diary_entry.set_shared_usernames(shared_usernames)
+        for username in changes.missing:
+            flash(f"User '{username}' not found.", "warning")
 
+        success_count = changes.added + changes.removed
         if success_count > 0:
             db.session.commit()
             flash(
@@ -209,11 +200,70 @@ def share_diary(diary_id):
     return redirect(url_for("data_handling.view_diary", diary_id=diary_id))
 
 
+@bp.route("/share_diaries", methods=["POST"])
+@login_required
+def share_diaries():
+    """
+    Share several of the current user's diaries with several users at once.
+
+    Request (JSON or form):
+        {"diary_ids": [1, 2], "usernames": ["alice", "bob"], "unshare": false}
+
+    Response format:
+        {"added": 4, "removed": 0, "missing": []}
+
+    Every diary must belong to the current user, otherwise nothing changes
+    and 403 is returned. The number of queries does not depend on how many
+    diaries or users are listed.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {
+            "diary_ids": request.form.getlist("diary_ids"),
+            "usernames": request.form.getlist("usernames"),
+            "unshare": request.form.get("unshare") in ("1", "true", "on"),
+        }
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+
+    raw_ids = data.get("diary_ids") or []
+    # Form values arrive as strings; bools and floats would silently become ids
+    if not isinstance(raw_ids, list) or not all(
+        isinstance(diary_id, (int, str)) and not isinstance(diary_id, bool)
+        for diary_id in raw_ids
+    ):
+        return jsonify({"error": "diary_ids must be a list of integers"}), 400
+    try:
+        diary_ids = {int(diary_id) for diary_id in raw_ids}
+    except ValueError:
+        return jsonify({"error": "diary_ids must be a list of integers"}), 400
+
+    usernames = data.get("usernames") or []
+    if not isinstance(usernames, list) or not all(
+        isinstance(username, str) for username in usernames
+    ):
+        return jsonify({"error": "usernames must be a list of strings"}), 400
+
+    owned = db.session.scalar(
+        db.select(func.count(DiaryEntry.id)).where(
+            DiaryEntry.id.in_(diary_ids), DiaryEntry.owner_id == current_user.id
+        )
+    )
+    if owned != len(diary_ids):
+        return jsonify({"error": "You can only share diaries you own."}), 403
+
+    changes = DiaryEntry.share_many(diary_ids, usernames, unshare=bool(data.get("unshare")))
+    db.session.commit()
+    return jsonify(changes._asdict())
+
+
 @bp.route("/get_shared_users/<int:diary_id>", methods=["GET"])
 @login_required
 def get_shared_users(diary_id):
-    diary_entry = DiaryEntry.query.get_or_404(diary_id)
-    if diary_entry.owner_id != current_user.id:
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
+    if diary_entry is None:
+        abort(404)
+    if access != DiaryEntry.OWNER:
         flash("You can only view shared users for diaries you own.", "danger")
         return jsonify([]), 403
     shared_users = diary_entry.get_shared_users()
@@ -222,12 +272,147 @@ def get_shared_users(diary_id):
     )
 
 
+@bp.route("/share_candidates/<int:diary_id>", methods=["GET"])
+@login_required
+def share_candidates(diary_id):
+    """
+    Everything the share dialog needs in one response: who the diary is
+    shared with now, and a page of users matching a username prefix.
+
+    Query parameters are those of ``auth.search_users`` (q, limit, cursor).
+    The shared list is only included on the first page.
+
+    Response format:
+        {
+            "shared": [{"id": 2, "username": "alice"}],
+            "candidates": [{"id": 3, "username": "bob"}],
+            "next_cursor": null
+        }
+    """
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
+    if diary_entry is None:
+        abort(404)
+    if access != DiaryEntry.OWNER:
+        return jsonify({"error": "forbidden"}), 403
+    cursor = request.args.get("cursor") or None
+    users, next_cursor = User.search_by_prefix(
+        request.args.get("q", "").strip(),
+        after=cursor,
+        limit=request.args.get("limit", type=int),
+        exclude_id=current_user.id,
+    )
+    payload = {
+        "candidates": [{"id": user.id, "username": user.username} for user in users],
+        "next_cursor": next_cursor,
+    }
+    if cursor is None:
+        payload["shared"] = [
+            {"id": user.id, "username": user.username}
+            for user in diary_entry.shared_with.order_by(User.username)
+        ]
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+@bp.route("/analysis_status/<int:diary_id>", methods=["GET"])
+@login_required
+def analysis_status(diary_id):
+    """
+    Report the analysis state of a diary entry so the details page can poll it.
+
+    Response format:
+        {
+            "diary_id": 1,
+            "analyzed": false,
+            "status": "pending",
+            "dominant_emotion_label": null,
+            "dominant_emotion_score": null
+        }
+    """
+    diary_entry, access = DiaryEntry.get_accessible(diary_id, current_user)
+    if diary_entry is None:
+        abort(404)
+    if access is None:
+        return jsonify({"error": "forbidden"}), 403
+
+    latest_job = diary_entry.analysis_jobs.order_by(AnalysisJob.id.desc()).first()
+    return jsonify(
+        {
+            "diary_id": diary_entry.id,
+            "analyzed": diary_entry.analyzed,
+            "status": latest_job.status if latest_job else None,
+            "dominant_emotion_label": diary_entry.dominant_emotion_label,
+            "dominant_emotion_score": diary_entry.dominant_emotion_score,
+        }
+    )
+
+
+@bp.route("/analyzer-status", methods=["GET"])
+def analyzer_status():
+    """
+    Report whether the emotion model is loaded.
+
+    Response format:
+        {
+            "model": "...", "state": "ready", "ready": true,
+            "load_seconds": 12.3, "error": null,
+            "batching": {"batches": 10, "items": 37, "mean_batch_size": 3.7, ...}
+        }
+    """
+    return jsonify(analysis.status())
+
+
+@bp.route("/search", methods=["GET"])
+@login_required
+def search_diaries():
+    """
+    Ranked full-text search over the current user's diaries, for
+    search-as-you-type. Every term is matched as a word prefix.
+
+    Params:
+        q (str): Search text
+        limit (int, optional): Maximum results (default: 10, at most 50)
+
+    Response format:
+        [
+            {"id": 3, "title": "Beach day", "title_html": "<mark>Beach</mark> day",
+             "snippet_html": "...went to the <mark>beach</mark> with...",
+             "rank": 4.2, "created_at": "2025-04-16T09:30:00", "url": "/data/view_diary/3"},
+            ...
+        ]
+    """
+    query = request.args.get("q", "").strip()
+    limit = min(request.args.get("limit", 10, type=int) or 10, 50)
+    if not query:
+        return jsonify([])
+
+    hits = search.get_search().search(current_user.id, query, limit=limit)
+    return jsonify(
+        [
+            {
+                "id": hit.id,
+                "title": hit.title,
+                "title_html": str(hit.title_html),
+                "snippet_html": str(hit.snippet_html),
+                "rank": hit.rank,
+                "created_at": hit.created_at.isoformat() if hit.created_at else None,
+                "url": url_for("data_handling.view_diary", diary_id=hit.id),
+            }
+            for hit in hits
+        ]
+    )
+
+
 @bp.route("/mood-timeline", methods=["GET"])
 @login_required
 def mood_timeline():
     """
     Return a timeline of dominant emotions for the current user.
 
+    Reads the daily mood rollup; days are Australia/Perth calendar days.
+
     Params:
         days (int, optional): How many days back to include (default: 30).
 
@@ -243,31 +428,26 @@ def mood_timeline():
     except ValueError:
         days = 30
 
-    tz = timezone(timedelta(hours=8))  # Australia/Perth (UTC+08:00)
-    start_date = datetime.now(tz).replace(
-        hour=0, minute=0, second=0, microsecond=0
-    ) - timedelta(days=days - 1)
+    start_day = datetime.now(rollup.LOCAL_TZ).date() - timedelta(days=days - 1)
 
-    # Aggregate counts by date and dominant emotion
+    # Daily counts come straight from the rollup, one row per day and emotion
     rows = (
         db.session.query(
-            func.date(DiaryEntry.created_at).label("date"),
-            DiaryEntry.dominant_emotion_label.label("emotion"),
-            func.count().label("count"),
+            DailyMoodRollup.day.label("date"),
+            DailyMoodRollup.emotion.label("emotion"),
+            DailyMoodRollup.entry_count.label("count"),
         )
         .filter(
-            DiaryEntry.owner_id == current_user.id,
-            DiaryEntry.dominant_emotion_label.isnot(None),
-            DiaryEntry.created_at >= start_date,
+            DailyMoodRollup.user_id == current_user.id,
+            DailyMoodRollup.day >= start_day,
         )
-        .group_by(func.date(DiaryEntry.created_at), DiaryEntry.dominant_emotion_label)
-        .order_by(func.date(DiaryEntry.created_at))
+        .order_by(DailyMoodRollup.day, DailyMoodRollup.emotion)
         .all()
     )
 
     # Convert to list of dicts for JSON output
     data = [
-        {"date": str(row.date), "emotion": row.emotion, "count": row.count}
+        {"date": row.date.isoformat(), "emotion": row.emotion, "count": row.count}
         for row in rows
     ]
     return jsonify(data)
@@ -291,35 +471,38 @@ def average_mood_index():
             "average_mood_index": 0.42
         }
     """
-    tz = timezone(timedelta(hours=8))  # Australia/Perth (UTC+08:00)
-    end_date = datetime.now(tz).replace(hour=23, minute=59, second=59, microsecond=0)
-    start_date = end_date - timedelta(days=6)  # last 7 calendar days
+    end_day = datetime.now(rollup.LOCAL_TZ).date()
+    start_day = end_day - timedelta(days=6)  # last 7 calendar days
 
     score_expr = case(
         (
-            DiaryEntry.dominant_emotion_label.in_(POSITIVE_EMOTIONS),
+            DailyMoodRollup.emotion.in_(POSITIVE_EMOTIONS),
             1,
         ),
         (
-            DiaryEntry.dominant_emotion_label.in_(NEGATIVE_EMOTIONS),
+            DailyMoodRollup.emotion.in_(NEGATIVE_EMOTIONS),
             -1,
         ),
         else_=0,
     )
 
-    avg_score = (
-        db.session.query(func.avg(score_expr).label("avg_idx"))
+    # Mean over entries, i.e. weighted by each rollup row's entry count
+    total_score, total_count = (
+        db.session.query(
+            func.sum(score_expr * DailyMoodRollup.entry_count),
+            func.sum(DailyMoodRollup.entry_count),
+        )
         .filter(
-            DiaryEntry.owner_id == current_user.id,
-            DiaryEntry.dominant_emotion_label.isnot(None),
-            DiaryEntry.created_at.between(start_date, end_date),
+            DailyMoodRollup.user_id == current_user.id,
+            DailyMoodRollup.day.between(start_day, end_day),
         )
-        .scalar()
+        .one()
     )
+    avg_score = total_score / total_count if total_count else None
 
     response = {
-        "start": start_date.date().isoformat(),
-        "end": end_date.date().isoformat(),
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
         "average_mood_index": round(avg_score or 0, 2),
     }
     return jsonify(response)
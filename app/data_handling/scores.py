@@ -0,0 +1,59 @@
+"""
+Bulk access to stored emotion scores as NumPy arrays.
+
+Scores live in one float column per label (``DiaryEntry.score_<label>``,
+in ``EMOTION_LABELS`` order), and the dominant label is also stored as its
+small-integer code, so many entries can be loaded as a single matrix without
+parsing JSON or mapping labels per row.
+"""
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import db
+from app.models import EMOTION_LABELS, SCORE_COLUMNS, DiaryEntry
+
+
+def iter_score_arrays(criteria=(), chunk_size=1000):
+    """Yield stored scores of analyzed entries matching ``criteria`` in chunks.
+
+    Args:
+        criteria: SQL criteria on ``DiaryEntry``, as for ``Query.filter``
+        chunk_size (int): Entries per chunk
+
+    Yields:
+        tuple: ``(ids, scores, codes)``: int64 ids of shape ``(n,)``, float32
+        scores of shape ``(n, len(EMOTION_LABELS))`` with NaN for missing
+        scores, and int8 dominant emotion codes with -1 for none
+    """
+    columns = [getattr(DiaryEntry, name) for name in SCORE_COLUMNS]
+    rows = db.session.execute(
+        select(DiaryEntry.id, func.coalesce(DiaryEntry.dominant_emotion_code, -1), *columns)
+        .where(DiaryEntry.analyzed.is_(True), *criteria)
+        .order_by(DiaryEntry.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in rows.partitions():
+        ids = np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk))
+        codes = np.fromiter((row[1] for row in chunk), dtype=np.int8, count=len(chunk))
+        # None becomes NaN when converted to float
+        scores = np.array([row[2:] for row in chunk], dtype=np.float32)
+        yield ids, scores.reshape(len(chunk), len(EMOTION_LABELS)), codes
+
+
+def load_score_arrays(criteria=(), chunk_size=1000):
+    """Load the stored scores of every matching entry at once.
+
+    Returns:
+        tuple: ``(ids, scores, codes)`` as from ``iter_score_arrays``,
+        concatenated; empty arrays if nothing matches
+    """
+    chunks = list(iter_score_arrays(criteria, chunk_size))
+    if not chunks:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty((0, len(EMOTION_LABELS)), dtype=np.float32),
+            np.empty(0, dtype=np.int8),
+        )
+    ids, scores, codes = zip(*chunks)
+    return np.concatenate(ids), np.concatenate(scores), np.concatenate(codes)
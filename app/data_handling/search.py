@@ -0,0 +1,275 @@
+"""
+Full-text search over diary titles and content.
+
+One interface, one implementation per database:
+
+* SQLite: an external-content FTS5 table ``diary_fts`` kept in sync with
+  ``diary_entries`` by triggers, ranked with bm25.
+* PostgreSQL: a stored generated ``tsvector`` column on ``diary_entries``
+  with a GIN index, ranked with ``ts_rank``.
+* Anything else: the old ``ilike`` scan, so search keeps working.
+
+The index objects are created by the ``f1c8a3d5b7e2`` migration, or with
+the tables by ``db.create_all`` in tests, and can be rebuilt with
+``flask search-index rebuild``.
+"""
+
+import re
+from collections import namedtuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, column, event, text
+
+from app import db
+from app.models import DiaryEntry
+
+# Snippet markers that cannot appear in diary text; the text between them is
+# escaped and the markers become <mark> tags
+_OPEN, _CLOSE = "\x02", "\x03"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SearchHit = namedtuple("SearchHit", "id title created_at rank title_html snippet_html")
+
+# Result types of the raw search queries, so created_at comes back as a datetime
+_HIT_COLUMNS = (
+    column("id", db.Integer),
+    column("title", db.String),
+    column("created_at", db.DateTime),
+    column("rank", db.Float),
+    column("title_html", db.String),
+    column("snippet_html", db.String),
+)
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS diary_fts USING fts5(
+        title, content, content='diary_entries', content_rowid='id',
+        tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_ai AFTER INSERT ON diary_entries BEGIN
+        INSERT INTO diary_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_ad AFTER DELETE ON diary_entries BEGIN
+        INSERT INTO diary_fts(diary_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_au AFTER UPDATE OF title, content ON diary_entries BEGIN
+        INSERT INTO diary_fts(diary_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO diary_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS diary_fts"]
+
+POSTGRES_DDL = [
+    """ALTER TABLE diary_entries ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+        ) STORED""",
+    """CREATE INDEX IF NOT EXISTS ix_diary_entries_search_vector
+        ON diary_entries USING gin (search_vector)""",
+]
+
+
+def _highlight(fragment):
+    """Escape a snippet and turn the match markers into <mark> tags."""
+    if fragment is None:
+        return None
+    html = str(escape(fragment))
+    return Markup(html.replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+class SqliteFtsSearch:
+    """FTS5 search; every search term is matched as a prefix, so results
+    appear while the user is still typing."""
+
+    name = "sqlite-fts5"
+
+    @staticmethod
+    def _match_query(query):
+        tokens = _TOKEN_RE.findall(query)
+        return " ".join(f'"{token}"*' for token in tokens)
+
+    def matching_ids(self, query):
+        match = self._match_query(query)
+        if not match:
+            return None
+        return (
+            text("SELECT rowid AS id FROM diary_fts WHERE diary_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(id=db.Integer)
+        )
+
+    def search(self, owner_id, query, limit=10):
+        match = self._match_query(query)
+        if not match:
+            return []
+        rows = db.session.execute(
+            text(
+                """
+                SELECT d.id, d.title, d.created_at,
+                       bm25(diary_fts, 5.0, 1.0) AS rank,
+                       highlight(diary_fts, 0, :open, :close) AS title_html,
+                       snippet(diary_fts, 1, :open, :close, '…', 16) AS snippet_html
+                FROM diary_fts
+                JOIN diary_entries d ON d.id = diary_fts.rowid
+                WHERE diary_fts MATCH :match AND d.owner_id = :owner_id
+                ORDER BY rank
+                LIMIT :limit
+                """
+            ).columns(*_HIT_COLUMNS),
+            {"match": match, "owner_id": owner_id, "limit": limit,
+             "open": _OPEN, "close": _CLOSE},
+        ).all()
+        # bm25 is lower-is-better; report higher-is-better like Postgres
+        return [
+            SearchHit(row.id, row.title, row.created_at, -row.rank,
+                      _highlight(row.title_html), _highlight(row.snippet_html))
+            for row in rows
+        ]
+
+    def rebuild(self):
+        for statement in SQLITE_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO diary_fts(diary_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+class PostgresSearch:
+    """``tsvector`` search with prefix matching on every term."""
+
+    name = "postgres-tsvector"
+
+    @staticmethod
+    def _tsquery(query):
+        tokens = _TOKEN_RE.findall(query)
+        return " & ".join(f"{token}:*" for token in tokens)
+
+    def matching_ids(self, query):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return None
+        return (
+            text(
+                "SELECT id FROM diary_entries "
+                "WHERE search_vector @@ to_tsquery('english', :tsquery)"
+            )
+            .bindparams(tsquery=tsquery)
+            .columns(id=db.Integer)
+        )
+
+    def search(self, owner_id, query, limit=10):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return []
+        options = f"StartSel={_OPEN},StopSel={_CLOSE},MaxWords=24,MinWords=8"
+        rows = db.session.execute(
+            text(
+                """
+                SELECT id, title, created_at,
+                       ts_rank(search_vector, q) AS rank,
+                       ts_headline('english', title, q, :full) AS title_html,
+                       ts_headline('english', content, q, :options) AS snippet_html
+                FROM diary_entries, to_tsquery('english', :tsquery) AS q
+                WHERE search_vector @@ q AND owner_id = :owner_id
+                ORDER BY rank DESC, id DESC
+                LIMIT :limit
+                """
+            ).columns(*_HIT_COLUMNS),
+            {"tsquery": tsquery, "owner_id": owner_id, "limit": limit,
+             "options": options, "full": options + ",HighlightAll=true"},
+        ).all()
+        return [
+            SearchHit(row.id, row.title, row.created_at, row.rank,
+                      _highlight(row.title_html), _highlight(row.snippet_html))
+            for row in rows
+        ]
+
+    def rebuild(self):
+        for statement in POSTGRES_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("REINDEX INDEX ix_diary_entries_search_vector"))
+        db.session.commit()
+
+
+class LikeSearch:
+    """Unindexed ``ilike`` fallback for other databases."""
+
+    name = "ilike"
+
+    def matching_ids(self, query):
+        term = f"%{query}%"
+        return db.select(DiaryEntry.id).where(
+            DiaryEntry.title.ilike(term) | DiaryEntry.content.ilike(term)
+        )
+
+    def search(self, owner_id, query, limit=10):
+        entries = (
+            DiaryEntry.query.filter(DiaryEntry.owner_id == owner_id)
+            .filter(DiaryEntry.id.in_(self.matching_ids(query)))
+            .order_by(DiaryEntry.created_at.desc(), DiaryEntry.id.desc())
+            .limit(limit)
+            .all()
+        )
+        return [
+            SearchHit(e.id, e.title, e.created_at, None, escape(e.title),
+                      escape(e.content[:120]))
+            for e in entries
+        ]
+
+    def rebuild(self):
+        pass
+
+
+def get_search():
+    """Search implementation for the current database."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite" and current_app.config.get("SEARCH_FULL_TEXT", True):
+        return SqliteFtsSearch()
+    if dialect == "postgresql" and current_app.config.get("SEARCH_FULL_TEXT", True):
+        return PostgresSearch()
+    return LikeSearch()
+
+
+def filter_query(query, search_query):
+    """Restrict a ``DiaryEntry`` query to entries matching ``search_query``."""
+    ids = get_search().matching_ids(search_query)
+    if ids is None:
+        return query
+    return query.filter(DiaryEntry.id.in_(ids))
+
+
+def _register_ddl(table):
+    """Create and drop the index objects together with ``diary_entries``."""
+    for statement in SQLITE_DDL:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in SQLITE_DROP:
+        event.listen(table, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
+    for statement in POSTGRES_DDL:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+_register_ddl(DiaryEntry.__table__)
+
+
+search_cli = AppGroup("search-index", help="Manage the diary full-text index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Create the full-text index if missing and rebuild it from the entries."""
+    search = get_search()
+    search.rebuild()
+    click.echo(f"Rebuilt the {search.name} index.")
+
+
+def init_app(app):
+    """Register the index commands.
+
+    Config:
+        SEARCH_FULL_TEXT: Use the database's full-text index; False falls
+            back to ``ilike`` (default: True)
+    """
+    app.cli.add_command(search_cli)
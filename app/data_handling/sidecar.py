@@ -0,0 +1,244 @@
+"""
+Local inference sidecar shared by all web workers on a host.
+
+Without it every gunicorn worker that analyzes entries loads its own copy of
+the model. ``flask inference-server`` starts one process that owns the
+model and serves batched classification requests over a Unix domain socket;
+web workers set ``EMOTION_SIDECAR_SOCKET`` and send their texts there through
+``SidecarClient`` instead of loading the model themselves.
+
+Framing: every message is a 4-byte big-endian length followed by that many
+bytes of UTF-8 JSON. Requests are ``{"texts": [...]}`` (or ``{"op": "status"}``)
+and responses are ``{"results": [...]}`` or ``{"error": "..."}``.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import click
+
+from .batching import BatchDispatcher
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class SidecarUnavailable(RuntimeError):
+    """Raised when the inference sidecar cannot be reached or fails."""
+
+
+def send_frame(sock, payload):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the limit")
+    return json.loads(_recv_exactly(sock, size).decode("utf-8"))
+
+
+class SidecarClient:
+    """Client used by web workers to classify texts through the sidecar.
+
+    Each thread keeps its own persistent connection, so concurrent workers
+    send requests in parallel and the server can batch them together. A
+    refused, reset or closed connection is re-opened and the request retried
+    once. A timeout is not retried: the server may still be working on the
+    request, and sending it again would only add to its load.
+
+    Args:
+        socket_path (str): Path of the server's Unix socket
+        timeout (float): Seconds to wait for connect and for each response
+    """
+
+    def __init__(self, socket_path, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def request(self, payload):
+        """Send one request and return the decoded response."""
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._connect()
+                send_frame(sock, payload)
+                response = recv_frame(sock)
+                break
+            except (socket.timeout, ValueError) as e:
+                # Slow or out of sync: drop the connection, but do not resend
+                self.close()
+                raise SidecarUnavailable(
+                    f"Inference sidecar at {self.socket_path} unavailable: {e}"
+                ) from e
+            except OSError as e:
+                # Server restarted or the connection went stale: reconnect
+                self.close()
+                if attempt:
+                    raise SidecarUnavailable(
+                        f"Inference sidecar at {self.socket_path} unavailable: {e}"
+                    ) from e
+        if "error" in response:
+            raise SidecarUnavailable(f"Inference sidecar error: {response['error']}")
+        return response
+
+    def classify(self, texts):
+        """Return one score list per text, like a batched pipeline call."""
+        return self.request({"texts": list(texts)})["results"]
+
+    def status(self):
+        return self.request({"op": "status"})["status"]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.server.connections.add(self.request)
+
+    def finish(self):
+        self.server.connections.discard(self.request)
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                message = recv_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                if message.get("op") == "status":
+                    response = {"status": server.status()}
+                else:
+                    futures = server.dispatcher.submit_many(message["texts"])
+                    response = {"results": [f.result() for f in futures]}
+            except Exception as e:
+                logger.exception("Inference request failed")
+                response = {"error": str(e)}
+            try:
+                send_frame(self.request, response)
+            except OSError:
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running a single model for every client.
+
+    Requests from all connections are fed through one ``BatchDispatcher``,
+    so texts sent concurrently by different web workers share forward passes.
+
+    Args:
+        socket_path (str): Where to bind the socket
+        classify: Callable taking a list of texts, returning one result each
+        status: Callable returning a JSON-serialisable status dict
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, classify, status=dict, max_batch_size=16,
+                 max_wait_ms=10):
+        self.dispatcher = BatchDispatcher(
+            classify, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+        )
+        self.status = lambda: {**status(), "batching": self.dispatcher.stats()}
+        self.connections = set()
+        _remove_stale_socket(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+    def server_close(self):
+        super().server_close()
+        # Drop open client connections too, so clients notice and reconnect
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def _remove_stale_socket(socket_path):
+    """Delete a socket file left by a dead server, refusing to steal a live one."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+    else:
+        raise RuntimeError(f"An inference server is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+@click.command("inference-server")
+@click.option("--socket", "socket_path", default=None,
+              help="Socket path (default: EMOTION_SIDECAR_SOCKET).")
+def inference_server_command(socket_path):
+    """Serve the emotion model to local web workers over a Unix socket."""
+    from flask import current_app
+    from . import analysis
+
+    config = current_app.config
+    socket_path = socket_path or config.get("EMOTION_SIDECAR_SOCKET")
+    if not socket_path:
+        raise click.UsageError("Pass --socket or set EMOTION_SIDECAR_SOCKET.")
+
+    # This process owns the model, so it must not forward to itself
+    classifier = analysis.emotion_classifier
+    classifier.use_sidecar(None)
+    click.echo(f"Loading {classifier.model_name} ({classifier.backend})...")
+    classifier.load()
+
+    server = InferenceServer(
+        socket_path,
+        analysis.classify_batch,
+        status=classifier.status,
+        max_batch_size=config.get("ANALYSIS_BATCH_MAX_SIZE", 16),
+        max_wait_ms=config.get("ANALYSIS_BATCH_MAX_WAIT_MS", 10),
+    )
+    click.echo(f"Serving emotion analysis on {socket_path} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
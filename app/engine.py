@@ -0,0 +1,45 @@
+"""
+Per-connection database setup.
+
+SQLite starts every connection with default pragmas: a rollback journal, in
+which one writer blocks every reader, a small page cache and no busy
+timeout of its own. ``init_app`` applies ``SQLITE_PRAGMAS`` from the config
+to each new connection of the app's SQLite engines. Other databases are left
+alone; their pool is configured through ``SQLALCHEMY_ENGINE_OPTIONS``.
+"""
+
+from sqlalchemy import event
+
+from .extensions import db
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Run ``PRAGMA name = value`` for each item on a raw sqlite3 connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def init_app(app):
+    """Register the connect hook; call right after ``db.init_app``.
+
+    Config:
+        SQLITE_PRAGMAS: Pragmas for new SQLite connections (default: WAL,
+            synchronous=NORMAL and the rest of ``Config.SQLITE_PRAGMAS``;
+            none when the setting is left out)
+    """
+    pragmas = app.config.get("SQLITE_PRAGMAS")
+    if not pragmas:
+        return
+    with app.app_context():
+        # Registered before anything connects, so every pooled connection has them
+        for engine in db.engines.values():
+            if engine.dialect.name != "sqlite":
+                continue
+
+            @event.listens_for(engine, "connect")
+            def _on_connect(dbapi_connection, connection_record):
+                apply_sqlite_pragmas(dbapi_connection, pragmas)
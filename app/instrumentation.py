@@ -0,0 +1,143 @@
+"""
+Per-request SQL instrumentation.
+
+Engine events time every statement the app sends. For each request the
+number of queries and their total time are:
+
+* reported in a ``Server-Timing`` header (``db;dur=3.2;desc="7 queries"``),
+  which browser dev tools show next to the request;
+* checked for N+1 patterns: a statement shape (the SQL with its parameters
+  left as placeholders) that runs more than ``SQL_N_PLUS_ONE_THRESHOLD``
+  times in one request is logged as a warning, usually a lazy load inside
+  a template loop that wants ``selectinload``.
+
+``record_queries()`` collects the same numbers for any block of code, which
+is what the tests' query budgets are built on.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from .extensions import db
+
+# "IN (?, ?, ?)" and "IN (?, ?)" are the same shape
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+|%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+")
+_START_KEY = "instrumentation_query_start"
+
+_recorders = threading.local()
+
+
+class QueryStats:
+    """Queries seen while recording: count, total time and statement shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.statements = []
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        self.statements.append(statement)
+
+    def repeated(self, threshold):
+        """Statement shapes that ran more than ``threshold`` times, most first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+
+def statement_shape(statement):
+    """SQL text with whitespace and placeholder lists collapsed."""
+    return _PLACEHOLDER_LIST.sub("?", " ".join(statement.split()))
+
+
+@contextmanager
+def record_queries():
+    """Collect the statements sent by this thread inside the block.
+
+    Usage::
+
+        with record_queries() as stats:
+            client.get("/home")
+        assert stats.count <= 5
+    """
+    stats = QueryStats()
+    stack = _recorders.__dict__.setdefault("stack", [])
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.remove(stats)
+
+
+def _active_stats():
+    stats = list(getattr(_recorders, "stack", ()))
+    if has_request_context() and "sql_stats" in g:
+        stats.append(g.sql_stats)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info[_START_KEY].pop()
+    elapsed = time.perf_counter() - started
+    for stats in _active_stats():
+        stats.add(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(_START_KEY):
+        connection.info[_START_KEY].pop()
+
+
+def init_app(app):
+    """Instrument the app's engines and report per request.
+
+    Config:
+        SQL_INSTRUMENTATION: Count and time queries per request (default: True)
+        SQL_SERVER_TIMING: Send the ``Server-Timing`` header (default: True)
+        SQL_N_PLUS_ONE_THRESHOLD: Warn when one statement shape runs more
+            than this many times in a request (default: 10)
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+                event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+                event.listen(engine, "handle_error", _handle_error)
+
+    if not app.config.get("SQL_INSTRUMENTATION", True):
+        return
+
+    @app.before_request
+    def _start_recording():
+        g.sql_stats = QueryStats()
+
+    @app.after_request
+    def _report(response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+        for shape, n in stats.repeated(app.config.get("SQL_N_PLUS_ONE_THRESHOLD", 10)):
+            app.logger.warning(
+                "Possible N+1 query in %s %s: ran %d times: %s",
+                request.method, request.path, n, shape,
+            )
+        if app.config.get("SQL_SERVER_TIMING", True):
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"',
+            )
+        return response
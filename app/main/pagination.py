@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination for the diary dashboards.
+
+Instead of OFFSET, each page continues strictly after the last row of the
+previous one: ``WHERE (sort_key, id) > (last_sort_key, last_id)`` in the
+requested direction. ``id`` breaks ties so rows with equal sort keys are
+neither skipped nor repeated, and the cost of a page does not grow with how
+far the user has scrolled.
+
+Cursors are opaque URL-safe strings encoding the last row's sort key and id.
+"""
+
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from app.models import DiaryEntry
+
+# Mood scores are in [0, 1]; unanalyzed entries sort as if they scored this,
+# i.e. after every analyzed entry for mood_asc and before them for mood_desc
+_NO_MOOD = 2.0
+
+SortSpec = namedtuple("SortSpec", "column descending value decode")
+
+SORTS = {
+    "created_desc": SortSpec(
+        DiaryEntry.created_at, True, lambda d: d.created_at.isoformat(),
+        datetime.fromisoformat,
+    ),
+    "created_asc": SortSpec(
+        DiaryEntry.created_at, False, lambda d: d.created_at.isoformat(),
+        datetime.fromisoformat,
+    ),
+    "title_asc": SortSpec(DiaryEntry.title, False, lambda d: d.title, str),
+    "title_desc": SortSpec(DiaryEntry.title, True, lambda d: d.title, str),
+    "mood_asc": SortSpec(
+        func.coalesce(DiaryEntry.dominant_emotion_score, _NO_MOOD), False,
+        lambda d: d.dominant_emotion_score if d.dominant_emotion_score is not None else _NO_MOOD,
+        float,
+    ),
+    "mood_desc": SortSpec(
+        func.coalesce(DiaryEntry.dominant_emotion_score, _NO_MOOD), True,
+        lambda d: d.dominant_emotion_score if d.dominant_emotion_score is not None else _NO_MOOD,
+        float,
+    ),
+}
+DEFAULT_SORT = "created_desc"
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that cannot be decoded."""
+
+
+def encode_cursor(sort_value, diary_id):
+    raw = json.dumps([sort_value, diary_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, spec):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, diary_id = json.loads(base64.urlsafe_b64decode(padded))
+        return spec.decode(sort_value), int(diary_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def paginate(query, sort_by=DEFAULT_SORT, cursor=None, per_page=24):
+    """Return one page of ``query`` in ``sort_by`` order.
+
+    Args:
+        query: ``DiaryEntry`` query with filters applied but no ordering
+        sort_by (str): Key of ``SORTS``; unknown values use the default
+        cursor (str): ``next_cursor`` of the previous page, or None
+        per_page (int): Rows per page
+
+    Returns:
+        tuple: ``(entries, next_cursor, sort_by)``; ``next_cursor`` is None
+        on the last page
+
+    Raises:
+        InvalidCursor: If ``cursor`` is malformed
+    """
+    if sort_by not in SORTS:
+        sort_by = DEFAULT_SORT
+    spec = SORTS[sort_by]
+
+    if spec.descending:
+        query = query.order_by(spec.column.desc(), DiaryEntry.id.desc())
+    else:
+        query = query.order_by(spec.column.asc(), DiaryEntry.id.asc())
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, spec)
+        if spec.descending:
+            after = or_(
+                spec.column < last_value,
+                and_(spec.column == last_value, DiaryEntry.id < last_id),
+            )
+        else:
+            after = or_(
+                spec.column > last_value,
+                and_(spec.column == last_value, DiaryEntry.id > last_id),
+            )
+        query = query.filter(after)
+
+    # One extra row tells us whether there is another page
+    rows = query.limit(per_page + 1).all()
+    entries = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = entries[-1]
+        next_cursor = encode_cursor(spec.value(last), last.id)
+    return entries, next_cursor, sort_by
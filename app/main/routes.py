@@ -1,8 +1,10 @@
 # app/main/routes.py
-from flask import render_template, request
+from flask import abort, current_app, jsonify, render_template, request, url_for
 from flask_login import login_required, current_user
+from sqlalchemy.orm import defer, selectinload
 
-from . import bp
+from . import bp, pagination
+from app.data_handling import search
 from app.models import DiaryEntry
 
 
@@ -13,72 +15,115 @@ def index():
     return render_template("index.html")
 
 
-@bp.route("/home")
-@login_required
-def home():
-    # 1. Get filter and sort parameters from the query string
+def _home_query():
+    """Current user's diaries, filtered by the request's query string."""
     emotion_tag = request.args.get("emotion_tag", None)
-    sort_by_param = request.args.get("sort_by", "created_desc")  # Default sort
     search_query = request.args.get("search", None)  # For server-side search
 
-    # Base query for the current user's diaries
-    query = DiaryEntry.query.filter_by(owner_id=current_user.id)
+    # Base query for the current user's diaries; cards show the stored
+    # preview, so the full content is never loaded
+    query = DiaryEntry.query.filter_by(owner_id=current_user.id).options(
+        defer(DiaryEntry.content, raiseload=True)
+    )
 
-    # 2. Apply emotion filter if provided
+    # Apply emotion filter if provided
     if emotion_tag:
         query = query.filter(DiaryEntry.dominant_emotion_label == emotion_tag)
 
-    # 3. Apply search filter if provided (for server-side search)
+    # Apply search filter if provided, through the full-text index
     if search_query:
-        # Basic search on title and content.
-        # For more advanced search, consider Flask-WhooshAlchemy or similar.
-        search_term = f"%{search_query}%"
-        query = query.filter(
-            (DiaryEntry.title.ilike(search_term))
-            | (DiaryEntry.content.ilike(search_term))
+        query = search.filter_query(query, search_query)
+    return query
+
+
+def _shared_query():
+    # Shared cards show the owner's name; load the page's owners in one query
+    return DiaryEntry.shared_with_user(current_user.id).options(
+        defer(DiaryEntry.content, raiseload=True), selectinload(DiaryEntry.owner)
+    )
+
+
+def _page(query):
+    """Apply keyset pagination from the ``sort_by`` and ``cursor`` parameters.
+
+    Returns:
+        tuple: ``(diaries, next_cursor, sort_by)`` as from ``pagination.paginate``
+    """
+    try:
+        return pagination.paginate(
+            query,
+            sort_by=request.args.get("sort_by", pagination.DEFAULT_SORT),
+            cursor=request.args.get("cursor"),
+            per_page=current_app.config.get("DIARIES_PER_PAGE", 24),
         )
+    except pagination.InvalidCursor:
+        abort(400, description="Invalid cursor")
+
+
+def _next_url(endpoint, next_cursor):
+    """URL of the JSON page after this one, keeping filters and sort order."""
+    if not next_cursor:
+        return None
+    return url_for(endpoint, **{**request.args.to_dict(), "cursor": next_cursor})
+
+
+def _page_json(diaries, next_cursor, card_template, endpoint):
+    """JSON page for infinite scroll; each item carries its rendered card."""
+    return jsonify(
+        {
+            "items": [
+                {
+                    "id": diary.id,
+                    "title": diary.title,
+                    "created_at": diary.created_at.isoformat(),
+                    "dominant_emotion_label": diary.dominant_emotion_label,
+                    "dominant_emotion_score": diary.dominant_emotion_score,
+                    "html": render_template(card_template, diary=diary),
+                }
+                for diary in diaries
+            ],
+            "next_cursor": next_cursor,
+            "next_url": _next_url(endpoint, next_cursor),
+        }
+    )
 
-    # 4. Apply sorting based on sort_by_param
-    if sort_by_param == "created_asc":
-        query = query.order_by(DiaryEntry.created_at.asc())
-    elif sort_by_param == "title_asc":
-        query = query.order_by(DiaryEntry.title.asc())
-    elif sort_by_param == "title_desc":
-        query = query.order_by(DiaryEntry.title.desc())
-    elif sort_by_param == "mood_asc":
-        # Assuming dominant_emotion_score is a field you can sort by directly
-        # Handle cases where it might be None if necessary, e.g., using nullsfirst() or nullslast()
-        query = query.order_by(DiaryEntry.dominant_emotion_score.asc().nullslast())
-    elif sort_by_param == "mood_desc":
-        query = query.order_by(DiaryEntry.dominant_emotion_score.desc().nullsfirst())
-    else:  # Default sort (created_desc)
-        query = query.order_by(DiaryEntry.created_at.desc())
-        sort_by_param = "created_desc"  # Ensure default is reflected in template
-
-    # Get page number for pagination (if you implement it)
-    # page = request.args.get('page', 1, type=int)
-    # diaries_paginated = query.paginate(page=page, per_page=9) # Example: 9 diaries per page
-    # diaries = diaries_paginated.items
-
-    # For now, without pagination, just get all matching diaries
-    diaries = query.all()
 
+@bp.route("/home")
+@login_required
+def home():
+    # Only the first page is rendered; the rest is fetched from home_page
+    diaries, next_cursor, sort_by_param = _page(_home_query())
     return render_template(
         "dashboard/home.html",
         diaries=diaries,
-        # diaries_paginated=diaries_paginated, # If using pagination
-        current_emotion_filter=emotion_tag,
+        next_url=_next_url("main.home_page", next_cursor),
+        current_emotion_filter=request.args.get("emotion_tag", None),
         current_sort_by=sort_by_param,  # Pass the current sort option
-        # current_search_query=search_query # If using server-side search
     )
 
 
+@bp.route("/home/page")
+@login_required
+def home_page():
+    """Next page of the home dashboard as JSON, for infinite scroll."""
+    diaries, next_cursor, _ = _page(_home_query())
+    return _page_json(diaries, next_cursor, "dashboard/_diary_card.html", "main.home_page")
+
+
 @bp.route("/shared")
 @login_required
 def shared():
-    diaries = (
-        DiaryEntry.query.filter(DiaryEntry.shared_with.any(id=current_user.id))
-        .order_by(DiaryEntry.created_at.desc())
-        .all()
+    diaries, next_cursor, _ = _page(_shared_query())
+    return render_template(
+        "dashboard/shared.html",
+        diaries=diaries,
+        next_url=_next_url("main.shared_page", next_cursor),
     )
-    return render_template("dashboard/shared.html", diaries=diaries)
+
+
+@bp.route("/shared/page")
+@login_required
+def shared_page():
+    """Next page of the shared dashboard as JSON, for infinite scroll."""
+    diaries, next_cursor, _ = _page(_shared_query())
+    return _page_json(diaries, next_cursor, "dashboard/_shared_card.html", "main.shared_page")
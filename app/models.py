@@ -5,11 +5,57 @@ This module defines the SQLAlchemy models for users, diary entries,
 and their relationships.
 """
 
+from collections import namedtuple
+from datetime import datetime, timezone
+
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask import has_request_context, request
 from flask_login import UserMixin
-from sqlalchemy import func, or_
+from markupsafe import Markup
+from sqlalchemy import and_, case, func, or_, tuple_, union
+from sqlalchemy.orm import joinedload, validates
 from .extensions import db, login_manager
 
+# Emotion labels in stored order: ``DiaryEntry.score_<label>`` columns and
+# ``DiaryEntry.dominant_emotion_code`` values follow it. The same seven
+# labels as ``app.data_handling.analyzers.LABELS``
+EMOTION_LABELS = ("anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise")
+EMOTION_CODES = {label: code for code, label in enumerate(EMOTION_LABELS)}
+SCORE_COLUMNS = tuple(f"score_{label}" for label in EMOTION_LABELS)
+
+# Characters of plain text kept in ``DiaryEntry.preview`` for list views
+PREVIEW_LENGTH = 150
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def make_preview(content):
+    """Plain-text preview of diary content: tags stripped, whitespace collapsed."""
+    text = Markup(content or "").striptags()
+    if len(text) > PREVIEW_LENGTH:
+        return text[:PREVIEW_LENGTH].rstrip() + "..."
+    return text
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``.
+
+    Trailing U+10FFFF characters cannot be incremented and are dropped, then
+    the last character is incremented, skipping the surrogate range, which
+    never appears in stored text. Returns None if nothing is left (a prefix
+    made only of U+10FFFF), in which case the range has no upper end.
+    """
+    stripped = prefix.rstrip(chr(0x10FFFF))
+    if not stripped:
+        return None
+    code = ord(stripped[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return stripped[:-1] + chr(code)
+
+
 # association table for shared diaries
 diary_shares = db.Table(
     "diary_shares",
@@ -18,6 +64,9 @@ diary_shares = db.Table(
         "diary_id", db.Integer, db.ForeignKey("diary_entries.id"), primary_key=True
     ),
     db.Column("shared_at", db.DateTime, server_default=func.now()),
+    # The primary key serves "shared with this user"; this serves "who is
+    # this diary shared with"
+    db.Index("ix_diary_shares_diary_id", "diary_id", "user_id"),
 )
 
 
@@ -33,9 +82,21 @@ class User(UserMixin, db.Model):
         shared_diaries (relationship): Diaries shared with this user
     """
     __tablename__ = "users"
+    __table_args__ = (
+        # search_by_prefix ranges over the key and pages in (key, username)
+        # order
+        db.Index("ix_users_username_key", "username_key", "username"),
+    )
+
+    # Page sizes of search_by_prefix
+    SEARCH_LIMIT = 20
+    SEARCH_MAX_LIMIT = 50
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(32), index=True, unique=True, nullable=False)
+    # Lower-cased username for case-insensitive search, kept in step with it
+    # by ``_update_username_key``
+    username_key = db.Column(db.String(32), nullable=True)
     email = db.Column(db.String(32), index=True, unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
 
@@ -56,6 +117,11 @@ class User(UserMixin, db.Model):
         if email:
             self.email = email
 
+    @validates("username")
+    def _update_username_key(self, key, username):
+        self.username_key = username.lower() if username is not None else None
+        return username
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -65,6 +131,54 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f"<User {self.username!r}>"
 
+    @classmethod
+    def search_by_prefix(cls, prefix, after=None, limit=None, exclude_id=None):
+        """
+        Users whose username starts with ``prefix``, ignoring case, in
+        case-insensitive username order.
+
+        The lower-cased prefix becomes a range on the ``username_key`` index,
+        so the cost depends on ``limit`` rather than on the number of users.
+
+        Args:
+            prefix (str): Start of the username; empty matches everyone
+            after (str): Cursor; only usernames after this one
+            limit (int): Page size, capped at ``SEARCH_MAX_LIMIT``
+            exclude_id (int): User to leave out, usually the caller
+
+        Returns:
+            tuple: ``(users, next_cursor)``; ``next_cursor`` is None on the
+            last page
+        """
+        limit = max(1, min(limit or cls.SEARCH_LIMIT, cls.SEARCH_MAX_LIMIT))
+        query = cls.query
+        prefix = prefix.lower()
+        if prefix:
+            # [prefix, prefix_upper_bound(prefix)), narrowed by the LIKE
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.filter(
+                cls.username_key >= prefix,
+                cls.username_key.like(escaped + "%", escape="\\"),
+            )
+            upper = prefix_upper_bound(prefix)
+            if upper is not None:
+                query = query.filter(cls.username_key < upper)
+        if after:
+            # Usernames differing only in case share a key; the username
+            # itself breaks the tie
+            after_key = after.lower()
+            query = query.filter(
+                or_(
+                    cls.username_key > after_key,
+                    and_(cls.username_key == after_key, cls.username > after),
+                )
+            )
+        if exclude_id is not None:
+            query = query.filter(cls.id != exclude_id)
+        users = query.order_by(cls.username_key, cls.username).limit(limit + 1).all()
+        next_cursor = users[limit - 1].username if len(users) > limit else None
+        return users[:limit], next_cursor
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -74,13 +188,34 @@ def load_user(user_id):
 class DiaryEntry(db.Model):
     __tablename__ = "diary_entries"
 
+    # Access levels returned by get_accessible
+    OWNER = "owner"
+    SHARED = "shared"
+    # Dashboard queries filter by owner first, then sort or aggregate by date
+    __table_args__ = (
+        db.Index("ix_diary_entries_owner_created", "owner_id", "created_at"),
+        db.Index(
+            "ix_diary_entries_owner_emotion_created",
+            "owner_id",
+            "dominant_emotion_label",
+            "created_at",
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
     title = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False)
-
-    created_at = db.Column(db.DateTime, server_default=func.now(), index=True)
+    # Shown on dashboard cards so list queries can defer ``content``;
+    # kept in step with it by ``_update_preview``
+    preview = db.Column(db.String(PREVIEW_LENGTH + 3), nullable=True)
+
+    # Written from Python, so SQLite stores it in the same text format as
+    # bound datetime parameters (CURRENT_TIMESTAMP has no fractional part,
+    # and SQLite compares the two as strings); the server default only
+    # covers rows inserted outside SQLAlchemy
+    created_at = db.Column(db.DateTime, default=_utcnow, server_default=func.now(), index=True)
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
 
     # --- Emotion Analysis Fields ---
@@ -88,12 +223,23 @@ class DiaryEntry(db.Model):
     # Store the label of the dominant (highest score) emotion
     dominant_emotion_label = db.Column(db.String(64), nullable=True, index=True)
 
+    # Index of the dominant label in EMOTION_LABELS, or None for a label
+    # outside them; kept in step with the label by ``_update_emotion_code``
+    dominant_emotion_code = db.Column(db.SmallInteger, nullable=True, index=True)
+
     # Store the score of the dominant emotion
     dominant_emotion_score = db.Column(db.Float, nullable=True, index=True)
 
-    # Store the full list of emotion labels and scores as JSON
-    # Use SQLAlchemy's JSON type, which handles backend differences (including SQLite)
-    emotion_details_json = db.Column(db.JSON, nullable=True)
+    # Store the full score distribution, one column per label in
+    # EMOTION_LABELS order, so scores can be aggregated in SQL and loaded
+    # without parsing; ``emotion_details`` gives the old list of dicts
+    score_anger = db.Column(db.Float, nullable=True)
+    score_disgust = db.Column(db.Float, nullable=True)
+    score_fear = db.Column(db.Float, nullable=True)
+    score_joy = db.Column(db.Float, nullable=True)
+    score_neutral = db.Column(db.Float, nullable=True)
+    score_sadness = db.Column(db.Float, nullable=True)
+    score_surprise = db.Column(db.Float, nullable=True)
 
     # Flag to indicate if analysis has been performed
     analyzed = db.Column(
@@ -104,57 +250,172 @@ class DiaryEntry(db.Model):
         index=True,
     )
 
+    # Identifies the model that produced the stored analysis, so backfills
+    # can target entries analyzed by an older model
+    analysis_model_version = db.Column(db.String(255), nullable=True, index=True)
+
+    # Which analyzer produced the stored analysis ("transformer", "lexicon");
+    # entries scored by a fallback can be re-scored later
+    analysis_source = db.Column(db.String(32), nullable=True, index=True)
+
+    analysis_jobs = db.relationship(
+        "AnalysisJob", backref="diary", lazy="dynamic", cascade="all, delete-orphan"
+    )
+    paragraphs = db.relationship(
+        "DiaryParagraph",
+        backref="diary",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+        order_by="DiaryParagraph.position",
+    )
+
     def __repr__(self):
         return f"<DiaryEntry {self.id} owner={self.owner.username!r}>"
 
-    # Update Emotion Data 
-    def update_emotion_analysis(self, analysis_result):
+    @validates("content")
+    def _update_preview(self, key, content):
+        self.preview = make_preview(content)
+        return content
+
+    @property
+    def emotion_details(self):
+        """Stored scores as ``[{'label': 'joy', 'score': 0.9}, ...]``, highest first.
+
+        None if the entry has no scores.
         """
-        Updates the diary entry with emotion analysis results.
+        details = [
+            {"label": label, "score": getattr(self, column)}
+            for label, column in zip(EMOTION_LABELS, SCORE_COLUMNS)
+            if getattr(self, column) is not None
+        ]
+        details.sort(key=lambda item: item["score"], reverse=True)
+        return details or None
+
+    @validates("dominant_emotion_label")
+    def _update_emotion_code(self, key, label):
+        self.dominant_emotion_code = EMOTION_CODES.get(label)
+        return label
+
+    @staticmethod
+    def emotion_fields(analysis_result, model_version=None, source=None):
+        """
+        Maps an emotion analysis result to column values.
 
         Args:
             analysis_result: The raw result from your analysis, expected to be
                              like [[{'label': 'anger', 'score': 0.01}, ...]]
+            model_version: Identifier of the model that produced the result
+            source: Name of the analyzer that produced the result
+
+        Returns:
+            dict: Values for the emotion columns, always with analyzed=True
         """
+        fields = {
+            "dominant_emotion_label": None,
+            "dominant_emotion_code": None,
+            "dominant_emotion_score": None,
+            **dict.fromkeys(SCORE_COLUMNS),
+            "analyzed": True,  # Mark as analyzed, even if result was empty/invalid
+            "analysis_model_version": model_version,
+            "analysis_source": source,
+        }
         if (
             not analysis_result
             or not isinstance(analysis_result, list)
             or not analysis_result[0]
         ):
             # Handle empty or invalid results
-            self.dominant_emotion_label = None
-            self.dominant_emotion_score = None
-            self.emotion_details_json = None
-            self.analyzed = True  # Mark as analyzed, even if result was empty/invalid
-            return False
+            return fields
 
         # Our input is [[{...}, {...}]], we need the inner list [{...}, {...}]
         emotion_scores = analysis_result[0]  # Get the actual list of scores
 
-        if not emotion_scores:
-            # Handle empty inner list
-            self.dominant_emotion_label = None
-            self.dominant_emotion_score = None
-            self.emotion_details_json = None
-            self.analyzed = True
-            return False
-
         # Find dominant emotion
         dominant_emotion = max(emotion_scores, key=lambda item: item["score"])
 
-        # Update fields
-        self.dominant_emotion_label = dominant_emotion["label"]
-        self.dominant_emotion_score = dominant_emotion["score"]
-        self.emotion_details_json = emotion_scores  # Store the list of dicts
-        self.analyzed = True
+        fields["dominant_emotion_label"] = dominant_emotion["label"]
+        fields["dominant_emotion_code"] = EMOTION_CODES.get(dominant_emotion["label"])
+        fields["dominant_emotion_score"] = dominant_emotion["score"]
+        for item in emotion_scores:
+            # Labels outside EMOTION_LABELS have no column; they can still be dominant
+            if item["label"] in EMOTION_CODES:
+                fields[f"score_{item['label']}"] = item["score"]
+        return fields
 
-        return True
+    # Update Emotion Data 
+    def update_emotion_analysis(self, analysis_result, model_version=None, source=None):
+        """
+        Updates the diary entry with emotion analysis results.
+
+        Args:
+            analysis_result: The raw result from your analysis, expected to be
+                             like [[{'label': 'anger', 'score': 0.01}, ...]]
+            model_version: Identifier of the model that produced the result
+            source: Name of the analyzer that produced the result
+
+        Returns:
+            bool: False if the result was empty or invalid
+        """
+        fields = self.emotion_fields(analysis_result, model_version, source)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return fields["dominant_emotion_label"] is not None
 
     @classmethod
     def for_user(cls, user_id):
-        return cls.query.filter(
-            or_(cls.owner_id == user_id, cls.shared_with.any(id=user_id))
-        ).order_by(cls.created_at.desc())
+        # A UNION of two index lookups; OR-ing the owner test with an EXISTS
+        # on the shares would scan every entry
+        accessible = union(
+            db.select(cls.id).where(cls.owner_id == user_id),
+            db.select(diary_shares.c.diary_id).where(diary_shares.c.user_id == user_id),
+        )
+        return cls.query.filter(cls.id.in_(accessible)).order_by(cls.created_at.desc())
+
+    @classmethod
+    def shared_with_user(cls, user_id):
+        """Entries shared with ``user_id``, through the shares primary key."""
+        return cls.query.join(diary_shares, diary_shares.c.diary_id == cls.id).filter(
+            diary_shares.c.user_id == user_id
+        )
+
+    @classmethod
+    def get_accessible(cls, diary_id, user):
+        """
+        Loads an entry, its owner and ``user``'s access level in one query.
+
+        Within a request the answer is remembered, so later checks for the
+        same entry and user (including ``is_shared_with_user``) are free.
+
+        Returns:
+            tuple: ``(entry, access)``; ``entry`` is None if it does not
+            exist, ``access`` is ``OWNER``, ``SHARED`` or None
+        """
+        try:
+            diary_id = int(diary_id)
+        except (TypeError, ValueError):
+            return None, None
+        cache = _access_cache()
+        key = (diary_id, user.id)
+        if key in cache:
+            return cache[key]
+
+        access = case(
+            (cls.owner_id == user.id, cls.OWNER),
+            (diary_shares.c.user_id.isnot(None), cls.SHARED),
+            else_=None,
+        )
+        row = db.session.execute(
+            db.select(cls, access)
+            .outerjoin(
+                diary_shares,
+                and_(diary_shares.c.diary_id == cls.id, diary_shares.c.user_id == user.id),
+            )
+            .options(joinedload(cls.owner))
+            .where(cls.id == diary_id)
+        ).first()
+        result = (row[0], row[1]) if row else (None, None)
+        cache[key] = result
+        return result
 
     # Methods for Managing Diary Sharing
 
@@ -167,6 +428,9 @@ class DiaryEntry(db.Model):
         # owner cannot be in shared_with list
         if self.owner_id == user_to_check.id:
             return False
+        cached = _access_cache().get((self.id, user_to_check.id))
+        if cached is not None:
+            return cached[1] == self.SHARED
         return self.shared_with.filter(User.id == user_to_check.id).first() is not None
 
     def share_with_user(self, user_to_share: User) -> bool:
@@ -184,6 +448,7 @@ class DiaryEntry(db.Model):
 
         if not self.is_shared_with_user(user_to_share):
             self.shared_with.append(user_to_share)
+            _access_cache().clear()
             return True
         return False
 
@@ -201,6 +466,7 @@ class DiaryEntry(db.Model):
 
         if self.is_shared_with_user(user_to_unshare):
             self.shared_with.remove(user_to_unshare)
+            _access_cache().clear()
             # db.session.add(self)
             # db.session.commit()
             return True
@@ -211,3 +477,245 @@ class DiaryEntry(db.Model):
         Returns a list of User objects with whom this diary entry is shared.
         """
         return self.shared_with.all()
+
+    def set_shared_usernames(self, usernames) -> "ShareChanges":
+        """
+        Makes the entry shared with exactly ``usernames``: shares with new
+        ones and unshares from everyone else, in at most four queries.
+        The caller is responsible for committing.
+        """
+        _access_cache().clear()
+        user_ids = _user_ids_by_name(usernames)
+        wanted = set(user_ids.values()) - {self.owner_id}
+        current = set(
+            db.session.scalars(
+                db.select(diary_shares.c.user_id).where(diary_shares.c.diary_id == self.id)
+            )
+        )
+        added = _insert_shares([(self.id, user_id) for user_id in wanted - current])
+        removed = _delete_shares(self.id, current - wanted)
+        return ShareChanges(added, removed, sorted(set(usernames) - set(user_ids)))
+
+    @classmethod
+    def share_many(cls, diary_ids, usernames, unshare=False) -> "ShareChanges":
+        """
+        Shares (or unshares) every diary in ``diary_ids`` with every user in
+        ``usernames`` in a constant number of queries. Owners are skipped.
+        The caller is responsible for checking ownership and committing.
+        """
+        _access_cache().clear()
+        user_ids = _user_ids_by_name(usernames)
+        missing = sorted(set(usernames) - set(user_ids))
+        owners = dict(
+            db.session.execute(
+                db.select(cls.id, cls.owner_id).where(cls.id.in_(list(diary_ids)))
+            ).all()
+        )
+        pairs = {
+            (diary_id, user_id)
+            for diary_id, owner_id in owners.items()
+            for user_id in user_ids.values()
+            if user_id != owner_id
+        }
+        if not pairs:
+            return ShareChanges(0, 0, missing)
+        existing = set(
+            db.session.execute(
+                db.select(diary_shares.c.diary_id, diary_shares.c.user_id).where(
+                    diary_shares.c.diary_id.in_(list(owners)),
+                    diary_shares.c.user_id.in_(list(user_ids.values())),
+                )
+            ).all()
+        )
+        if unshare:
+            removed = existing & pairs
+            if removed:
+                db.session.execute(
+                    diary_shares.delete().where(
+                        tuple_(diary_shares.c.diary_id, diary_shares.c.user_id).in_(list(removed))
+                    )
+                )
+            return ShareChanges(0, len(removed), missing)
+        return ShareChanges(_insert_shares(pairs - existing), 0, missing)
+
+
+def _access_cache():
+    """Per-request ``{(diary_id, user_id): (entry, access)}`` of access decisions."""
+    if not has_request_context():
+        return {}
+    # Kept on the request rather than ``g``: an app context that is already
+    # pushed (tests, scripts) is shared by every request made inside it
+    return request.environ.setdefault("app.diary_access", {})
+
+
+# Result of a bulk share update: numbers of share rows added and removed,
+# and the requested usernames that do not exist
+ShareChanges = namedtuple("ShareChanges", "added removed missing")
+
+
+def _user_ids_by_name(usernames):
+    """``{username: id}`` for the usernames that exist, in one query."""
+    if not usernames:
+        return {}
+    return dict(
+        db.session.execute(
+            db.select(User.username, User.id).where(User.username.in_(set(usernames)))
+        ).all()
+    )
+
+
+def _insert_shares(pairs):
+    """Insert ``(diary_id, user_id)`` share rows in one statement."""
+    if pairs:
+        db.session.execute(
+            diary_shares.insert(),
+            [{"diary_id": diary_id, "user_id": user_id} for diary_id, user_id in pairs],
+        )
+    return len(pairs)
+
+
+def _delete_shares(diary_id, user_ids):
+    """Delete the shares of one diary with ``user_ids`` in one statement."""
+    if user_ids:
+        db.session.execute(
+            diary_shares.delete().where(
+                diary_shares.c.diary_id == diary_id,
+                diary_shares.c.user_id.in_(list(user_ids)),
+            )
+        )
+    return len(user_ids)
+
+
+class AnalysisJob(db.Model):
+    """A queued request to run emotion analysis on a diary entry.
+
+    Jobs are created when an entry is saved and drained by the analysis
+    workers in ``app.data_handling.jobs``.
+
+    Attributes:
+        id (int): Primary key
+        diary_id (int): Diary entry to analyze
+        status (str): One of pending, running, done or failed
+        attempts (int): Number of times a worker has claimed the job
+        error (str): Last error message, if any
+    """
+    __tablename__ = "analysis_jobs"
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    diary_id = db.Column(
+        db.Integer, db.ForeignKey("diary_entries.id"), nullable=False, index=True
+    )
+    status = db.Column(db.String(16), nullable=False, default=PENDING, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<AnalysisJob {self.id} diary={self.diary_id} {self.status}>"
+
+
+class EmotionCacheEntry(db.Model):
+    """Persistent tier of the emotion result cache.
+
+    Rows are keyed by a hash of the normalized text plus the model name and
+    version, so results are reused across processes and restarts but never
+    across model upgrades.
+
+    Attributes:
+        key (str): SHA-256 hex digest identifying text and model
+        model_name (str): Model that produced the scores
+        scores (list): The ``[{'label': ..., 'score': ...}, ...]`` list
+        last_used_at (datetime): Last time the entry was read or written
+    """
+    __tablename__ = "emotion_result_cache"
+
+    key = db.Column(db.String(64), primary_key=True)
+    model_name = db.Column(db.String(255), nullable=False)
+    scores = db.Column(db.JSON, nullable=False)
+
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    last_used_at = db.Column(db.DateTime, server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<EmotionCacheEntry {self.key[:12]} {self.model_name!r}>"
+
+
+class BackfillCheckpoint(db.Model):
+    """Progress of a resumable ``flask reanalyze`` run.
+
+    Attributes:
+        name (str): Checkpoint name, one per concurrent backfill
+        last_id (int): Highest diary entry id already written
+        processed (int): Number of entries re-analyzed so far
+    """
+    __tablename__ = "backfill_checkpoints"
+
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BackfillCheckpoint {self.name!r} last_id={self.last_id}>"
+
+
+class DiaryParagraph(db.Model):
+    """Stored emotion scores for one paragraph of a diary entry.
+
+    Paragraphs are keyed by a hash of their normalized text and the model
+    version, so an edit only re-analyzes paragraphs that actually changed.
+
+    Attributes:
+        diary_id (int): Owning diary entry
+        position (int): Index of the paragraph within the entry
+        content_hash (str): SHA-256 of the normalized text and model version
+        weight (int): Word count, used to weight the entry-level mean
+        scores (list): The ``[{'label': ..., 'score': ...}, ...]`` list
+    """
+    __tablename__ = "diary_paragraphs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    diary_id = db.Column(
+        db.Integer, db.ForeignKey("diary_entries.id"), nullable=False, index=True
+    )
+    position = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    weight = db.Column(db.Integer, nullable=False)
+    scores = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return f"<DiaryParagraph diary={self.diary_id} #{self.position}>"
+
+
+class DailyMoodRollup(db.Model):
+    """Dominant-emotion totals per user and local (Australia/Perth) day.
+
+    Maintained in the same transaction as every change to an analyzed diary
+    entry by ``app.data_handling.rollup``, so the mood charts read a few rows
+    per day instead of aggregating every entry.
+
+    Attributes:
+        user_id (int): Owner of the counted entries
+        day (date): Local date the entries were created on
+        emotion (str): Dominant emotion label
+        entry_count (int): Entries with this dominant emotion that day
+        score_sum (float): Sum of their dominant emotion scores
+    """
+    __tablename__ = "daily_mood_rollup"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    emotion = db.Column(db.String(64), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<DailyMoodRollup user={self.user_id} {self.day} {self.emotion}={self.entry_count}>"
@@ -0,0 +1 @@
+"""Offline performance benchmarks. See the module docstrings for usage."""
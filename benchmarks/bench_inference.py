@@ -0,0 +1,235 @@
+"""
+Emotion inference benchmark.
+
+Measures model load time, peak RSS, latency percentiles and throughput of
+the classifier for synthetic diary texts of controlled lengths, across:
+
+* ``single``: one text per call, the way routes used to call the model
+* ``batched``: one pipeline call per batch, for each ``--batch-sizes`` value
+* ``bucketed``: mixed-length batches split by ``LengthBucketer``, with the
+  padding ratio before and after bucketing
+* ``dispatcher``: concurrent callers going through ``BatchDispatcher``
+* ``chunked``: long texts split into windows and aggregated
+* ``cached``: repeated texts served by the in-memory result cache
+
+Each backend runs in its own subprocess so load time and peak RSS are not
+polluted by the others. The model must already be in the local Hugging Face
+cache (set ``HF_HUB_OFFLINE=1`` to be sure nothing is downloaded).
+
+Usage, from the repository root::
+
+    python -m benchmarks.bench_inference --backends torch,torch-int8 \\
+        --lengths 32,128,512 --output bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from app.data_handling import chunking
+from app.data_handling.analysis import MODEL_NAME, EmotionClassifier
+from app.data_handling.batching import BatchDispatcher, LengthBucketer
+from app.data_handling.cache import EmotionResultCache
+from benchmarks.common import (
+    metadata,
+    peak_rss_mb,
+    percentiles,
+    synthetic_texts,
+    timed,
+    token_length,
+)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def bench_single(classifier, texts):
+    latencies = [timed(classifier, text)[1] for text in texts]
+    return {**percentiles(latencies), "texts_per_second": len(texts) / sum(latencies)}
+
+
+def bench_batched(classifier, texts, batch_size):
+    latencies = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        latencies.append(
+            timed(classifier, batch, batch_size=len(batch), truncation=True)[1]
+        )
+    return {
+        "batch_size": batch_size,
+        **percentiles(latencies),
+        "texts_per_second": len(texts) / sum(latencies),
+    }
+
+
+def bench_bucketed(classifier, texts, batch_size):
+    """Mixed-length batches, run unbucketed and bucketed."""
+    tokenizer = classifier.tokenizer
+    forward = lambda batch: classifier(batch, batch_size=len(batch), truncation=True)
+    bucketer = LengthBucketer(max_bucket_size=batch_size)
+    plain, bucketed = [], []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        lengths = [token_length(t, tokenizer) for t in batch]
+        plain.append(timed(forward, batch)[1])
+        bucketed.append(timed(bucketer.run, batch, lengths, forward)[1])
+    return {
+        "batch_size": batch_size,
+        "unbucketed": {**percentiles(plain), "texts_per_second": len(texts) / sum(plain)},
+        "bucketed": {
+            **percentiles(bucketed),
+            "texts_per_second": len(texts) / sum(bucketed),
+        },
+        **bucketer.stats(),
+    }
+
+
+def bench_dispatcher(classifier, texts, concurrency, max_batch_size, max_wait_ms):
+    dispatcher = BatchDispatcher(
+        lambda batch: classifier(batch, batch_size=len(batch), truncation=True),
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+    )
+    latencies = []
+    lock = threading.Lock()
+    chunks = [texts[i::concurrency] for i in range(concurrency)]
+
+    def client(own_texts):
+        for text in own_texts:
+            _, seconds = timed(lambda t: dispatcher.submit(t).result(), text)
+            with lock:
+                latencies.append(seconds)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in chunks]
+    _, wall = timed(lambda: ([t.start() for t in threads], [t.join() for t in threads]))
+    stats = dispatcher.stats()
+    return {
+        "concurrency": concurrency,
+        **percentiles(latencies),
+        "texts_per_second": len(texts) / wall,
+        "mean_batch_size": stats["mean_batch_size"],
+    }
+
+
+def bench_chunked(classifier, texts):
+    def analyze_long(text):
+        windows = chunking.split_windows(text, classifier.tokenizer)
+        window_texts = [w for w, _ in windows]
+        scores = classifier(window_texts, batch_size=len(window_texts), truncation=True)
+        return chunking.aggregate(scores, [n for _, n in windows])
+
+    latencies = [timed(analyze_long, text)[1] for text in texts]
+    return {**percentiles(latencies), "texts_per_second": len(texts) / sum(latencies)}
+
+
+def bench_cached(classifier, texts):
+    cache = EmotionResultCache(MODEL_NAME, persistent=False)
+    for text in texts:
+        cache.put(text, classifier(text)[0])
+    latencies = [timed(cache.get, text)[1] for text in texts]
+    return {**percentiles(latencies), "texts_per_second": len(texts) / sum(latencies)}
+
+
+def run_backend(args):
+    """Benchmark one backend in the current process."""
+    classifier = EmotionClassifier(MODEL_NAME, backend=args.backend,
+                                   model_path=args.model_path)
+    rss_before = peak_rss_mb()
+    _, load_seconds = timed(classifier.load)
+    result = {
+        "backend": args.backend,
+        "load_seconds": load_seconds,
+        "rss_after_load_mb": peak_rss_mb(),
+        "rss_before_load_mb": rss_before,
+        "lengths": [],
+    }
+    tokenizer = classifier.tokenizer
+
+    # Untimed warm-up pass so the first measurement does not include lazy init
+    classifier(synthetic_texts(2, 16, seed=999), batch_size=2)
+
+    for n_words in args.lengths:
+        texts = synthetic_texts(args.count, n_words, seed=n_words)
+        entry = {
+            "words": n_words,
+            "mean_tokens": sum(token_length(t, tokenizer) for t in texts) / len(texts),
+        }
+        if entry["mean_tokens"] > chunking.DEFAULT_MAX_TOKENS:
+            entry["chunked"] = bench_chunked(classifier, texts)
+        else:
+            entry["single"] = bench_single(classifier, texts)
+            entry["batched"] = [
+                bench_batched(classifier, texts, size) for size in args.batch_sizes
+            ]
+            entry["dispatcher"] = bench_dispatcher(
+                classifier, texts, args.concurrency, max(args.batch_sizes), args.max_wait_ms
+            )
+            entry["cached"] = bench_cached(classifier, texts)
+        result["lengths"].append(entry)
+
+    # Interleave every length so each batch mixes short and long entries
+    mixed = [
+        text
+        for group in zip(*(
+            synthetic_texts(args.count, n, seed=n)
+            for n in args.lengths if n <= chunking.DEFAULT_MAX_TOKENS
+        ))
+        for text in group
+    ]
+    if mixed:
+        result["bucketed"] = bench_bucketed(classifier, mixed, max(args.batch_sizes))
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", default="torch",
+                        help="Comma-separated list of torch, torch-int8, onnx.")
+    parser.add_argument("--model-path", default=os.environ.get("EMOTION_MODEL_PATH"),
+                        help="Local model directory (required for onnx).")
+    parser.add_argument("--lengths", type=_int_list, default=[16, 64, 256, 1500],
+                        help="Comma-separated text lengths in words.")
+    parser.add_argument("--count", type=int, default=64, help="Texts per length.")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Concurrent callers for the dispatcher variant.")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--output", help="Write JSON here instead of stdout.")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        # Child process: benchmark a single backend and print its JSON
+        print(json.dumps(run_backend(args)))
+        return
+
+    passthrough = [a for a in (argv if argv is not None else sys.argv[1:])]
+    report = {"metadata": metadata(), "results": []}
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryFile("w+") as out:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_inference", *passthrough,
+                 "--backend", backend],
+                stdout=out, check=True,
+            )
+            out.seek(0)
+            report["results"].append(json.loads(out.read().strip().splitlines()[-1]))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
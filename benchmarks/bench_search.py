@@ -0,0 +1,137 @@
+"""
+Diary search benchmark.
+
+Fills a temporary SQLite database with synthetic diary entries and compares
+the latency of:
+
+* ``ilike``: the old ``title ILIKE '%q%' OR content ILIKE '%q%'`` scan
+* ``fts_filter``: the home dashboard filter through the FTS5 index
+* ``fts_search``: ranked, highlighted search-as-you-type results
+
+for common, rare and prefix queries, plus the time taken to build the
+index. Every entry belongs to one user by default, the case where the
+``ilike`` scan hurts most; ``--owners`` spreads them out. No model is needed.
+
+Usage, from the repository root::
+
+    python -m benchmarks.bench_search --entries 100000 --output search.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from benchmarks.common import metadata, percentiles, synthetic_texts, timed
+
+QUERIES = ["happy", "coffee rain", "zeppelin", "zepp"]
+# Appended to one entry in RARE_EVERY; the synthetic vocabulary is small, so
+# every one of its words is common
+RARE_SENTENCE = "We watched a zeppelin drift over the bay."
+RARE_EVERY = 1000
+
+
+def _seed(db, User, DiaryEntry, entries, owners, words):
+    """Insert ``entries`` synthetic diaries spread across ``owners`` users."""
+    users = [User(username=f"bench{i}", email=f"bench{i}@example.com") for i in range(owners)]
+    for user in users:
+        user.set_password("password")
+    db.session.add_all(users)
+    db.session.commit()
+    chunk = 5000
+    for start in range(0, entries, chunk):
+        count = min(chunk, entries - start)
+        texts = synthetic_texts(count, words, seed=start)
+        db.session.execute(
+            DiaryEntry.__table__.insert(),
+            [
+                {"title": " ".join(text.split()[:4]),
+                 "content": text + (" " + RARE_SENTENCE if (start + i) % RARE_EVERY == 0 else ""),
+                 "owner_id": users[(start + i) % owners].id}
+                for i, text in enumerate(texts)
+            ],
+        )
+        db.session.commit()
+    return users[0].id
+
+
+def bench_queries(run, repeats):
+    results = {}
+    for query in QUERIES:
+        latencies = []
+        for _ in range(repeats):
+            rows, elapsed = timed(run, query)
+            latencies.append(elapsed)
+        results[query] = {**percentiles(latencies), "rows": rows}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--owners", type=int, default=1,
+                        help="Users the entries are spread across.")
+    parser.add_argument("--words", type=int, default=120, help="Words per entry.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", help="Write JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    from app import create_app, db
+    from app.data_handling import search
+    from app.models import DiaryEntry, User
+    from config import Config
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tmp, "bench.db")
+            EMOTION_MODEL_WARMUP = False  # Search needs no model
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            owner_id, insert_seconds = timed(
+                _seed, db, User, DiaryEntry, args.entries, args.owners, args.words
+            )
+            fts = search.SqliteFtsSearch()
+            _, rebuild_seconds = timed(fts.rebuild)
+            base = DiaryEntry.query.filter_by(owner_id=owner_id)
+
+            def ilike(query):
+                term = f"%{query}%"
+                return base.filter(
+                    DiaryEntry.title.ilike(term) | DiaryEntry.content.ilike(term)
+                ).count()
+
+            def fts_filter(query):
+                return search.filter_query(base, query).count()
+
+            def fts_search(query):
+                return len(fts.search(owner_id, query, limit=10))
+
+            report = {
+                "metadata": metadata(),
+                "entries": args.entries,
+                "owners": args.owners,
+                "words": args.words,
+                "insert_with_triggers_s": insert_seconds,
+                "rebuild_s": rebuild_seconds,
+                "results": {
+                    "ilike": bench_queries(ilike, args.repeats),
+                    "fts_filter": bench_queries(fts_filter, args.repeats),
+                    "fts_search": bench_queries(fts_search, args.repeats),
+                },
+            }
+            db.session.remove()
+            db.engine.dispose()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
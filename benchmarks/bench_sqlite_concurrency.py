@@ -0,0 +1,158 @@
+"""
+Concurrent write/read stress test against a local SQLite file.
+
+Writer threads create diary entries through the ORM, one commit each (so the
+full-text triggers and the mood rollup hooks run too), while reader threads
+load dashboard pages. Two engine setups are compared on fresh databases:
+
+* ``default``: SQLite's default pragmas (rollback journal), as the app ran
+  before ``SQLITE_PRAGMAS``
+* ``tuned``: the ``production`` profile, with WAL, synchronous=NORMAL, a
+  larger page cache, mmap and busy_timeout
+
+and for each the throughput, latency percentiles and number of failed
+operations ("database is locked") are reported. No model is needed.
+
+Usage, from the repository root::
+
+    python -m benchmarks.bench_sqlite_concurrency --writers 4 --readers 8 --output sqlite.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import metadata, percentiles, synthetic_texts
+
+PROFILES = ("default", "tuned")
+
+
+def _seed(db, User, DiaryEntry, users, entries, words):
+    accounts = [User(username=f"bench{i}", email=f"bench{i}@example.com") for i in range(users)]
+    for user in accounts:
+        user.password_hash = "x"
+    db.session.add_all(accounts)
+    db.session.commit()
+    texts = synthetic_texts(entries, words)
+    db.session.add_all(
+        DiaryEntry(title=f"Seed {i}", content=text, owner_id=accounts[i % users].id)
+        for i, text in enumerate(texts)
+    )
+    db.session.commit()
+    return [user.id for user in accounts]
+
+
+def _worker(app, operation, stop, samples, errors):
+    from app import db
+
+    with app.app_context():
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                operation(i)
+            except Exception as e:  # noqa: BLE001 - counted and reported
+                db.session.rollback()
+                errors.append(type(e).__name__ + ": " + str(e).splitlines()[0])
+            else:
+                samples.append(time.perf_counter() - started)
+            i += 1
+        db.session.remove()
+
+
+def run_profile(profile, args):
+    from app import create_app, db
+    from app.models import DiaryEntry
+    from config import ProductionConfig
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        class BenchConfig(ProductionConfig):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(tmp, "bench.db")
+            EMOTION_MODEL_WARMUP = False
+            ANALYSIS_WORKERS = 0
+            if profile == "default":
+                SQLITE_PRAGMAS = {}
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            from app.models import User
+
+            owner_ids = _seed(db, User, DiaryEntry, args.writers, args.seed_entries, args.words)
+            journal_mode = db.session.execute(db.text("PRAGMA journal_mode")).scalar()
+            db.session.remove()
+        texts = synthetic_texts(64, args.words, seed=1)
+
+        def write(i):
+            owner_id = owner_ids[threading.get_ident() % len(owner_ids)]
+            db.session.add(DiaryEntry(title=f"Entry {i}", content=texts[i % len(texts)],
+                                      owner_id=owner_id))
+            db.session.commit()
+
+        def read(i):
+            owner_id = owner_ids[i % len(owner_ids)]
+            DiaryEntry.for_user(owner_id).order_by(DiaryEntry.created_at.desc()).limit(24).all()
+            db.session.commit()
+
+        stop = threading.Event()
+        results = {"write": ([], []), "read": ([], [])}
+        threads = [
+            threading.Thread(target=_worker, args=(app, write, stop, *results["write"]))
+            for _ in range(args.writers)
+        ] + [
+            threading.Thread(target=_worker, args=(app, read, stop, *results["read"]))
+            for _ in range(args.readers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+
+    report = {"journal_mode": journal_mode}
+    for kind, (samples, errors) in results.items():
+        report[kind] = {
+            "ops_per_s": len(samples) / args.seconds,
+            "errors": len(errors),
+            "error_examples": sorted(set(errors))[:3],
+            **(percentiles(samples) if samples else {}),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--seed-entries", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=120, help="Words per entry.")
+    parser.add_argument("--profiles", default=",".join(PROFILES),
+                        help=f"Comma-separated subset of {', '.join(PROFILES)}.")
+    parser.add_argument("--output", help="Write JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    report = {
+        "metadata": metadata(),
+        "writers": args.writers,
+        "readers": args.readers,
+        "seconds": args.seconds,
+        "results": {profile: run_profile(profile, args) for profile in args.profiles.split(",")},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Helpers shared by the benchmark scripts: synthetic diary text, timing
+statistics, resource usage and run metadata.
+"""
+
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+# Vocabulary loosely covering every emotion label, so the model does real work
+WORDS = (
+    "today I felt happy excited grateful proud sad lonely tired angry annoyed "
+    "furious scared anxious nervous worried disgusted gross surprised shocked "
+    "amazed calm okay the a and but because when after before with my friend "
+    "family work school dinner morning night walk rain sun coffee meeting exam "
+    "call message home city trip weekend party news doctor dog cat phone "
+    "really very quite so just still never always again maybe finally"
+).split()
+
+
+def synthetic_text(n_words, seed=0):
+    """Deterministic diary-like text of exactly ``n_words`` words."""
+    rng = random.Random(seed)
+    words = []
+    while len(words) < n_words:
+        sentence = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+        sentence[0] = sentence[0].capitalize()
+        words.extend(sentence)
+        words[-1] += "."
+    words = words[:n_words]
+    return " ".join(words)
+
+
+def synthetic_texts(count, n_words, seed=0):
+    return [synthetic_text(n_words, seed=seed * 100003 + i) for i in range(count)]
+
+
+def token_length(text, tokenizer=None):
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000.0
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000.0,
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000.0,
+    }
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def metadata():
+    """Environment details recorded with every result file."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    info = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import torch
+
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
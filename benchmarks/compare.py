@@ -0,0 +1,73 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Usage::
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.10
+
+Exits with status 1 if any p50/p99 latency grew, or throughput fell, by more
+than the threshold fraction.
+"""
+
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "load_seconds", "peak_rss_mb")
+HIGHER_IS_BETTER = ("texts_per_second",)
+
+
+def flatten(report):
+    """Map ``(backend, path...) -> metric value`` for every numeric metric."""
+    flat = {}
+
+    def walk(prefix, node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                walk(prefix + (key,), value)
+        elif isinstance(node, list):
+            for item in node:
+                # Name list items by their distinguishing field
+                label = next(
+                    (f"{k}={item[k]}" for k in ("words", "batch_size") if k in item),
+                    None,
+                ) if isinstance(item, dict) else None
+                walk(prefix + ((label,) if label else ()), item)
+        elif isinstance(node, (int, float)) and prefix[-1] in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            flat[prefix] = node
+
+    for result in report["results"]:
+        walk((result["backend"],), result)
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression.")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f))
+    with open(args.candidate) as f:
+        candidate = flatten(json.load(f))
+
+    regressions = 0
+    for key in sorted(set(baseline) & set(candidate), key=str):
+        old, new = baseline[key], candidate[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change > args.threshold if key[-1] in LOWER_IS_BETTER else change < -args.threshold
+        regressions += worse
+        marker = "REGRESSION" if worse else ""
+        print(f"{'/'.join(key):70} {old:12.3f} -> {new:12.3f} {change:+7.1%} {marker}")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 """Adjust field length
 
 Revision ID: 03e4696b2904
-Revises: 
+Revises: 2d7e5a9c1f30
 Create Date: 2025-05-05 11:17:09.013908
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '03e4696b2904'
-down_revision = None
+down_revision = '2d7e5a9c1f30'
 branch_labels = None
 depends_on = None
 
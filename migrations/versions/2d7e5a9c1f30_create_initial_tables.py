@@ -0,0 +1,78 @@
+"""Create initial tables
+
+Revision ID: 2d7e5a9c1f30
+Revises:
+Create Date: 2025-05-05 10:58:41.207315
+
+The schema the first migrations were written against, which used to be
+created by ``db.create_all()`` at startup. Databases created that way are
+already stamped at a later revision and never run this one.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7e5a9c1f30'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=64), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=128), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_users_username'), ['username'], unique=True)
+
+    op.create_table('diary_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('sentiment_label', sa.String(length=64), nullable=True),
+    sa.Column('sentiment_score', sa.Float(), nullable=True),
+    sa.Column('sentiment_data', sa.JSON(), nullable=True),
+    sa.Column('analyzed', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('diary_entries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_diary_entries_analyzed'), ['analyzed'], unique=False)
+        batch_op.create_index(batch_op.f('ix_diary_entries_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_diary_entries_sentiment_label', ['sentiment_label'], unique=False)
+        batch_op.create_index('ix_diary_entries_sentiment_score', ['sentiment_score'], unique=False)
+
+    op.create_table('diary_shares',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('diary_id', sa.Integer(), nullable=False),
+    sa.Column('shared_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['diary_id'], ['diary_entries.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'diary_id')
+    )
+
+
+def downgrade():
+    op.drop_table('diary_shares')
+    with op.batch_alter_table('diary_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_diary_entries_sentiment_score')
+        batch_op.drop_index('ix_diary_entries_sentiment_label')
+        batch_op.drop_index(batch_op.f('ix_diary_entries_created_at'))
+        batch_op.drop_index(batch_op.f('ix_diary_entries_analyzed'))
+
+    op.drop_table('diary_entries')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_username'))
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
@@ -0,0 +1,44 @@
+"""Add username key
+
+Revision ID: a2d7e5b9c4f1
+Revises: f3a9d7c2b5e8
+Create Date: 2026-10-18 21:06:12.418327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2d7e5b9c4f1'
+down_revision = 'f3a9d7c2b5e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('username_key', sa.String(length=32), nullable=True))
+
+    # Lower-cased in Python, like User._update_username_key: SQLite's lower()
+    # only folds ASCII
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer),
+        sa.column('username', sa.String),
+        sa.column('username_key', sa.String),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(users.c.id, users.c.username)).all()
+    for user_id, username in rows:
+        connection.execute(
+            users.update()
+            .where(users.c.id == user_id)
+            .values(username_key=username.lower())
+        )
+    op.create_index('ix_users_username_key', 'users',
+                    ['username_key', 'username'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_username_key', table_name='users')
+    op.drop_column('users', 'username_key')
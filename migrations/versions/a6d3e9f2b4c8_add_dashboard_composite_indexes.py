@@ -0,0 +1,32 @@
+"""Add dashboard composite indexes
+
+Revision ID: a6d3e9f2b4c8
+Revises: f1c8a3d5b7e2
+Create Date: 2026-10-18 15:12:07.304915
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e9f2b4c8'
+down_revision = 'f1c8a3d5b7e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain create_index rather than batch_alter_table, so SQLite does not
+    # rebuild diary_entries and drop the full-text triggers
+    op.create_index('ix_diary_entries_owner_created', 'diary_entries',
+                    ['owner_id', 'created_at'], unique=False)
+    op.create_index('ix_diary_entries_owner_emotion_created', 'diary_entries',
+                    ['owner_id', 'dominant_emotion_label', 'created_at'], unique=False)
+    op.create_index('ix_diary_shares_diary_id', 'diary_shares',
+                    ['diary_id', 'user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_diary_shares_diary_id', table_name='diary_shares')
+    op.drop_index('ix_diary_entries_owner_emotion_created', table_name='diary_entries')
+    op.drop_index('ix_diary_entries_owner_created', table_name='diary_entries')
@@ -0,0 +1,89 @@
+"""Store emotion scores in columns
+
+Revision ID: c2f7a9d4e1b6
+Revises: b8e4f1a7c3d9
+Create Date: 2026-10-18 17:58:03.126044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a9d4e1b6'
+down_revision = 'b8e4f1a7c3d9'
+branch_labels = None
+depends_on = None
+
+LABELS = ('anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise')
+CHUNK_SIZE = 500
+
+diary_entries = sa.table(
+    'diary_entries',
+    sa.column('id', sa.Integer),
+    sa.column('emotion_details_json', sa.JSON),
+    *(sa.column(f'score_{label}', sa.Float) for label in LABELS),
+)
+
+
+def _chunks(where):
+    """Yield rows of ``diary_entries`` matching ``where`` by ascending id."""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(diary_entries)
+            .where(diary_entries.c.id > last_id, where)
+            .order_by(diary_entries.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _update(values):
+    op.get_bind().execute(
+        diary_entries.update().where(diary_entries.c.id == sa.bindparam('row_id')),
+        values,
+    )
+
+
+def upgrade():
+    # Plain add/drop column rather than batch_alter_table, so SQLite does
+    # not rebuild diary_entries and drop the full-text triggers
+    for label in LABELS:
+        op.add_column('diary_entries', sa.Column(f'score_{label}', sa.Float(), nullable=True))
+
+    for rows in _chunks(diary_entries.c.emotion_details_json.isnot(None)):
+        values = []
+        for row in rows:
+            scores = {item['label']: item['score'] for item in row.emotion_details_json or []}
+            values.append({
+                'row_id': row.id,
+                **{f'score_{label}': scores.get(label) for label in LABELS},
+            })
+        _update(values)
+
+    op.drop_column('diary_entries', 'emotion_details_json')
+
+
+def downgrade():
+    op.add_column('diary_entries', sa.Column('emotion_details_json', sa.JSON(), nullable=True))
+
+    scored = sa.or_(*(diary_entries.c[f'score_{label}'].isnot(None) for label in LABELS))
+    for rows in _chunks(scored):
+        values = []
+        for row in rows:
+            details = [
+                {'label': label, 'score': row._mapping[f'score_{label}']}
+                for label in LABELS
+                if row._mapping[f'score_{label}'] is not None
+            ]
+            details.sort(key=lambda item: item['score'], reverse=True)
+            values.append({'row_id': row.id, 'emotion_details_json': details})
+        _update(values)
+
+    for label in reversed(LABELS):
+        op.drop_column('diary_entries', f'score_{label}')
@@ -0,0 +1,62 @@
+"""Add diary preview
+
+Revision ID: d5a1c8e3f9b2
+Revises: c2f7a9d4e1b6
+Create Date: 2026-10-18 18:45:51.602317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from markupsafe import Markup
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a1c8e3f9b2'
+down_revision = 'c2f7a9d4e1b6'
+branch_labels = None
+depends_on = None
+
+PREVIEW_LENGTH = 150  # As app.models.PREVIEW_LENGTH
+CHUNK_SIZE = 500
+
+
+def make_preview(content):
+    # Same as app.models.make_preview
+    text = Markup(content or '').striptags()
+    if len(text) > PREVIEW_LENGTH:
+        return text[:PREVIEW_LENGTH].rstrip() + '...'
+    return text
+
+
+def upgrade():
+    # Plain add_column rather than batch_alter_table, so SQLite does not
+    # rebuild diary_entries and drop the full-text triggers
+    op.add_column('diary_entries',
+                  sa.Column('preview', sa.String(length=PREVIEW_LENGTH + 3), nullable=True))
+
+    diary_entries = sa.table(
+        'diary_entries',
+        sa.column('id', sa.Integer),
+        sa.column('content', sa.Text),
+        sa.column('preview', sa.String),
+    )
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(diary_entries.c.id, diary_entries.c.content)
+            .where(diary_entries.c.id > last_id)
+            .order_by(diary_entries.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            diary_entries.update().where(diary_entries.c.id == sa.bindparam('row_id')),
+            [{'row_id': row.id, 'preview': make_preview(row.content)} for row in rows],
+        )
+        last_id = rows[-1].id
+
+
+def downgrade():
+    op.drop_column('diary_entries', 'preview')
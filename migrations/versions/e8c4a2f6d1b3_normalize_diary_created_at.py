@@ -0,0 +1,36 @@
+"""Normalize diary created_at
+
+Revision ID: e8c4a2f6d1b3
+Revises: d5a1c8e3f9b2
+Create Date: 2026-10-18 19:20:14.318204
+
+On SQLite, entries saved with the CURRENT_TIMESTAMP server default store
+``created_at`` as 'YYYY-MM-DD HH:MM:SS', while SQLAlchemy binds datetimes as
+'YYYY-MM-DD HH:MM:SS.ffffff'. SQLite compares the two as strings, which broke
+keyset pagination for entries created in the same second. New entries get
+``created_at`` from Python; this rewrites the old ones in the same format.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4a2f6d1b3'
+down_revision = 'd5a1c8e3f9b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Other databases store real timestamps
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "UPDATE diary_entries SET created_at = created_at || '.000000' "
+        "WHERE length(created_at) = 19"
+    )
+
+
+def downgrade():
+    # The longer format is read back the same way; nothing to undo
+    pass
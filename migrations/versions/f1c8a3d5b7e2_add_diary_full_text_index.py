@@ -0,0 +1,72 @@
+"""Add diary full-text index
+
+Revision ID: f1c8a3d5b7e2
+Revises: f4b9d2e6a1c7
+Create Date: 2026-10-18 14:10:12.402918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c8a3d5b7e2'
+down_revision = 'f4b9d2e6a1c7'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS diary_fts USING fts5(
+        title, content, content='diary_entries', content_rowid='id',
+        tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_ai AFTER INSERT ON diary_entries BEGIN
+        INSERT INTO diary_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_ad AFTER DELETE ON diary_entries BEGIN
+        INSERT INTO diary_fts(diary_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS diary_fts_au AFTER UPDATE OF title, content ON diary_entries BEGIN
+        INSERT INTO diary_fts(diary_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO diary_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    # Index the entries that already exist
+    "INSERT INTO diary_fts(diary_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS diary_fts_au",
+    "DROP TRIGGER IF EXISTS diary_fts_ad",
+    "DROP TRIGGER IF EXISTS diary_fts_ai",
+    "DROP TABLE IF EXISTS diary_fts",
+]
+
+POSTGRES_UPGRADE = [
+    """ALTER TABLE diary_entries ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+        ) STORED""",
+    """CREATE INDEX IF NOT EXISTS ix_diary_entries_search_vector
+        ON diary_entries USING gin (search_vector)""",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_diary_entries_search_vector",
+    "ALTER TABLE diary_entries DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_dialect):
+    # Other databases keep using the unindexed ilike search
+    for statement in statements_by_dialect.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade():
+    _run({'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE})
+
+
+def downgrade():
+    _run({'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE})
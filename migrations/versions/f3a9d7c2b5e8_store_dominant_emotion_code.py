@@ -0,0 +1,46 @@
+"""Store dominant emotion code
+
+Revision ID: f3a9d7c2b5e8
+Revises: e8c4a2f6d1b3
+Create Date: 2026-10-18 19:42:37.905611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9d7c2b5e8'
+down_revision = 'e8c4a2f6d1b3'
+branch_labels = None
+depends_on = None
+
+LABELS = ('anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise')
+
+
+def upgrade():
+    # Plain add_column rather than batch_alter_table, so SQLite does not
+    # rebuild diary_entries and drop the full-text triggers
+    op.add_column('diary_entries',
+                  sa.Column('dominant_emotion_code', sa.SmallInteger(), nullable=True))
+
+    diary_entries = sa.table(
+        'diary_entries',
+        sa.column('dominant_emotion_label', sa.String),
+        sa.column('dominant_emotion_code', sa.SmallInteger),
+    )
+    op.execute(
+        diary_entries.update()
+        .where(diary_entries.c.dominant_emotion_label.in_(LABELS))
+        .values(dominant_emotion_code=sa.case(
+            {label: code for code, label in enumerate(LABELS)},
+            value=diary_entries.c.dominant_emotion_label,
+        ))
+    )
+    op.create_index('ix_diary_entries_dominant_emotion_code', 'diary_entries',
+                    ['dominant_emotion_code'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_diary_entries_dominant_emotion_code', table_name='diary_entries')
+    op.drop_column('diary_entries', 'dominant_emotion_code')
@@ -0,0 +1,52 @@
+"""Test configuration and the base class shared by the test modules."""
+import unittest
+from contextlib import contextmanager
+
+from app import create_app, db
+from app.instrumentation import record_queries
+
+class TestConfig:
+    """Test configuration for in-memory SQLite database."""
+    SECRET_KEY = 'test-secret-key'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    TESTING = True
+    WTF_CSRF_ENABLED = False  # Disable CSRF for easier testing
+    ANALYSIS_QUEUE_EAGER = True  # Run analysis jobs inline
+
+class BaseTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up the test environment."""
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Tear down the test environment."""
+        db.session.close()  # Close the session
+        db.drop_all()
+        db.engine.dispose()  # Dispose of the engine to close connections
+        self.app_context.pop()
+
+    def login(self, username, password):
+        """Helper method to log in a user."""
+        return self.client.post('/auth/login', data={
+            'username': username,
+            'password': password,
+            'remember_me': True
+        }, follow_redirects=True)
+
+    def count_queries(self, func):
+        """Run ``func`` and return ``(result, number of SQL statements)``."""
+        with record_queries() as stats:
+            result = func()
+        return result, stats.count
+
+    @contextmanager
+    def assert_max_queries(self, n):
+        """Fail if the block sends more than ``n`` SQL statements."""
+        with record_queries() as stats:
+            yield stats
+        self.assertLessEqual(stats.count, n, '\n'.join(stats.statements))
@@ -1,43 +1,12 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from flask import url_for, get_flashed_messages
 from werkzeug.security import generate_password_hash
 from app import create_app, db
 from app.models import User, DiaryEntry
 from app.auth.forms import LoginForm, RegistrationForm
 from app.data_handling.forms import DiaryForm
-
-class TestConfig:
-    """Test configuration for in-memory SQLite database."""
-    SECRET_KEY = 'test-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    TESTING = True
-    WTF_CSRF_ENABLED = False  # Disable CSRF for easier testing
-
-class BaseTestCase(unittest.TestCase):
-    def setUp(self):
-        """Set up the test environment."""
-        self.app = create_app(TestConfig)
-        self.app_context = self.app.app_context()
-        self.app_context.push()
-        db.create_all()
-        self.client = self.app.test_client()
-
-    def tearDown(self):
-        """Tear down the test environment."""
-        db.session.close()  # Close the session
-        db.drop_all()
-        db.engine.dispose()  # Dispose of the engine to close connections
-        self.app_context.pop()
-
-    def login(self, username, password):
-        """Helper method to log in a user."""
-        return self.client.post('/auth/login', data={
-            'username': username,
-            'password': password,
-            'remember_me': True
-        }, follow_redirects=True)
+from .base import BaseTestCase, TestConfig
 
 class AuthTests(BaseTestCase):
     def test_user_model(self):
@@ -163,6 +132,76 @@ class AuthTests(BaseTestCase):
             self.assertIsNotNone(user)
             self.assertEqual(user.email, 'new@example.com')
 
+    def test_search_users(self):
+        """Prefix search pages with a cursor, leaves out the caller and uses ETags."""
+        for name in ['me', 'ann', 'anna', 'annie', 'an_x', 'bob']:
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('password123')
+            db.session.add(user)
+        db.session.commit()
+
+        with self.client:
+            self.login('me', 'password123')
+            first = self.client.get('/auth/users/search?q=ann&limit=2')
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual([u['username'] for u in first.json['users']], ['ann', 'anna'])
+            self.assertEqual(first.json['next_cursor'], 'anna')
+
+            second = self.client.get('/auth/users/search?q=ann&limit=2&cursor=anna')
+            self.assertEqual([u['username'] for u in second.json['users']], ['annie'])
+            self.assertIsNone(second.json['next_cursor'])
+
+            # LIKE wildcards in the prefix are literal
+            wildcard = self.client.get('/auth/users/search?q=an_')
+            self.assertEqual([u['username'] for u in wildcard.json['users']], ['an_x'])
+
+            everyone = self.client.get('/auth/users/search')
+            self.assertNotIn('me', [u['username'] for u in everyone.json['users']])
+
+            cached = self.client.get('/auth/users/search?q=ann&limit=2',
+                                     headers={'If-None-Match': first.headers['ETag']})
+            self.assertEqual(cached.status_code, 304)
+
+    def test_search_users_ignores_case(self):
+        """Lower-case prefixes find mixed-case usernames, paging across case twins."""
+        for name in ['Alice', 'alice', 'ALBERT', 'Bob']:
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('password123')
+            db.session.add(user)
+        db.session.commit()
+
+        users, next_cursor = User.search_by_prefix('al', limit=2)
+        self.assertEqual([u.username for u in users], ['ALBERT', 'Alice'])
+        self.assertEqual(next_cursor, 'Alice')
+        users, next_cursor = User.search_by_prefix('al', after=next_cursor, limit=2)
+        self.assertEqual([u.username for u in users], ['alice'])
+        self.assertIsNone(next_cursor)
+        users, _ = User.search_by_prefix('AL')
+        self.assertEqual([u.username for u in users], ['ALBERT', 'Alice', 'alice'])
+
+        user = User.query.filter_by(username='Bob').one()
+        user.username = 'Bobby'
+        db.session.commit()
+        self.assertEqual([u.username for u in User.search_by_prefix('bobb')[0]], ['Bobby'])
+
+    def test_search_prefix_at_the_end_of_unicode(self):
+        """Prefixes whose last character cannot be incremented still match."""
+        from app.models import prefix_upper_bound
+        self.assertEqual(prefix_upper_bound('ann'), 'ano')
+        self.assertEqual(prefix_upper_bound('a\U0010ffff'), 'b')
+        self.assertEqual(prefix_upper_bound('a\ud7ff'), 'a\ue000')
+        self.assertIsNone(prefix_upper_bound('\U0010ffff'))
+
+        for name in ['z\U0010ffff', 'z\U0010ffffx', 'za']:
+            user = User(username=name, email=f'{len(name)}{name[-1]}@example.com')
+            user.set_password('password123')
+            db.session.add(user)
+        db.session.commit()
+        users, _ = User.search_by_prefix('z\U0010ffff')
+        self.assertEqual([u.username for u in users], ['z\U0010ffff', 'z\U0010ffffx'])
+        users, _ = User.search_by_prefix('\U0010ffff')
+        self.assertEqual(users, [])
+
 class DiaryTests(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -172,7 +211,7 @@ class DiaryTests(BaseTestCase):
         db.session.add(self.user)
         db.session.commit()
 
-    @patch('app.data_handling.routes.emotion_classifier')
+    @patch('app.data_handling.analysis.emotion_classifier')
     def test_diary_creation(self, mock_classifier):
         """Test diary creation with mocked emotion classifier."""
         # Mock emotion classifier response
@@ -199,7 +238,7 @@ class DiaryTests(BaseTestCase):
             self.assertEqual(diary.dominant_emotion_score, 0.9)
             self.assertTrue(diary.analyzed)
 
-    @patch('app.data_handling.routes.emotion_classifier')
+    @patch('app.data_handling.analysis.emotion_classifier')
     def test_diary_edit(self, mock_classifier):
         """Test diary editing with mocked emotion classifier."""
         # Create a diary entry
@@ -275,6 +314,149 @@ class DiaryTests(BaseTestCase):
             # Verify sharing
             self.assertTrue(diary.is_shared_with_user(user2))
 
+    def test_set_shared_usernames_diffs_in_bulk(self):
+        """Sharing is a set diff applied with one INSERT and one DELETE."""
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                 for i in range(2, 7)]
+        diary = DiaryEntry(title='Shared Diary', content='Content', owner_id=self.user.id)
+        db.session.add_all(users + [diary])
+        db.session.commit()
+        diary.share_with_user(users[0])
+        diary.share_with_user(users[1])
+        db.session.commit()
+        db.session.refresh(diary)
+
+        changes, queries = self.count_queries(lambda: diary.set_shared_usernames(
+            ['user3', 'user4', 'user5', 'ghost', 'testuser']))
+        db.session.commit()
+        self.assertEqual(changes, (2, 1, ['ghost']))
+        self.assertLessEqual(queries, 4)
+        self.assertEqual({u.username for u in diary.get_shared_users()},
+                         {'user3', 'user4', 'user5'})
+
+        with self.client:
+            self.login('testuser', 'password123')
+            self.client.post(f'/data/share_diary/{diary.id}', data={'shared_users': ['user6', 'nobody']})
+            messages = get_flashed_messages()
+            self.assertIn("User 'nobody' not found.", messages)
+            self.assertIn('Diary sharing updated successfully! 4 changes made.', messages)
+        self.assertEqual([u.username for u in diary.get_shared_users()], ['user6'])
+
+    def test_share_many_diaries_with_many_users(self):
+        """The bulk endpoint costs the same number of queries for any list size."""
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                 for i in range(2, 12)]
+        diaries = [DiaryEntry(title=f'Diary {i}', content='Content', owner_id=self.user.id)
+                   for i in range(6)]
+        db.session.add_all(users + diaries)
+        db.session.commit()
+        ids = [d.id for d in diaries]
+        with self.client:
+            self.login('testuser', 'password123')
+            self.client.post('/data/share_diaries', json={})  # Loads the current user
+            counts = []
+            for n_diaries, names in [(2, ['user2', 'user3']),
+                                     (6, [u.username for u in users] + ['testuser'])]:
+                response, queries = self.count_queries(lambda: self.client.post(
+                    '/data/share_diaries', json={'diary_ids': ids[:n_diaries], 'usernames': names}))
+                counts.append(queries)
+            self.assertEqual(counts[0], counts[1])
+            self.assertEqual(response.get_json(), {'added': 56, 'removed': 0, 'missing': []})
+
+            response = self.client.post('/data/share_diaries', json={
+                'diary_ids': ids, 'usernames': ['user2'], 'unshare': True})
+            self.assertEqual(response.get_json()['removed'], 6)
+
+            other = DiaryEntry(title='Not mine', content='Content', owner_id=users[0].id)
+            db.session.add(other)
+            db.session.commit()
+            response = self.client.post('/data/share_diaries', json={
+                'diary_ids': [ids[0], other.id], 'usernames': ['user3']})
+            self.assertEqual(response.status_code, 403)
+
+    def test_share_many_rejects_malformed_bodies(self):
+        """JSON that is not an object, or lists of the wrong type, get 400."""
+        diary = DiaryEntry(title='Mine', content='Content', owner_id=self.user.id)
+        db.session.add(diary)
+        db.session.commit()
+        with self.client:
+            self.login('testuser', 'password123')
+            for body in ([], 'x', 3,
+                         {'diary_ids': str(diary.id), 'usernames': []},
+                         {'diary_ids': [True], 'usernames': []},
+                         {'diary_ids': ['one'], 'usernames': []},
+                         {'diary_ids': [diary.id], 'usernames': 'user2'},
+                         {'diary_ids': [diary.id], 'usernames': [2]}):
+                with self.subTest(body=body):
+                    response = self.client.post('/data/share_diaries', json=body)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.get_json())
+        self.assertEqual(diary.get_shared_users(), [])
+
+    def test_get_accessible_is_one_query(self):
+        """Entry, owner and access level load together and are reused within a request."""
+        user2 = User(username='user2', email='user2@example.com')
+        user2.set_password('password123')
+        stranger = User(username='user3', email='user3@example.com', password_hash='x')
+        diary = DiaryEntry(title='Shared Diary', content='Content', owner_id=self.user.id)
+        db.session.add_all([user2, stranger, diary])
+        db.session.commit()
+        diary.share_with_user(user2)
+        db.session.commit()
+
+        diary_id, _, _ = diary.id, user2.id, stranger.id
+        db.session.expunge(diary)
+        with self.app.test_request_context():
+            (entry, access), queries = self.count_queries(
+                lambda: DiaryEntry.get_accessible(diary_id, user2))
+            self.assertEqual((entry.id, access, queries), (diary_id, DiaryEntry.SHARED, 1))
+            _, queries = self.count_queries(
+                lambda: (entry.owner.username, entry.is_shared_with_user(user2),
+                         DiaryEntry.get_accessible(diary_id, user2)))
+            self.assertEqual(queries, 0)
+            self.assertEqual(DiaryEntry.get_accessible(diary_id, self.user)[1], DiaryEntry.OWNER)
+            self.assertIsNone(DiaryEntry.get_accessible(diary_id, stranger)[1])
+            self.assertEqual(DiaryEntry.get_accessible(-1, stranger), (None, None))
+
+        with self.client:
+            self.login('user2', 'password123')
+            self.client.get('/home')  # Loads the current user
+            response, queries = self.count_queries(
+                lambda: self.client.get(f'/data/view_diary/{diary_id}'))
+            self.assertIn(b'Shared with you', response.data)
+            self.assertLessEqual(queries, 2)  # Current user, then entry with access
+            self.assertEqual(self.client.get('/data/view_diary/999').status_code, 404)
+            self.assertEqual(self.client.get(f'/data/get_shared_users/{diary_id}').status_code, 403)
+
+    def test_share_candidates(self):
+        """The share dialog gets current shares and matching users in one response."""
+        users = [User(username=name, email=f'{name}@example.com')
+                 for name in ['amy', 'alan', 'bea']]
+        for user in users:
+            user.set_password('password123')
+        diary = DiaryEntry(title='Diary', content='Content', owner_id=self.user.id)
+        db.session.add_all(users + [diary])
+        db.session.commit()
+        diary.share_with_user(users[2])
+        db.session.commit()
+
+        with self.client:
+            self.login('testuser', 'password123')
+            response = self.client.get(f'/data/share_candidates/{diary.id}?q=a&limit=1')
+            self.assertEqual(response.get_json(), {
+                'shared': [{'id': users[2].id, 'username': 'bea'}],
+                'candidates': [{'id': users[1].id, 'username': 'alan'}],
+                'next_cursor': 'alan',
+            })
+            response = self.client.get(f'/data/share_candidates/{diary.id}?q=a&cursor=alan')
+            self.assertEqual([u['username'] for u in response.get_json()['candidates']], ['amy'])
+            self.assertNotIn('shared', response.get_json())
+            self.client.get('/auth/logout')
+
+            # Only the owner may list candidates
+            self.login('bea', 'password123')
+            self.assertEqual(self.client.get(f'/data/share_candidates/{diary.id}').status_code, 403)
+
     def test_diary_access_control(self):
         """Test access control for diary viewing."""
         # Create another user
@@ -306,5 +488,1282 @@ class DiaryTests(BaseTestCase):
             self.assertEqual(response.status_code, 200)
             self.assertIn(b'Private Diary', response.data)
 
+class DashboardPaginationTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime
+        self.app.config['DIARIES_PER_PAGE'] = 3
+        self.user = User(username='pager', email='pager@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+        same_time = datetime(2025, 5, 1, 12, 0)
+        # Duplicate timestamps, titles and scores, plus unanalyzed entries
+        for i, (title, score) in enumerate([('b', 0.5), ('a', 0.5), ('b', None), ('c', 0.9),
+                                            ('a', 0.1), ('d', None), ('c', 0.5)]):
+            db.session.add(DiaryEntry(title=title, content=f'entry {i}', owner_id=self.user.id,
+                                      created_at=same_time if i % 2 else datetime(2025, 5, 2 + i),
+                                      dominant_emotion_score=score, analyzed=score is not None))
+        db.session.commit()
+
+    def walk(self, sort_by):
+        """Follow next_url through every JSON page and return the ids seen."""
+        ids = []
+        url = f'/home/page?sort_by={sort_by}'
+        while url:
+            page = self.client.get(url).get_json()
+            self.assertLessEqual(len(page['items']), 3)
+            page_ids = [item['id'] for item in page['items']]
+            # Fail on the first repeat rather than paging forever
+            self.assertFalse(set(page_ids) & set(ids), f'{sort_by} repeats rows')
+            ids.extend(page_ids)
+            url = page['next_url']
+        return ids
+
+    def test_every_sort_visits_each_entry_once(self):
+        """Keyset pages neither skip nor repeat rows with equal sort keys."""
+        no_mood = 2.0
+        keys = {
+            'created_desc': (lambda d: (d.created_at, d.id), True),
+            'created_asc': (lambda d: (d.created_at, d.id), False),
+            'title_asc': (lambda d: (d.title, d.id), False),
+            'title_desc': (lambda d: (d.title, d.id), True),
+            'mood_asc': (lambda d: (d.dominant_emotion_score if d.dominant_emotion_score is not None
+                                    else no_mood, d.id), False),
+            'mood_desc': (lambda d: (d.dominant_emotion_score if d.dominant_emotion_score is not None
+                                     else no_mood, d.id), True),
+        }
+        with self.client:
+            self.login('pager', 'password123')
+            entries = DiaryEntry.query.all()
+            for sort_by, (key, reverse) in keys.items():
+                expected = [d.id for d in sorted(entries, key=key, reverse=reverse)]
+                self.assertEqual(self.walk(sort_by), expected, sort_by)
+
+    @patch('app.data_handling.analysis.emotion_classifier', Mock(return_value=[[]]))
+    def test_default_timestamps_in_the_same_second(self):
+        """Entries saved without an explicit created_at page correctly by date."""
+        from datetime import datetime, timezone
+        from app import models
+        DiaryEntry.query.delete()
+        db.session.commit()
+        clock = Mock(wraps=datetime)
+        clock.now.return_value = datetime(2026, 10, 18, 11, 6, 10, tzinfo=timezone.utc)
+        with patch.object(models, 'datetime', clock), self.client:
+            self.login('pager', 'password123')
+            for i in range(7):
+                self.client.post('/data/create_diary', data={'title': f'Same {i}',
+                                                             'content': f'same {i}'})
+            ids = sorted(d.id for d in DiaryEntry.query.all())
+            self.assertEqual(len(ids), 7)
+            self.assertEqual(self.walk('created_desc'), ids[::-1])
+            self.assertEqual(self.walk('created_asc'), ids)
+
+    def test_home_renders_first_page_only(self):
+        """The HTML page holds one page of cards and a link to the next."""
+        with self.client:
+            self.login('pager', 'password123')
+            response = self.client.get('/home?sort_by=title_asc')
+            self.assertEqual(response.data.count(b'class="col diary-item"'), 3)
+            self.assertIn(b'loadMoreSentinel', response.data)
+            self.assertEqual(self.client.get('/home/page?cursor=not-a-cursor').status_code, 400)
+
+    def test_cards_use_preview_without_loading_content(self):
+        """List views render the stored preview and never select the content column."""
+        from sqlalchemy import event
+        diary = DiaryEntry.query.filter_by(content='entry 0').one()
+        diary.content = '<p>Long   day</p>\n' + 'word ' * 60
+        db.session.commit()
+        self.assertEqual(diary.preview, 'Long day ' + ('word ' * 60)[:141].rstrip() + '...')
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            with self.client:
+                self.login('pager', 'password123')
+                statements.clear()
+                html = self.client.get('/home').get_data(as_text=True)
+                url = '/home/page'
+                while url:
+                    page = self.client.get(url).get_json()
+                    html += ''.join(item['html'] for item in page['items'])
+                    url = page['next_url']
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertIn(diary.preview, html)
+        self.assertFalse([s for s in statements if 'diary_entries.content' in s])
+
+class QueryBudgetTests(BaseTestCase):
+    """Each route has a fixed query budget, whatever the amount of data."""
+
+    def setUp(self):
+        super().setUp()
+        self.users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(8)]
+        for user in self.users:
+            user.set_password('password123')
+        db.session.add_all(self.users)
+        db.session.commit()
+        diaries = [DiaryEntry(title=f'Diary {i}', content='A long day at work.',
+                              owner_id=user.id, dominant_emotion_label='joy',
+                              dominant_emotion_score=0.7, analyzed=True)
+                   for user in self.users for i in range(3)]
+        db.session.add_all(diaries)
+        db.session.commit()
+        # user0's diaries are shared with user1; everyone else shares with user0
+        DiaryEntry.share_many([d.id for d in diaries if d.owner_id == self.users[0].id], ['user1'])
+        DiaryEntry.share_many([d.id for d in diaries if d.owner_id != self.users[0].id], ['user0'])
+        db.session.commit()
+        self.diary_id = diaries[0].id
+
+    def get(self, url, budget):
+        """GET ``url`` as a fresh request would run, within ``budget`` queries."""
+        # Requests made inside the test's app context would share its
+        # session and ``g``, so objects loaded earlier would come for free
+        with self.app.app_context():
+            with self.assert_max_queries(budget) as stats:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response, stats
+
+    def test_route_budgets(self):
+        # Every budget includes loading the current user
+        budgets = [
+            ('/home', 2),
+            ('/home/page', 2),
+            ('/home?search=work&emotion_tag=joy', 2),
+            ('/shared', 3),
+            ('/shared/page', 3),
+            (f'/data/view_diary/{self.diary_id}', 3),
+            (f'/data/edit_diary/{self.diary_id}', 2),
+            (f'/data/get_shared_users/{self.diary_id}', 3),
+            (f'/data/share_candidates/{self.diary_id}?q=user', 4),
+            (f'/data/analysis_status/{self.diary_id}', 3),
+            ('/data/mood-timeline', 2),
+            ('/data/average-mood-index', 2),
+            ('/data/search?q=work', 2),
+            ('/auth/users/search?q=user', 2),
+        ]
+        self.login('user0', 'password123')
+        for url, budget in budgets:
+            with self.subTest(url=url):
+                self.get(url, budget)
+
+    def test_shared_owners_load_in_one_query(self):
+        """Shared cards show owner names without a query per owner."""
+        self.login('user0', 'password123')
+        response, stats = self.get('/shared', 3)
+        for user in self.users[1:]:
+            self.assertIn(f'Owner: {user.username}'.encode(), response.data)
+        self.assertEqual(stats.repeated(1), [])
+
+    def test_server_timing_and_n_plus_one_warning(self):
+        @self.app.route('/owner-names')
+        def owner_names():
+            # Lazy loads the owner of every entry: the pattern the warning is for
+            return ','.join(d.owner.username for d in DiaryEntry.query.all())
+
+        self.app.config['SQL_N_PLUS_ONE_THRESHOLD'] = 3
+        self.login('user0', 'password123')
+        response, _ = self.get('/data/search?q=work', 2)
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.get('/owner-names', 10)
+        # One lazy load per owner
+        self.assertIn('Possible N+1 query in GET /owner-names: ran 8 times', logs.output[0])
+
+
+class SearchTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='finder', email='finder@example.com')
+        self.user.set_password('password123')
+        self.other = User(username='other', email='other@example.com')
+        self.other.set_password('password123')
+        db.session.add_all([self.user, self.other])
+        db.session.commit()
+        self.beach = DiaryEntry(title='Beach day', content='Swimming <b>all</b> afternoon, then dinner.',
+                                owner_id=self.user.id)
+        self.rain = DiaryEntry(title='Rainy walk', content='A long walk to the beach in the rain.',
+                               owner_id=self.user.id)
+        self.hidden = DiaryEntry(title='Beach trip', content='Someone else at the beach.',
+                                 owner_id=self.other.id)
+        db.session.add_all([self.beach, self.rain, self.hidden])
+        db.session.commit()
+
+    def matching(self, query):
+        from app.data_handling import search
+        return {d.id for d in search.filter_query(DiaryEntry.query, query).all()}
+
+    def test_triggers_keep_index_in_sync(self):
+        """Inserts, edits and deletes are reflected in the FTS5 index."""
+        from app.data_handling import search
+        self.assertIsInstance(search.get_search(), search.SqliteFtsSearch)
+        self.assertEqual(self.matching('beach'), {self.beach.id, self.rain.id, self.hidden.id})
+        self.rain.content = 'A long walk in the rain.'
+        db.session.commit()
+        self.assertEqual(self.matching('beach'), {self.beach.id, self.hidden.id})
+        self.assertEqual(self.matching('swim'), {self.beach.id})  # Prefix match
+        db.session.delete(self.beach)
+        db.session.commit()
+        self.assertEqual(self.matching('swim'), set())
+        self.assertEqual(self.matching('  "* '), {self.rain.id, self.hidden.id})  # No terms
+
+    def test_search_endpoint_ranks_and_highlights(self):
+        """Title matches rank first, and snippets are escaped apart from <mark>."""
+        with self.client:
+            self.login('finder', 'password123')
+            hits = self.client.get('/data/search?q=beach').get_json()
+            self.assertEqual([hit['id'] for hit in hits], [self.beach.id, self.rain.id])
+            self.assertEqual(hits[0]['title_html'], '<mark>Beach</mark> day')
+            self.assertIn('<mark>beach</mark>', hits[1]['snippet_html'])
+            hits = self.client.get('/data/search?q=swimming').get_json()
+            self.assertIn('&lt;b&gt;all&lt;/b&gt;', hits[0]['snippet_html'])
+            self.assertEqual(self.client.get('/data/search?q=').get_json(), [])
+
+    def test_home_search_uses_index(self):
+        """The home dashboard's search filter finds the user's own matches."""
+        with self.client:
+            self.login('finder', 'password123')
+            response = self.client.get('/home?search=rain')
+            self.assertIn(b'Rainy walk', response.data)
+            self.assertNotIn(b'Beach day', response.data)
+            self.assertNotIn(b'Beach trip', response.data)
+
+class MoodRollupTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='roller', email='roller@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def rollup(self):
+        from app.models import DailyMoodRollup
+        return {(r.day.isoformat(), r.emotion): (r.entry_count, round(r.score_sum, 6))
+                for r in DailyMoodRollup.query.filter_by(user_id=self.user.id)}
+
+    def add(self, label, score, created_at):
+        diary = DiaryEntry(title='t', content='c', owner_id=self.user.id, created_at=created_at,
+                           dominant_emotion_label=label, dominant_emotion_score=score,
+                           analyzed=label is not None)
+        db.session.add(diary)
+        db.session.commit()
+        return diary
+
+    def test_rollup_follows_entry_changes(self):
+        """Creates, re-analyses, edits and deletes adjust the Perth-day totals."""
+        from datetime import datetime
+        from app.data_handling import rollup
+        # 20:00 UTC is the next morning in Perth
+        late = self.add('joy', 0.5, datetime(2025, 5, 1, 20, 0))
+        early = self.add('joy', 0.25, datetime(2025, 5, 2, 1, 0))
+        pending = self.add(None, None, datetime(2025, 5, 2, 2, 0))
+        self.assertEqual(self.rollup(), {('2025-05-02', 'joy'): (2, 0.75)})
+
+        pending.update_emotion_analysis([[{'label': 'sadness', 'score': 0.9}]])
+        early.created_at = datetime(2025, 5, 3, 1, 0)
+        db.session.commit()
+        self.assertEqual(self.rollup(), {('2025-05-02', 'joy'): (1, 0.5),
+                                         ('2025-05-02', 'sadness'): (1, 0.9),
+                                         ('2025-05-03', 'joy'): (1, 0.25)})
+
+        db.session.delete(late)
+        db.session.commit()
+        expected = {('2025-05-02', 'sadness'): (1, 0.9), ('2025-05-03', 'joy'): (1, 0.25)}
+        self.assertEqual(self.rollup(), expected)
+
+        # Nothing is flushed on rollback
+        early.dominant_emotion_label = 'anger'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.rollup(), expected)
+        self.assertEqual(rollup.rebuild(), 2)
+        self.assertEqual(self.rollup(), expected)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_backfill_updates_rollup(self, mock_classifier):
+        """Bulk UPDATEs from the backfill are tracked too."""
+        from datetime import datetime
+        mock_classifier.side_effect = lambda texts, **kwargs: [
+            [{'label': 'fear', 'score': 0.5}] for _ in texts
+        ]
+        self.add('joy', 0.5, datetime(2025, 5, 1, 12, 0))
+        self.add(None, None, datetime(2025, 5, 1, 13, 0))
+        result = self.app.test_cli_runner().invoke(args=['reanalyze', '--batch-size', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.rollup(), {('2025-05-01', 'fear'): (2, 1.0)})
+
+    def test_chart_endpoints_read_rollup(self):
+        """The charts read only the rollup, and the rebuild command repairs it."""
+        from datetime import datetime, timedelta
+        from app.models import DailyMoodRollup
+        now = datetime.utcnow()
+        self.add('joy', 0.8, now)
+        self.add('joy', 0.6, now)
+        self.add('anger', 0.9, now)
+        self.add('neutral', 0.7, now - timedelta(days=40))
+        with self.client:
+            self.login('roller', 'password123')
+            timeline = self.client.get('/data/mood-timeline?days=30').get_json()
+            self.assertEqual(sorted((row['emotion'], row['count']) for row in timeline),
+                             [('anger', 1), ('joy', 2)])
+            index = self.client.get('/data/average-mood-index').get_json()
+            self.assertEqual(index['average_mood_index'], 0.33)
+
+            DailyMoodRollup.query.delete()
+            db.session.commit()
+            self.assertEqual(self.client.get('/data/mood-timeline').get_json(), [])
+
+            result = self.app.test_cli_runner().invoke(args=['mood-rollup', 'rebuild'])
+            self.assertIn('3 rows', result.output)
+            self.assertEqual(len(self.client.get('/data/mood-timeline').get_json()), 2)
+
+class EmotionScoreStorageTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='scorer', email='scorer@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def add(self, result):
+        diary = DiaryEntry(title='t', content='c', owner_id=self.user.id)
+        diary.update_emotion_analysis(result)
+        db.session.add(diary)
+        db.session.commit()
+        return diary
+
+    def test_scores_round_trip_through_columns(self):
+        """Scores are stored per label and read back in the old list shape."""
+        from app.models import EMOTION_LABELS
+        from app.data_handling.analyzers import LABELS
+        self.assertEqual(EMOTION_LABELS, LABELS)
+        diary = self.add([[{'label': 'fear', 'score': 0.2}, {'label': 'joy', 'score': 0.7},
+                           {'label': 'neutral', 'score': 0.1}]])
+        db.session.expire_all()
+        self.assertEqual(diary.score_joy, 0.7)
+        self.assertIsNone(diary.score_anger)
+        self.assertEqual(diary.emotion_details, [{'label': 'joy', 'score': 0.7},
+                                                 {'label': 'fear', 'score': 0.2},
+                                                 {'label': 'neutral', 'score': 0.1}])
+        self.assertEqual(diary.dominant_emotion_code, EMOTION_LABELS.index('joy'))
+        self.assertEqual(DiaryEntry.query.filter_by(
+            dominant_emotion_code=EMOTION_LABELS.index('joy')).all(), [diary])
+        # Re-analysis clears the previous distribution
+        diary.update_emotion_analysis([])
+        self.assertIsNone(diary.emotion_details)
+        self.assertIsNone(diary.dominant_emotion_code)
+        # Setting the label directly keeps the code in step
+        diary.dominant_emotion_label = 'sadness'
+        self.assertEqual(diary.dominant_emotion_code, EMOTION_LABELS.index('sadness'))
+
+    def test_load_score_arrays(self):
+        """Many entries load as one float32 matrix plus dominant codes."""
+        import numpy as np
+        from app.data_handling import scores
+        first = self.add([[{'label': 'anger', 'score': 0.6}, {'label': 'joy', 'score': 0.4}]])
+        self.add([])  # Analyzed, no dominant emotion
+        DiaryEntry(title='t', content='c', owner_id=self.user.id)  # Never analyzed
+        ids, matrix, codes = scores.load_score_arrays(chunk_size=1)
+        self.assertEqual(ids.tolist(), [first.id, first.id + 1])
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (2, 7))
+        self.assertAlmostEqual(float(matrix[0, 0]), 0.6, places=6)
+        self.assertTrue(np.isnan(matrix[1]).all())
+        self.assertEqual(codes.tolist(), [0, -1])
+        ids, matrix, codes = scores.load_score_arrays([DiaryEntry.owner_id == -1])
+        self.assertEqual(matrix.shape, (0, 7))
+
+class AnalysisQueueTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['ANALYSIS_QUEUE_EAGER'] = False
+        self.user = User(username='testuser', email='test@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def test_worker_pool_starts_with_first_request(self):
+        """Creating the app (as every ``flask`` command does) starts no workers."""
+        from app.data_handling import jobs
+
+        class WorkerConfig(TestConfig):
+            ANALYSIS_QUEUE_EAGER = False
+            ANALYSIS_WORKERS = 2
+
+        app = create_app(WorkerConfig)
+        with app.app_context():
+            db.create_all()
+        self.assertNotIn('analysis_workers', app.extensions)
+        with patch.object(jobs.AnalysisWorkerPool, 'start') as start:
+            app.test_client().get('/')
+            app.test_client().get('/')
+        start.assert_called_once_with()
+        self.assertEqual(app.extensions['analysis_workers'].size, 2)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_create_defers_analysis(self, mock_classifier):
+        """Saving returns before inference; a worker applies the result later."""
+        from app.data_handling import jobs
+        from app.models import AnalysisJob
+        mock_classifier.return_value = [[{'label': 'joy', 'score': 0.8}]]
+
+        with self.client:
+            self.login('testuser', 'password123')
+            self.client.post('/data/create_diary', data={
+                'title': 'Queued', 'content': 'Queued content'
+            }, follow_redirects=True)
+            self.assertIn('Diary created! Emotion analysis is running in the background.',
+                          get_flashed_messages())
+            mock_classifier.assert_not_called()
+
+            diary = DiaryEntry.query.filter_by(title='Queued').first()
+            self.assertFalse(diary.analyzed)
+            status = self.client.get(f'/data/analysis_status/{diary.id}').get_json()
+            self.assertEqual(status['status'], AnalysisJob.PENDING)
+            self.assertFalse(status['analyzed'])
+
+            self.assertEqual(jobs.process_pending(), 1)
+            status = self.client.get(f'/data/analysis_status/{diary.id}').get_json()
+            self.assertEqual(status['status'], AnalysisJob.DONE)
+            self.assertTrue(status['analyzed'])
+            self.assertEqual(status['dominant_emotion_label'], 'joy')
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_failed_job_is_retried(self, mock_classifier):
+        """A job that raises goes back to pending until attempts run out."""
+        from app.data_handling import jobs
+        from app.models import AnalysisJob
+        self.app.config['ANALYSIS_MAX_ATTEMPTS'] = 2
+        mock_classifier.side_effect = RuntimeError('model exploded')
+
+        diary = DiaryEntry(title='Flaky', content='Flaky content', owner_id=self.user.id)
+        db.session.add(diary)
+        job = jobs.enqueue_analysis(diary)
+        db.session.commit()
+
+        jobs.process_pending(limit=1)
+        self.assertEqual(db.session.get(AnalysisJob, job.id).status, AnalysisJob.PENDING)
+        jobs.process_pending(limit=1)
+        job = db.session.get(AnalysisJob, job.id)
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertEqual(job.error, 'model exploded')
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_worker_scores_claimed_jobs_together(self, mock_classifier):
+        """A worker claims a batch of jobs and scores them in one forward pass."""
+        from app.data_handling import jobs
+        from app.models import AnalysisJob
+        self.app.config['ANALYSIS_BATCH_MAX_SIZE'] = 4
+        mock_classifier.side_effect = lambda texts, **kw: [
+            [{'label': 'joy', 'score': 0.8}] for _ in texts]
+        for i in range(6):
+            diary = DiaryEntry(title=f'Batch {i}', content=f'Batch content {i}',
+                               owner_id=self.user.id)
+            db.session.add(diary)
+            jobs.enqueue_analysis(diary)
+        db.session.commit()
+
+        self.assertEqual(jobs.process_pending(), 6)
+        self.assertEqual([len(c.args[0]) for c in mock_classifier.call_args_list], [4, 2])
+        self.assertEqual(AnalysisJob.query.filter_by(status=AnalysisJob.DONE).count(), 6)
+        self.assertTrue(all(d.analyzed for d in DiaryEntry.query.all()))
+
+        # A failing batch is retried one job at a time
+        def classify(texts, **kw):
+            if any('bad' in text for text in texts):
+                raise RuntimeError('model exploded')
+            return [[{'label': 'joy', 'score': 0.8}] for _ in texts]
+
+        mock_classifier.side_effect = classify
+        for title in ('good', 'bad'):
+            diary = DiaryEntry(title=title, content=f'{title} content', owner_id=self.user.id)
+            db.session.add(diary)
+            jobs.enqueue_analysis(diary)
+        db.session.commit()
+        self.assertEqual(jobs.process_pending(limit=2), 2)
+        statuses = {job.diary.title: job.status for job in AnalysisJob.query
+                    if job.diary.title in ('good', 'bad')}
+        self.assertEqual(statuses, {'good': AnalysisJob.DONE, 'bad': AnalysisJob.PENDING})
+
+    def test_full_queue_rejects_with_retry_after(self):
+        """Over capacity with the reject policy answers 503 without saving."""
+        from app.data_handling import jobs
+        self.app.config.update(ANALYSIS_QUEUE_MAX_PENDING=1,
+                               ANALYSIS_OVERLOAD_POLICY='reject',
+                               ANALYSIS_RETRY_AFTER=7)
+        diary = DiaryEntry(title='Waiting', content='Waiting', owner_id=self.user.id)
+        db.session.add(diary)
+        jobs.enqueue_analysis(diary)
+        db.session.commit()
+
+        with self.client:
+            self.login('testuser', 'password123')
+            response = self.client.post('/data/create_diary', data={
+                'title': 'Rejected', 'content': 'Rejected content'
+            })
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '7')
+            self.assertIsNone(DiaryEntry.query.filter_by(title='Rejected').first())
+            status = self.client.get('/data/analyzer-status').get_json()
+            self.assertEqual(status['admission']['rejected'], 1)
+
+    def test_gate_bounds_waiters(self):
+        """Callers beyond the concurrency limit and wait queue are turned away."""
+        from app.data_handling.admission import InferenceGate, Overloaded
+        gate = InferenceGate(max_concurrent=1, max_waiting=0, retry_after=3)
+        with gate:
+            self.assertTrue(gate.saturated)
+            with self.assertRaises(Overloaded) as raised:
+                gate.acquire()
+            self.assertEqual(raised.exception.retry_after, 3)
+        self.assertFalse(gate.saturated)
+        self.assertEqual(gate.stats()['admitted'], 1)
+        self.assertEqual(gate.stats()['rejected'], 1)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_overloaded_job_stays_pending(self, mock_classifier):
+        """A job that finds the model busy is requeued without using an attempt."""
+        from app.data_handling import analysis, jobs
+        from app.data_handling.admission import InferenceGate
+        from app.models import AnalysisJob
+        gate = InferenceGate(max_concurrent=1, max_waiting=0)
+        diary = DiaryEntry(title='Busy', content='Busy content', owner_id=self.user.id)
+        db.session.add(diary)
+        job = jobs.enqueue_analysis(diary)
+        db.session.commit()
+
+        with patch.object(analysis, 'gate', gate), gate:
+            self.assertEqual(jobs.process_pending(), 0)
+        job = db.session.get(AnalysisJob, job.id)
+        self.assertEqual(job.status, AnalysisJob.PENDING)
+        self.assertEqual(job.attempts, 0)
+        mock_classifier.assert_not_called()
+
+class ResultCacheTests(BaseTestCase):
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_repeated_content_skips_model(self, mock_classifier):
+        """Equivalent content is served from memory, then from the table."""
+        from app.data_handling import analysis, cache
+        mock_classifier.return_value = [[{'label': 'joy', 'score': 0.9}]]
+
+        first = analysis.analyze('Dear diary,  today was\ngreat.')
+        db.session.commit()
+        second = analysis.analyze('Dear diary, today was great. ')
+        self.assertEqual(first, second)
+        self.assertEqual(mock_classifier.call_count, 1)
+
+        result_cache = cache.get_cache()
+        result_cache.clear_memory()
+        self.assertEqual(analysis.analyze('Dear diary, today was great.'), first)
+        self.assertEqual(mock_classifier.call_count, 1)
+        self.assertEqual(result_cache.stats()['memory_hits'], 1)
+        self.assertEqual(result_cache.stats()['db_hits'], 1)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_cascade_caches_transformer_results(self, mock_classifier):
+        """Escalated texts are cached; texts the first stage settles are not."""
+        from app.data_handling import analysis, analyzers, cache
+        mock_classifier.side_effect = lambda texts, **kw: [
+            [{'label': 'neutral', 'score': 0.9}] for _ in texts]
+        cascade = analyzers.CascadeAnalyzer(analyzers.LexiconAnalyzer(),
+                                            analysis.transformer, threshold=0.6)
+        texts = ['Happy happy joy, what a wonderful day', 'Went to the shops']
+        with patch.object(analysis, 'analyzer', cascade):
+            first = analysis.analyze_many(texts)
+            second = analysis.analyze_many(texts)
+        self.assertEqual(mock_classifier.call_count, 1)
+        self.assertEqual(second, first)
+        self.assertEqual([analysis.provenance(r) for r in second],
+                         [analysis.provenance(r) for r in first])
+        self.assertEqual(analysis.provenance(second[1])[1], 'cascade:transformer')
+        self.assertEqual(cache.get_cache().stats()['memory_hits'], 1)
+        self.assertEqual(cascade.stats()['texts'], 3)
+
+    def test_key_depends_on_model_version(self):
+        """Results are never shared across model versions."""
+        from app.data_handling.cache import cache_key
+        self.assertNotEqual(cache_key('text', 'model', '1'), cache_key('text', 'model', '2'))
+        self.assertEqual(cache_key(' text ', 'model', '1'), cache_key('text', 'model', '1'))
+
+    def test_prune_by_size_and_age(self):
+        """Pruning keeps the most recently used rows."""
+        from datetime import datetime, timedelta
+        from app.data_handling import cache
+        from app.models import EmotionCacheEntry
+        now = datetime.utcnow()
+        for i in range(5):
+            db.session.add(EmotionCacheEntry(key=str(i), model_name='m', scores=[],
+                                             last_used_at=now - timedelta(days=i * 10)))
+        db.session.commit()
+
+        self.assertEqual(cache.prune(max_age_days=25), 2)
+        self.assertEqual(cache.prune(max_rows=2), 1)
+        self.assertEqual({e.key for e in EmotionCacheEntry.query.all()}, {'0', '1'})
+
+class ChunkingTests(BaseTestCase):
+    def test_split_windows_overlap(self):
+        """Windows are bounded and consecutive windows overlap by the stride."""
+        from app.data_handling.chunking import split_windows
+        text = ' '.join(f'w{i}' for i in range(10))
+        windows = split_windows(text, max_tokens=4, stride=1)
+        self.assertEqual([w for w, _ in windows],
+                         ['w0 w1 w2 w3', 'w3 w4 w5 w6', 'w6 w7 w8 w9'])
+        self.assertEqual(split_windows('short text', max_tokens=4), [('short text', 2)])
+
+    def test_aggregate(self):
+        """Mean is weighted by window length; max is renormalized."""
+        from app.data_handling.chunking import aggregate
+        windows = [
+            [{'label': 'joy', 'score': 1.0}, {'label': 'sadness', 'score': 0.0}],
+            [{'label': 'joy', 'score': 0.0}, {'label': 'sadness', 'score': 1.0}],
+        ]
+        mean = {i['label']: i['score'] for i in aggregate(windows, [3, 1])}
+        self.assertAlmostEqual(mean['joy'], 0.75)
+        self.assertAlmostEqual(mean['sadness'], 0.25)
+        maximum = {i['label']: i['score'] for i in aggregate(windows, [3, 1], method='max')}
+        self.assertAlmostEqual(maximum['joy'], 0.5)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_long_entry_is_one_batch(self, mock_classifier):
+        """All windows of a long entry are classified in a single call."""
+        from app.data_handling import analysis
+        self.app.config['ANALYSIS_CHUNK_MAX_TOKENS'] = 5
+        self.app.config['ANALYSIS_CHUNK_STRIDE'] = 0
+        mock_classifier.side_effect = lambda texts, **kwargs: [
+            [{'label': 'joy', 'score': 0.6}, {'label': 'fear', 'score': 0.4}] for _ in texts
+        ]
+
+        result = analysis.analyze(' '.join(['word'] * 23))
+        self.assertEqual(mock_classifier.call_count, 1)
+        self.assertEqual(len(mock_classifier.call_args[0][0]), 5)
+        self.assertEqual(result[0][0]['label'], 'joy')
+        self.assertAlmostEqual(result[0][0]['score'], 0.6)
+
+class BackfillTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='testuser', email='test@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+        for i in range(5):
+            db.session.add(DiaryEntry(title=f'Entry {i}', content=f'Content {i}',
+                                      owner_id=self.user.id))
+        db.session.commit()
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_reanalyze_command(self, mock_classifier):
+        """Unanalyzed entries are analyzed and tagged with the model version."""
+        from app.data_handling.analysis import current_model_version
+        mock_classifier.side_effect = lambda texts, **kwargs: [
+            [{'label': 'joy', 'score': 0.7}] for _ in texts
+        ]
+        result = self.app.test_cli_runner().invoke(
+            args=['reanalyze', '--unanalyzed', '--batch-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Re-analyzed 5 entries', result.output)
+        self.assertEqual(mock_classifier.call_count, 3)
+        for diary in DiaryEntry.query.all():
+            self.assertTrue(diary.analyzed)
+            self.assertEqual(diary.dominant_emotion_label, 'joy')
+            self.assertEqual(diary.analysis_model_version, current_model_version())
+
+        # Nothing is stale any more
+        result = self.app.test_cli_runner().invoke(args=['reanalyze', '--stale'])
+        self.assertIn('Re-analyzed 0 entries', result.output)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_reanalyze_resumes_from_checkpoint(self, mock_classifier):
+        """A run that dies mid-way continues after the last committed chunk."""
+        from app.data_handling import backfill
+        from app.models import BackfillCheckpoint
+        calls = []
+
+        def classify(texts, **kwargs):
+            calls.append(list(texts))
+            if len(calls) == 2:
+                raise RuntimeError('killed')
+            return [[{'label': 'sadness', 'score': 0.6}] for _ in texts]
+
+        mock_classifier.side_effect = classify
+        with self.assertRaises(RuntimeError):
+            backfill.reanalyze([], chunk_size=2, checkpoint_name='test')
+        db.session.rollback()
+        self.assertEqual(db.session.get(BackfillCheckpoint, 'test').processed, 2)
+
+        self.assertEqual(backfill.reanalyze([], chunk_size=2, checkpoint_name='test'), 3)
+        self.assertEqual(calls[2], ['Content 2', 'Content 3'])
+        self.assertIsNone(db.session.get(BackfillCheckpoint, 'test'))
+        self.assertEqual(DiaryEntry.query.filter_by(analyzed=True).count(), 5)
+
+class DatabaseEngineTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from config import ProductionConfig
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        class FileConfig(ProductionConfig):
+            SECRET_KEY = 'test-secret-key'
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{self.tmpdir.name}/app.db'
+            EMOTION_MODEL_WARMUP = False
+            ANALYSIS_WORKERS = 0
+
+        self.app = create_app(FileConfig)
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_profiles(self):
+        from config import DevelopmentConfig, ProductionConfig, get_config
+        self.assertIs(get_config('production'), ProductionConfig)
+        with patch.dict('os.environ', {'APP_CONFIG': 'development'}):
+            self.assertIs(get_config(), DevelopmentConfig)
+        with self.assertRaises(ValueError):
+            get_config('staging')
+        self.assertTrue(ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS['pool_pre_ping'])
+
+    def test_sqlite_pragmas_on_every_connection(self):
+        with self.app.app_context(), db.engine.connect() as conn:
+            pragma = lambda name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+            self.assertEqual(pragma('busy_timeout'), 5000)
+            self.assertEqual(pragma('cache_size'), -64000)
+
+    def test_concurrent_writers_and_readers(self):
+        """Writers committing while readers query never see "database is locked"."""
+        import threading
+        with self.app.app_context():
+            users = [User(username=f'writer{i}', email=f'writer{i}@example.com',
+                          password_hash='x') for i in range(4)]
+            db.session.add_all(users)
+            db.session.commit()
+            owner_ids = [user.id for user in users]
+
+        errors = []
+        writing = threading.Event()
+
+        def write(owner_id):
+            with self.app.app_context():
+                try:
+                    for i in range(15):
+                        db.session.add(DiaryEntry(title=f'Entry {i}', content='Busy day at work.',
+                                                  owner_id=owner_id))
+                        db.session.commit()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        def read(owner_id):
+            with self.app.app_context():
+                try:
+                    while writing.is_set():
+                        DiaryEntry.for_user(owner_id).order_by(
+                            DiaryEntry.created_at.desc()).limit(24).all()
+                        db.session.commit()
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    db.session.remove()
+
+        writing.set()
+        readers = [threading.Thread(target=read, args=(i,)) for i in owner_ids]
+        writers = [threading.Thread(target=write, args=(i,)) for i in owner_ids]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writing.clear()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.app.app_context():
+            self.assertEqual(DiaryEntry.query.count(), 60)
+
+class SidecarTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = f'{self.tmpdir.name}/inference.sock'
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.tmpdir.cleanup()
+
+    def start_server(self, label):
+        import threading
+        from app.data_handling.sidecar import InferenceServer
+        server = InferenceServer(
+            self.socket_path,
+            lambda texts: [[{'label': label, 'score': float(len(t))}] for t in texts],
+            status=lambda: {'state': 'ready'},
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def test_classify_over_socket(self):
+        """Batched requests round-trip through the framed protocol."""
+        from app.data_handling.sidecar import SidecarClient
+        self.start_server('joy')
+        client = SidecarClient(self.socket_path, timeout=5)
+        results = client.classify(['a', 'bbb'])
+        self.assertEqual(results, [[{'label': 'joy', 'score': 1.0}],
+                                   [{'label': 'joy', 'score': 3.0}]])
+        self.assertEqual(client.status()['state'], 'ready')
+
+    def test_client_reconnects_after_restart(self):
+        """A restarted server is picked up without recreating the client."""
+        from app.data_handling.sidecar import SidecarClient, SidecarUnavailable
+        server = self.start_server('joy')
+        client = SidecarClient(self.socket_path, timeout=5)
+        client.classify(['a'])
+
+        self.servers.remove(server)
+        server.shutdown()
+        server.server_close()
+        with self.assertRaises(SidecarUnavailable):
+            client.classify(['a'])
+
+        self.start_server('sadness')
+        self.assertEqual(client.classify(['a'])[0][0]['label'], 'sadness')
+
+    def test_client_does_not_resend_after_timeout(self):
+        """A slow request is given up on, not sent to the server a second time."""
+        import threading
+        from app.data_handling.sidecar import InferenceServer, SidecarClient, SidecarUnavailable
+        calls = []
+        release = threading.Event()
+
+        def slow(texts):
+            calls.append(texts)
+            release.wait(5)
+            return [[{'label': 'joy', 'score': 1.0}] for _ in texts]
+
+        server = InferenceServer(self.socket_path, slow)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        client = SidecarClient(self.socket_path, timeout=0.2)
+        with self.assertRaises(SidecarUnavailable):
+            client.classify(['a'])
+        release.set()
+        # Anything still queued on the server is classified before this
+        SidecarClient(self.socket_path, timeout=5).classify(['b'])
+        self.assertEqual([text for batch in calls for text in batch], ['a', 'b'])
+
+    def test_classifier_routes_to_sidecar(self):
+        """With a sidecar configured, no local model is loaded."""
+        from app.data_handling.analysis import EmotionClassifier
+        from app.data_handling.sidecar import SidecarClient
+        self.start_server('joy')
+        classifier = EmotionClassifier()
+        classifier.use_sidecar(SidecarClient(self.socket_path, timeout=5))
+        self.assertEqual(classifier('hi'), [[{'label': 'joy', 'score': 2.0}]])
+        self.assertEqual(classifier.state, 'cold')
+
+class IncrementalAnalysisTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['ANALYSIS_INCREMENTAL'] = True
+        # Make sure reuse comes from stored paragraphs, not the result cache
+        self.app.extensions.pop('emotion_cache', None)
+        self.user = User(username='testuser', email='test@example.com')
+        self.user.set_password('password123')
+        db.session.add(self.user)
+        db.session.commit()
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_edit_only_analyzes_changed_paragraphs(self, mock_classifier):
+        """Unchanged paragraphs reuse their stored scores."""
+        from app.models import DiaryParagraph
+        sent = []
+
+        def classify(texts, **kwargs):
+            sent.extend(texts)
+            return [[{'label': 'joy' if 'good' in t else 'sadness', 'score': 0.9}]
+                    for t in texts]
+
+        mock_classifier.side_effect = classify
+        with self.client:
+            self.login('testuser', 'password123')
+            self.client.post('/data/create_diary', data={
+                'title': 'Long', 'content': 'A good start.\n\nA bad middle.\n\nA good end.'
+            })
+            diary = DiaryEntry.query.filter_by(title='Long').first()
+            self.assertEqual(sent, ['A good start.', 'A bad middle.', 'A good end.'])
+            self.assertEqual(diary.dominant_emotion_label, 'joy')
+            self.assertEqual(diary.paragraphs.count(), 3)
+
+            sent.clear()
+            self.client.post(f'/data/edit_diary/{diary.id}', data={
+                'title': 'Long', 'content': 'A good start.\n\nA bad middle, really bad.\n\nA good end.'
+            })
+            self.assertEqual(sent, ['A bad middle, really bad.'])
+            diary = db.session.get(DiaryEntry, diary.id)
+            self.assertEqual(
+                [p.position for p in diary.paragraphs], [0, 1, 2])
+            self.assertEqual(DiaryParagraph.query.count(), 3)
+
+    def test_split_paragraphs(self):
+        """Blank lines separate paragraphs; single newlines do not."""
+        from app.data_handling.paragraphs import split_paragraphs
+        self.assertEqual(split_paragraphs('one\ntwo\n\n  \nthree\n'), ['one\ntwo', 'three'])
+        self.assertEqual(split_paragraphs('   '), ['   '])
+
+class AnalyzerTests(BaseTestCase):
+    def test_model_not_loaded_on_startup(self):
+        """Creating the app must not load the transformer model."""
+        from app.data_handling.analysis import emotion_classifier
+        self.assertFalse(emotion_classifier.is_ready)
+        self.assertEqual(emotion_classifier.state, 'cold')
+
+        response = self.client.get('/data/analyzer-status')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['state'], 'cold')
+        self.assertFalse(response.get_json()['ready'])
+
+    def test_lazy_load_on_first_call(self):
+        """The pipeline is built once, on first use."""
+        from app.data_handling.analysis import EmotionClassifier
+        classifier = EmotionClassifier()
+        fake_pipeline = Mock(return_value=[[{'label': 'joy', 'score': 1.0}]])
+        fake_transformers = Mock(pipeline=Mock(return_value=fake_pipeline))
+        with patch.dict('sys.modules', {'transformers': fake_transformers}):
+            self.assertEqual(classifier('text'), [[{'label': 'joy', 'score': 1.0}]])
+            classifier('more text')
+        self.assertTrue(classifier.is_ready)
+        self.assertEqual(fake_transformers.pipeline.call_count, 1)
+
+    def test_lexicon_analyzer_labels(self):
+        """The lexicon scorer covers the same seven labels as the model."""
+        from app.data_handling.analyzers import LABELS, LexiconAnalyzer
+        scores = LexiconAnalyzer().classify(['What a wonderful, happy day!',
+                                             'I was not happy today.'])
+        self.assertEqual({s['label'] for s in scores[0]}, set(LABELS))
+        self.assertAlmostEqual(sum(s['score'] for s in scores[0]), 1.0)
+        self.assertEqual(scores[0][0]['label'], 'joy')
+        self.assertEqual(scores[1][0]['label'], 'sadness')
+
+    def test_lexicon_analyzer_batch(self):
+        """A batch is scored per text, with negation kept inside each text."""
+        from app.data_handling.analyzers import LexiconAnalyzer
+        texts = ['What a wonderful, happy day!', 'I was not happy today.',
+                 'Went to the shops', '', 'Scared and angry, not scared at all',
+                 'Not', 'happy']
+        results = LexiconAnalyzer().classify(texts)
+        # 0.25 smoothing per label and a 0.5 neutral prior: 2.25 with no hits
+        expected = [('joy', 2.25 / 4.25), ('sadness', 1.25 / 3.25), ('neutral', 0.75 / 2.25),
+                    ('neutral', 0.75 / 2.25), ('neutral', 1.75 / 5.25),
+                    ('neutral', 0.75 / 2.25), ('joy', 1.25 / 3.25)]
+        self.assertEqual(len(results), len(texts))
+        for scores, (label, score) in zip(results, expected):
+            self.assertEqual(scores[0]['label'], label)
+            self.assertAlmostEqual(scores[0]['score'], score)
+            self.assertAlmostEqual(sum(s['score'] for s in scores), 1.0)
+        # Ties keep label order
+        self.assertEqual([s['label'] for s in results[4][:3]], ['neutral', 'anger', 'fear'])
+        self.assertEqual(LexiconAnalyzer().classify([]), [])
+
+    def test_circuit_breaker_trips_and_recovers(self):
+        """Slow calls open the breaker; a fast trial call closes it again."""
+        from app.data_handling.analyzers import CircuitBreaker
+        breaker = CircuitBreaker(latency_threshold=0.1, trip_after=2, reset_after=0)
+        breaker.record(0.5)
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record(0.5)
+        self.assertEqual(breaker.state, 'open')
+        self.assertTrue(breaker.allow())  # reset_after elapsed: half-open trial
+        breaker.record(0.01)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.trips, 1)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_fallback_scored_entries_are_flagged(self, mock_classifier):
+        """A failing transformer falls back to the lexicon and flags the entry."""
+        from app.data_handling import analysis, analyzers, backfill
+        mock_classifier.side_effect = RuntimeError('model unavailable')
+        user = User(username='fallback', email='fallback@example.com')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+
+        with patch.object(analysis, 'fallback', analyzers.LexiconAnalyzer()), \
+                patch.object(analysis, 'breaker', analyzers.CircuitBreaker()), \
+                self.client:
+            self.client.post('/auth/login', data={'username': 'fallback',
+                                                  'password': 'password123'})
+            self.client.post('/data/create_diary', data={
+                'title': 'Degraded', 'content': 'So excited and happy today!'
+            })
+            diary = DiaryEntry.query.filter_by(title='Degraded').first()
+            self.assertTrue(diary.analyzed)
+            self.assertEqual(diary.dominant_emotion_label, 'joy')
+            self.assertEqual(diary.analysis_source, 'lexicon')
+            self.assertEqual(diary.analysis_model_version, 'lexicon-v1')
+            self.assertEqual(analysis.breaker.stats()['fallback_calls'], 1)
+
+        flagged = DiaryEntry.query.filter(
+            *backfill.build_filters(fallback_scored=True)).all()
+        self.assertEqual([d.id for d in flagged], [diary.id])
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_overloaded_is_not_a_breaker_failure(self, mock_classifier):
+        """A full gate is reported to the caller, even with a fallback."""
+        from app.data_handling import admission, analysis, analyzers
+        gate = admission.InferenceGate(max_concurrent=1, max_waiting=0)
+        breaker = analyzers.CircuitBreaker(trip_after=1, reset_after=0)
+        with patch.object(analysis, 'fallback', analyzers.LexiconAnalyzer()), \
+                patch.object(analysis, 'breaker', breaker), \
+                patch.object(analysis, 'gate', gate):
+            gate.acquire()
+            with self.assertRaises(admission.Overloaded):
+                analysis.analyze_many(['So happy today'])
+            self.assertEqual(breaker.stats()['fallback_calls'], 0)
+            self.assertEqual(breaker.state, 'closed')
+
+            # A half-open trial turned away at the gate leaves the next
+            # caller to make the trial
+            breaker.record(0, ok=False)
+            with self.assertRaises(admission.Overloaded):
+                analysis.analyze_many(['So happy today'])
+            self.assertEqual(breaker.state, 'open')
+            self.assertEqual(breaker.trips, 1)
+        mock_classifier.assert_not_called()
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_cascade_escalates_uncertain_texts(self, mock_classifier):
+        """Only texts the lexicon is unsure about reach the transformer."""
+        from app.data_handling import analysis, analyzers
+        mock_classifier.side_effect = lambda texts, **kw: [
+            [{'label': 'neutral', 'score': 0.9}] for _ in texts]
+        cascade = analyzers.CascadeAnalyzer(analyzers.LexiconAnalyzer(),
+                                            analysis.transformer, threshold=0.6)
+        with patch.object(analysis, 'analyzer', cascade):
+            results = analysis.analyze_many(['Happy happy joy, what a wonderful day',
+                                             'Went to the shops'])
+        self.assertEqual(mock_classifier.call_args.args[0], ['Went to the shops'])
+        self.assertEqual(analysis.provenance(results[0])[1], 'cascade:lexicon')
+        self.assertEqual(analysis.provenance(results[1])[1], 'cascade:transformer')
+        self.assertEqual(results[1], [[{'label': 'neutral', 'score': 0.9}]])
+        self.assertEqual(cascade.stats()['escalation_rate'], 0.5)
+
+    def test_cascade_report(self):
+        """The report simulates each threshold from one pass per stage."""
+        from app.data_handling import analyzers
+        full = Mock(classify=Mock(return_value=[[{'label': 'joy', 'score': 0.9}],
+                                                [{'label': 'sadness', 'score': 0.9}]]))
+        full.name = 'transformer'
+        report = analyzers.evaluate_cascade(
+            analyzers.LexiconAnalyzer(), full,
+            ['So happy and excited', 'An ordinary day'], ['joy', 'sadness'],
+            thresholds=[0.0, 0.99])
+        self.assertEqual(report['second_stage']['accuracy'], 1.0)
+        never, always = report['thresholds']
+        self.assertEqual((never['escalation_rate'], never['accuracy']), (0.0, 0.5))
+        self.assertEqual(never['accuracy_gap'], 0.5)
+        self.assertEqual((always['escalation_rate'], always['accuracy']), (1.0, 1.0))
+
+    def test_unknown_backend_is_rejected(self):
+        """EMOTION_BACKEND must name a supported backend."""
+        from app.data_handling.analysis import EmotionClassifier
+        with self.assertRaises(ValueError):
+            EmotionClassifier().configure('model', backend='tensorrt')
+
+    def test_onnx_backend_serves_the_quantized_export(self):
+        """An export made with --quantize is loaded from its quantized file."""
+        import os
+        import tempfile
+        from app.data_handling import backends
+        ort_model = Mock()
+        fake_modules = {
+            'transformers': Mock(),
+            'optimum': Mock(),
+            'optimum.onnxruntime': Mock(ORTModelForSequenceClassification=ort_model),
+        }
+        with tempfile.TemporaryDirectory() as export_dir, \
+                patch.dict('sys.modules', fake_modules):
+            open(os.path.join(export_dir, backends.ONNX_FILE), 'w').close()
+            backends.load_pipeline(backends.ONNX, model_path=export_dir)
+            self.assertEqual(ort_model.from_pretrained.call_args.kwargs['file_name'], 'model.onnx')
+
+            open(os.path.join(export_dir, backends.ONNX_QUANTIZED_FILE), 'w').close()
+            backends.load_pipeline(backends.ONNX, model_path=export_dir)
+            self.assertEqual(ort_model.from_pretrained.call_args.kwargs['file_name'],
+                             'model_quantized.onnx')
+
+    def test_backend_parity_report(self):
+        """The parity check reports score deviation and label agreement."""
+        from app.data_handling.backends import compare
+
+        def fake_pipeline(joy, sadness):
+            return Mock(side_effect=lambda texts, **kwargs: [
+                [{'label': 'joy', 'score': joy}, {'label': 'sadness', 'score': sadness}]
+                for _ in texts
+            ])
+
+        report = compare(fake_pipeline(0.7, 0.3), fake_pipeline(0.6, 0.4), ['a', 'b'])
+        self.assertAlmostEqual(report['max_score_deviation'], 0.1)
+        self.assertEqual(report['label_agreement'], 1.0)
+
+        report = compare(fake_pipeline(0.7, 0.3), fake_pipeline(0.4, 0.6), ['a'])
+        self.assertEqual(report['label_agreement'], 0.0)
+
+class BatchingTests(unittest.TestCase):
+    def test_concurrent_submissions_share_a_batch(self):
+        """Texts submitted within the wait window go through one forward pass."""
+        from app.data_handling.batching import BatchDispatcher
+        calls = []
+
+        def classify(texts):
+            calls.append(list(texts))
+            return [[{'label': 'joy', 'score': len(t)}] for t in texts]
+
+        dispatcher = BatchDispatcher(classify, max_batch_size=8, max_wait_ms=200)
+        futures = dispatcher.submit_many(['a', 'bb', 'ccc'])
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(calls, [['a', 'bb', 'ccc']])
+        self.assertEqual([r[0]['score'] for r in results], [1, 2, 3])
+        self.assertEqual(dispatcher.stats()['batch_size_histogram'], {'3': 1})
+
+    def test_batch_size_is_bounded(self):
+        """No forward pass exceeds max_batch_size."""
+        from app.data_handling.batching import BatchDispatcher
+        sizes = []
+
+        def classify(texts):
+            sizes.append(len(texts))
+            return [[] for _ in texts]
+
+        dispatcher = BatchDispatcher(classify, max_batch_size=2, max_wait_ms=50)
+        for f in dispatcher.submit_many(['a', 'b', 'c', 'd', 'e']):
+            f.result(timeout=5)
+        self.assertTrue(all(size <= 2 for size in sizes))
+        self.assertEqual(sum(sizes), 5)
+
+    def test_errors_reach_every_caller(self):
+        """A failed forward pass fails every Future in the batch."""
+        from app.data_handling.batching import BatchDispatcher
+        dispatcher = BatchDispatcher(Mock(side_effect=RuntimeError('boom')),
+                                     max_batch_size=4, max_wait_ms=50)
+        for f in dispatcher.submit_many(['a', 'b']):
+            with self.assertRaises(RuntimeError):
+                f.result(timeout=5)
+
+    @patch('app.data_handling.analysis.emotion_classifier')
+    def test_gate_admits_batches_not_callers(self, mock_classifier):
+        """More concurrent callers than gate slots still share one forward pass."""
+        import threading
+        from app.data_handling import admission, analysis
+        from app.data_handling.batching import BatchDispatcher
+        mock_classifier.side_effect = lambda texts, **kw: [
+            [{'label': 'joy', 'score': 1.0}] for _ in texts]
+        gate = admission.InferenceGate(max_concurrent=2, max_waiting=0)
+        dispatcher = BatchDispatcher(lambda texts: analysis.classify_batch(texts),
+                                     max_batch_size=16, max_wait_ms=500)
+        start = threading.Barrier(6)
+        errors = []
+
+        def submit(i):
+            start.wait()
+            try:
+                analysis.analyze_many([f'text {i}'], timeout=5)
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(analysis, 'gate', gate), \
+                patch.object(analysis, 'dispatcher', dispatcher):
+            threads = [threading.Thread(target=submit, args=(i,)) for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+        dispatcher.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(len(c.args[0]) for c in mock_classifier.call_args_list), [6])
+        self.assertEqual(gate.stats()['admitted'], 1)
+
+    def test_close_finishes_queued_texts(self):
+        """Texts queued before close() are batched; later ones run inline."""
+        from app.data_handling.batching import BatchDispatcher
+        dispatcher = BatchDispatcher(lambda texts: [t.upper() for t in texts],
+                                     max_batch_size=4, max_wait_ms=50)
+        queued = dispatcher.submit_many(['a', 'b'])
+        dispatcher.close()
+        self.assertEqual([f.result(timeout=5) for f in queued], ['A', 'B'])
+        dispatcher._thread.join(timeout=5)
+        self.assertFalse(dispatcher._thread.is_alive())
+        self.assertEqual(dispatcher.submit('c').result(timeout=0), 'C')
+
+    def test_init_app_follows_the_latest_config(self):
+        """A second app's limits replace the first's instead of being ignored."""
+        from app.data_handling import analysis
+
+        class Limited(TestConfig):
+            ANALYSIS_MAX_CONCURRENT = 1
+            ANALYSIS_LENGTH_BUCKETING = True
+            ANALYSIS_BUCKET_MAX_SIZE = 4
+            ANALYSIS_BATCH_MAX_SIZE = 4
+
+        class Roomy(Limited):
+            ANALYSIS_MAX_CONCURRENT = 3
+            ANALYSIS_BUCKET_MAX_SIZE = 8
+            ANALYSIS_BATCH_MAX_SIZE = 8
+
+        create_app(Limited)
+        first_dispatcher = analysis.dispatcher
+        create_app(Roomy)
+        self.assertEqual(analysis.gate.stats()['max_concurrent'], 3)
+        self.assertEqual(analysis.bucketer.max_bucket_size, 8)
+        self.assertEqual(analysis.dispatcher.max_batch_size, 8)
+        self.assertTrue(first_dispatcher._closed)
+
+        create_app(TestConfig)
+        self.assertIsNone(analysis.gate)
+        self.assertIsNone(analysis.bucketer)
+        self.assertIsNone(analysis.dispatcher)
+
+    def test_length_buckets_restore_order(self):
+        """Similar lengths share a bucket and results come back in input order."""
+        from app.data_handling.batching import LengthBucketer
+        calls = []
+
+        def classify(texts):
+            calls.append(list(texts))
+            return [[{'label': 'joy', 'score': len(t)}] for t in texts]
+
+        bucketer = LengthBucketer(max_bucket_size=4, max_length_ratio=1.5, min_length_gap=2)
+        texts = ['x' * n for n in (100, 10, 102, 11)]
+        results = bucketer.run(texts, [len(t) for t in texts], classify)
+
+        self.assertEqual(calls, [['x' * 10, 'x' * 11], ['x' * 100, 'x' * 102]])
+        self.assertEqual([r[0]['score'] for r in results], [100, 10, 102, 11])
+        stats = bucketer.stats()
+        self.assertEqual(stats['batches'], 2)
+        self.assertLess(stats['padding_ratio_after'], stats['padding_ratio_before'])
+
+    def test_classify_batch_uses_bucketer(self):
+        """classify_batch runs one forward pass per length bucket."""
+        from app.data_handling import analysis
+        from app.data_handling.batching import LengthBucketer
+        fake = Mock(side_effect=lambda texts, **kw: [[{'label': 'joy', 'score': 1.0}] for _ in texts])
+        texts = ['short', 'also short', ' '.join(['long'] * 50)]
+        with patch.object(analysis, 'emotion_classifier', fake), \
+                patch.object(analysis, 'bucketer', LengthBucketer(max_bucket_size=8)):
+            results = analysis.classify_batch(texts)
+        self.assertEqual(len(results), 3)
+        self.assertEqual([c.args[0] for c in fake.call_args_list],
+                         [['short', 'also short'], [texts[2]]])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
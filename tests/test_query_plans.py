@@ -0,0 +1,113 @@
+"""Query-plan audit: every query a dashboard route sends must use an index.
+
+Each test drives routes through the test client, records the SELECTs sent
+to the database and runs ``EXPLAIN QUERY PLAN`` on them. A plan step that
+scans a whole table fails the test.
+"""
+import re
+import unittest
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import db
+from app.models import User, DiaryEntry
+from .base import BaseTestCase
+
+# "SCAN diary_entries" and "SCAN diary_entries USING INDEX ..." both visit
+# every row; searches, covering-index searches and the FTS5 virtual table are fine
+FULL_SCAN = re.compile(r"^SCAN (?!.*VIRTUAL TABLE)(\w+)")
+
+
+class QueryPlanTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User(username='owner', email='owner@example.com')
+        self.owner.set_password('password123')
+        self.friend = User(username='friend', email='friend@example.com')
+        self.friend.set_password('password123')
+        db.session.add_all([self.owner, self.friend])
+        db.session.commit()
+        self.diary = DiaryEntry(title='Walk', content='A calm walk by the river.',
+                                owner_id=self.owner.id, created_at=datetime(2025, 5, 1),
+                                dominant_emotion_label='joy', dominant_emotion_score=0.8,
+                                analyzed=True)
+        db.session.add(self.diary)
+        db.session.commit()
+        self.diary.share_with_user(self.friend)
+        db.session.commit()
+
+    def capture(self, *urls):
+        """GET each URL and return the SELECT statements it sent."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT') and not executemany:
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for url in urls:
+                response = self.client.get(url)
+                self.assertLess(response.status_code, 400, url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return statements
+
+    def assertNoFullScans(self, statements):
+        self.assertTrue(statements)
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                details = [row[-1] for row in plan]
+                scans = [d for d in details if FULL_SCAN.match(d)]
+                self.assertEqual(scans, [], f'{statement}\n{details}')
+
+    def test_owner_dashboard_queries(self):
+        """Home (every sort, emotion and text filters) and the mood charts."""
+        with self.client:
+            self.login('owner', 'password123')
+            self.assertNoFullScans(self.capture(
+                '/home',
+                '/home?emotion_tag=joy',
+                '/home?search=river',
+                '/home/page?sort_by=title_asc',
+                '/home/page?sort_by=mood_desc',
+                '/data/mood-timeline',
+                '/data/average-mood-index',
+                '/data/search?q=riv',
+            ))
+
+    def test_diary_and_sharing_queries(self):
+        """Viewing, editing and sharing one entry, including the user search."""
+        with self.client:
+            self.login('owner', 'password123')
+            self.assertNoFullScans(self.capture(
+                f'/data/view_diary/{self.diary.id}',
+                f'/data/edit_diary/{self.diary.id}',
+                f'/data/get_shared_users/{self.diary.id}',
+                f'/data/analysis_status/{self.diary.id}',
+                f'/data/share_candidates/{self.diary.id}?q=fr',
+                '/auth/users/search?q=fr&cursor=fa',
+            ))
+
+    def test_shared_dashboard_queries(self):
+        """Entries shared with the current user, reached via the shares table."""
+        with self.client:
+            self.login('friend', 'password123')
+            self.assertNoFullScans(self.capture(
+                '/shared',
+                '/shared/page',
+                f'/data/view_diary/{self.diary.id}',
+            ))
+
+    def test_for_user(self):
+        """Own and shared entries come from two index lookups."""
+        query = DiaryEntry.for_user(self.friend.id)
+        self.assertEqual(query.all(), [self.diary])
+        compiled = query.statement.compile(db.engine)
+        self.assertNoFullScans([(str(compiled), tuple(compiled.params[k] for k in compiled.positiontup))])
+
+
+if __name__ == '__main__':
+    unittest.main()